@@ -1,192 +1,489 @@
-import warnings
-
-import numpy as np
-import pandas as pd
-
-import psycopg2
-
-from sqlalchemy.engine.base import Engine
-from sqlalchemy import create_engine, types
-
-warnings.filterwarnings("ignore")
-
-
-class DataBase:
-    """
-    Class for interacting with a PostgreSQL database.
-
-    Parameters:
-    - host (str): Database host address.
-    - port (str): Database port.
-    - user (str): Database username.
-    - database (str): Name of the database.
-    - password (str): Database password.
-    """
-    def __init__(
-            self,
-            host: str,
-            port: str,
-            user: str,
-            database: str,
-            password: str) -> None:
-        """
-        Initialize the DataBase object.
-
-        Parameters:
-        - host (str): Database host address.
-        - port (str): Database port.
-        - user (str): Database username.
-        - database (str): Name of the database.
-        - password (str): Database password.
-        """
-        self.host = host
-        self.port = port
-        self.user = user
-        self.database = database
-        self.password = password
-
-    def __connection(self) -> psycopg2.connect:
-        """
-        Establish a connection to the PostgreSQL database.
-
-        Returns:
-        - psycopg2.connect: Database connection object.
-        """
-        return psycopg2.connect(
-            database=self.database,
-            user=self.user,
-            password=self.password,
-            host=self.host,
-            port=self.port
-        )
-    def insert_tch_colheita_real(self, df):
-        
-        df['tc_est_colheita'] = np.where(df['tc_real'] > 0, df['tc_est'], 0)
-        print(df)
-        return df
-        
-    def create_table_and_insert(
-            self,
-            dataframe: pd.DataFrame,
-            table_name: str,
-            schema: str = 'public') -> None:
-        """
-        Create a table in the database and insert data from a DataFrame.
-        If the table already exists, it will be replaced by the new one
-        referring to the dataframe
-
-        Parameters:
-        - dataframe (pd.DataFrame): DataFrame containing data to be inserted.
-        - table_name (str): Name of the table to be created.
-        - schema (str, optional): Database schema. Defaults to 'public'.
-        """
-        dataframe = self.insert_tch_colheita_real(dataframe)
-        print(f'\nCriando tabela "{table_name}" '
-              f'e inserindo os dados do dataframe...')
-        dataframe.to_sql(
-            table_name,
-            self.__engine(),
-            schema=schema,
-            index=False,
-            if_exists='replace',
-            dtype=self.__get_type(dataframe)
-        )
-
-        print('Insert realizado com sucesso!')
-        self.__engine().dispose()
-
-    @staticmethod
-    def __get_type(dataframe: pd.DataFrame) -> pd.DataFrame.dtypes:
-        """
-        Get the data types for each column in the DataFrame.
-
-        Parameters:
-        - dataframe (pd.DataFrame): DataFrame to get data types from.
-
-        Returns:
-        - pd.DataFrame.dtypes: Data types for each column.
-        """
-        return {
-            col: types.VARCHAR(dataframe[col].str.len().max())
-            for col in dataframe.columns
-            if dataframe[col].dtype == 'O'
-        }
-
-    def __engine(self) -> Engine:
-        """
-        Create a SQLAlchemy engine for database operations.
-
-        Returns:
-        - sqlalchemy.engine.base.Engine: SQLAlchemy engine.
-        """
-        return create_engine(
-            f'postgresql://'
-            f'{self.user}:'
-            f'{self.password}@'
-            f'{self.host}:'
-            f'{self.port}/'
-            f'{self.database}')
-
-    def drop_table(self, table_name: str) -> None:
-        """
-        Drop a table from the database.
-
-        Parameters:
-        - table_name (str): Name of the table to be dropped.
-        """
-        print(f'\nDeleting table "{table_name}"...')
-
-        connection = self.__connection()
-
-        cursor = connection.cursor()
-
-        sql = f'''DROP TABLE "{table_name}"'''
-
-        # Executing the query
-        cursor.execute(sql)
-
-        # Commit your changes in the database
-        connection.commit()
-
-        # Closing the connection
-        self.close_connection(connection)
-
-        print(f'---Table "{table_name}" deleted!---\n')
-
-    @staticmethod
-    def close_connection(connection: psycopg2.connect) -> None:
-        """
-        Close the database connection.
-
-        Parameters:
-        - connection (psycopg2.connect): Database connection object.
-        """
-        if connection is not None:
-            connection.close()
-
-    def get_data_from_table(
-            self,
-            table: str,
-            schema: str = 'public',
-            query: str = '') -> pd.DataFrame:
-        """
-        Retrieve data from a table in the database.
-
-        Parameters:
-        - table (str): Name of the table to retrieve data from.
-        - schema (str, optional): Database schema. Defaults to 'public'.
-
-        Returns:
-        - pd.DataFrame: DataFrame containing the retrieved data.
-        """
-        if not query:
-            query = f"SELECT * FROM {schema}.{table}"
-
-        connection = self.__connection()
-        try:
-            data = pd.read_sql_query(query, con=connection)
-            self.close_connection(connection)
-            return data
-        except (Exception, psycopg2.DatabaseError) as error:
-            print(error)
-            self.close_connection(connection)
+import io
+import tempfile
+import time
+import uuid
+import warnings
+from collections.abc import Iterator
+from typing import TYPE_CHECKING
+
+import pandas as pd
+
+import psycopg2
+
+from bd_agro_schema import pandas_dtype
+from db_connection import get_engine, get_pool
+from harvest_metrics import compute_metrics
+from instrumentation import frame_bytes, record, stage
+
+# SQLAlchemy is imported only by the methods that build an engine or
+# column types, so reading and COPY loads do not pay for it
+if TYPE_CHECKING:
+    from sqlalchemy.engine.base import Engine
+
+# OIDs of the text, varchar and bpchar types, read as str by COPY
+TEXT_TYPE_OIDS = {25, 1043, 1042}
+
+
+class DataBase:
+    """
+    Class for interacting with a PostgreSQL database.
+
+    Parameters:
+    - host (str): Database host address.
+    - port (str): Database port.
+    - user (str): Database username.
+    - database (str): Name of the database.
+    - password (str): Database password.
+    - min_size (int, optional): Minimum size of the connection pool.
+    - max_size (int, optional): Maximum size of the connection pool.
+    """
+    def __init__(
+            self,
+            host: str,
+            port: str,
+            user: str,
+            database: str,
+            password: str,
+            min_size: int = 1,
+            max_size: int = 5) -> None:
+        """
+        Initialize the DataBase object.
+
+        Parameters:
+        - host (str): Database host address.
+        - port (str): Database port.
+        - user (str): Database username.
+        - database (str): Name of the database.
+        - password (str): Database password.
+        - min_size (int, optional): Minimum size of the connection pool.
+          Defaults to 1.
+        - max_size (int, optional): Maximum size of the connection pool.
+          Defaults to 5.
+        """
+        self.host = host
+        self.port = port
+        self.user = user
+        self.database = database
+        self.password = password
+        self.min_size = min_size
+        self.max_size = max_size
+
+    def __config(self) -> dict:
+        """
+        Connection settings in the format shared with DatabaseManager, so
+        both use the same pool.
+        """
+        return {
+            'dbname': self.database,
+            'user': self.user,
+            'password': self.password,
+            'host': self.host,
+            'port': self.port,
+        }
+
+    def __connection(self) -> psycopg2.connect:
+        """
+        Get a connection to the PostgreSQL database from the shared pool.
+        It must be given back with close_connection.
+
+        Returns:
+        - psycopg2.connect: Database connection object.
+        """
+        return get_pool(
+            self.__config(), self.min_size, self.max_size).getconn()
+    def insert_tch_colheita_real(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Add the derived harvest metrics (harvest_metrics.METRICS) whose
+        columns are present, tc_est_colheita included.
+
+        Parameters:
+        - df (pd.DataFrame): Data with lowercase columns.
+
+        Returns:
+        - pd.DataFrame: Data with the metric columns.
+        """
+        return compute_metrics(df)
+
+    def create_table_and_insert(
+            self,
+            dataframe: pd.DataFrame,
+            table_name: str,
+            schema: str = 'public',
+            index_columns: list[str | tuple[str, ...]] | None = None,
+            chunk_rows: int = 50000,
+            derive_metrics: bool = True) -> None:
+        """
+        Create a table in the database and insert data from a DataFrame.
+        If the table already exists, it will be replaced by the new one
+        referring to the dataframe
+
+        The data is loaded with COPY into a staging table created in the
+        same transaction, the indexes are built there, and the staging
+        table is then swapped in place of the old one in a single
+        transaction, so readers always see either the old or the new
+        table, never a missing or partial one. With wal_level=minimal,
+        COPY into a table created in its own transaction skips WAL. An
+        unlogged table is not used: making it logged before the swap
+        rewrites and WAL-logs the whole table.
+
+        Parameters:
+        - dataframe (pd.DataFrame): DataFrame containing data to be inserted.
+        - table_name (str): Name of the table to be created.
+        - schema (str, optional): Database schema. Defaults to 'public'.
+        - index_columns (list, optional): Columns (or tuples of columns) to
+          index. Defaults to no indexes.
+        - chunk_rows (int, optional): Rows sent per COPY chunk. Defaults to
+          50000.
+        - derive_metrics (bool, optional): Add the derived harvest metrics
+          before loading. Defaults to True.
+        """
+        if derive_metrics:
+            dataframe = self.insert_tch_colheita_real(dataframe)
+        print(f'\nCriando tabela "{table_name}" '
+              f'e inserindo os dados do dataframe...')
+
+        staging = f'{table_name}__staging'
+        old = f'{table_name}__old'
+        indexes = []
+        for position, columns in enumerate(index_columns or []):
+            columns = (columns,) if isinstance(columns, str) else tuple(columns)
+            indexes.append((f'{table_name}_{position}_idx',
+                            ', '.join(f'"{column}"' for column in columns)))
+
+        # Same column types as to_sql, including the VARCHAR lengths
+        create_staging = pd.io.sql.get_schema(
+            dataframe, staging, con=self.__engine(), schema=schema,
+            dtype=self.__get_type(dataframe))
+
+        connection = self.__connection()
+        try:
+            with stage('db_load', table=table_name, rows=len(dataframe),
+                       bytes=frame_bytes(dataframe)), connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE IF EXISTS "{schema}"."{staging}"')
+                cursor.execute(create_staging)
+                self.__copy_dataframe(cursor, dataframe, schema, staging, chunk_rows)
+
+                for index_name, columns in indexes:
+                    cursor.execute(
+                        f'CREATE INDEX "{index_name}__new" '
+                        f'ON "{schema}"."{staging}" ({columns})')
+                cursor.execute(f'ANALYZE "{schema}"."{staging}"')
+            connection.commit()
+
+            # The swap holds the table lock only for the renames
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE IF EXISTS "{schema}"."{old}"')
+                cursor.execute(
+                    f'ALTER TABLE IF EXISTS "{schema}"."{table_name}" RENAME TO "{old}"')
+                cursor.execute(
+                    f'ALTER TABLE "{schema}"."{staging}" RENAME TO "{table_name}"')
+                cursor.execute(f'DROP TABLE IF EXISTS "{schema}"."{old}"')
+                for index_name, _ in indexes:
+                    cursor.execute(
+                        f'ALTER INDEX "{schema}"."{index_name}__new" RENAME TO "{index_name}"')
+            connection.commit()
+        except (Exception, psycopg2.DatabaseError):
+            connection.rollback()
+            raise
+        finally:
+            self.close_connection(connection)
+
+        print('Insert realizado com sucesso!')
+
+    @staticmethod
+    def __copy_dataframe(
+            cursor,
+            dataframe: pd.DataFrame,
+            schema: str,
+            table_name: str,
+            chunk_rows: int) -> None:
+        """
+        Bulk-load a DataFrame into a table with COPY ... FROM STDIN, one
+        chunk at a time, reusing the same text buffer.
+        """
+        columns = ', '.join(f'"{column}"' for column in dataframe.columns)
+        query = (f'COPY "{schema}"."{table_name}" ({columns}) FROM STDIN '
+                 f"WITH (FORMAT csv, NULL '\\N')")
+
+        buffer = io.StringIO()
+        for start in range(0, len(dataframe), chunk_rows):
+            buffer.seek(0)
+            buffer.truncate()
+            dataframe.iloc[start:start + chunk_rows].to_csv(
+                buffer, header=False, index=False, na_rep='\\N',
+                date_format='%Y-%m-%d %H:%M:%S')
+            buffer.seek(0)
+            cursor.copy_expert(query, buffer)
+
+    @staticmethod
+    def __get_type(dataframe: pd.DataFrame) -> pd.DataFrame.dtypes:
+        """
+        Get the data types for each column in the DataFrame.
+
+        Parameters:
+        - dataframe (pd.DataFrame): DataFrame to get data types from.
+
+        Returns:
+        - pd.DataFrame.dtypes: Data types for each column.
+        """
+        from sqlalchemy import types
+
+        return {
+            col: types.VARCHAR(dataframe[col].str.len().max())
+            for col in dataframe.columns
+            if dataframe[col].dtype == 'O'
+        }
+
+    def __engine(self) -> 'Engine':
+        """
+        Get the shared SQLAlchemy engine for database operations. It is
+        created once per connection settings and reused between calls.
+
+        Returns:
+        - sqlalchemy.engine.base.Engine: SQLAlchemy engine.
+        """
+        return get_engine(self.__config(), self.max_size)
+
+    def drop_table(self, table_name: str) -> None:
+        """
+        Drop a table from the database.
+
+        Parameters:
+        - table_name (str): Name of the table to be dropped.
+        """
+        print(f'\nDeleting table "{table_name}"...')
+
+        connection = self.__connection()
+
+        cursor = connection.cursor()
+
+        sql = f'''DROP TABLE "{table_name}"'''
+
+        # Executing the query
+        cursor.execute(sql)
+
+        # Commit your changes in the database
+        connection.commit()
+
+        # Closing the connection
+        self.close_connection(connection)
+
+        print(f'---Table "{table_name}" deleted!---\n')
+
+    def close_connection(self, connection: psycopg2.connect) -> None:
+        """
+        Give the database connection back to the shared pool.
+
+        Parameters:
+        - connection (psycopg2.connect): Database connection object.
+        """
+        if connection is not None:
+            get_pool(
+                self.__config(), self.min_size, self.max_size).putconn(connection)
+
+    def get_data_from_table(
+            self,
+            table: str,
+            schema: str = 'public',
+            query: str = '',
+            columns: list[str] | None = None,
+            client_ids: list[int] | None = None,
+            safras: list[int] | None = None) -> pd.DataFrame:
+        """
+        Retrieve data from a table in the database.
+
+        Parameters:
+        - table (str): Name of the table to retrieve data from.
+        - schema (str, optional): Database schema. Defaults to 'public'.
+        - query (str, optional): Query to run instead of reading the table.
+        - columns (list[str], optional): Columns to read. Defaults to all.
+        - client_ids (list[int], optional): Only rows of these clients.
+        - safras (list[int], optional): Only rows of these harvests.
+
+        Returns:
+        - pd.DataFrame: DataFrame containing the retrieved data.
+        """
+        params = None
+        if not query:
+            query, params = self.__select_query(
+                table, schema, columns, client_ids, safras)
+
+        connection = self.__connection()
+        try:
+            with stage('db_read', table=table) as metrics:
+                # pandas warns about DBAPI connections other than sqlite3;
+                # the psycopg2 connection works, so only that warning is muted
+                with warnings.catch_warnings():
+                    warnings.filterwarnings(
+                        'ignore', message='pandas only supports SQLAlchemy',
+                        category=UserWarning)
+                    data = pd.read_sql_query(query, con=connection, params=params)
+                metrics['rows'] = len(data)
+                metrics['bytes'] = frame_bytes(data)
+            self.close_connection(connection)
+            return data
+        except (Exception, psycopg2.DatabaseError) as error:
+            print(error)
+            self.close_connection(connection)
+
+    def iter_data_from_table(
+            self,
+            table: str,
+            schema: str = 'public',
+            columns: list[str] | None = None,
+            client_ids: list[int] | None = None,
+            safras: list[int] | None = None,
+            chunk_rows: int = 50000,
+            method: str = 'cursor') -> Iterator[pd.DataFrame]:
+        """
+        Read a table in typed chunks, so that the whole table is never held
+        in memory. The filters are applied by the database.
+
+        With method='cursor' the rows are fetched from a named (server-side)
+        cursor, chunk_rows at a time. With method='copy' the selection is
+        exported with COPY ... TO STDOUT into a temporary file, which is
+        then parsed chunk by chunk; it is faster for full-table reads.
+
+        Usage:
+            for chunk in db.iter_data_from_table(
+                    'bd_tomografia', columns=['client_id', 'safra', 'tch_real'],
+                    safras=[2023, 2024]):
+                ...
+
+        Parameters:
+        - table (str): Name of the table to read.
+        - schema (str, optional): Database schema. Defaults to 'public'.
+        - columns (list[str], optional): Columns to read. Defaults to all.
+        - client_ids (list[int], optional): Only rows of these clients.
+        - safras (list[int], optional): Only rows of these harvests.
+        - chunk_rows (int, optional): Rows per chunk. Defaults to 50000.
+        - method (str, optional): 'cursor' or 'copy'. Defaults to 'cursor'.
+
+        Yields:
+        - pd.DataFrame: Chunk of at most chunk_rows rows, with the compact
+          dtypes of the BD_AGRO schema.
+        """
+        if method not in ('cursor', 'copy'):
+            raise ValueError(f'Unknown read method: {method}')
+
+        query, params = self.__select_query(
+            table, schema, columns, client_ids, safras)
+
+        connection = self.__connection()
+        try:
+            if method == 'copy':
+                chunks = self.__copy_chunks(connection, query, params, chunk_rows)
+            else:
+                chunks = self.__cursor_chunks(connection, query, params, chunk_rows)
+
+            # Only the fetch and typing of each chunk is timed, not the
+            # consumer's work between chunks
+            seconds, rows = 0.0, 0
+            while True:
+                start = time.perf_counter()
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                chunk = self.__apply_schema_types(chunk)
+                seconds += time.perf_counter() - start
+                rows += len(chunk)
+                yield chunk
+            record('db_read', seconds, table=table, method=method, rows=rows)
+        finally:
+            # Reads only: end the transaction opened by the cursor
+            connection.rollback()
+            self.close_connection(connection)
+
+    @staticmethod
+    def __select_query(
+            table: str,
+            schema: str,
+            columns: list[str] | None,
+            client_ids: list[int] | None,
+            safras: list[int] | None) -> tuple[str, list]:
+        """
+        Build the SELECT of a table with column projection and the
+        client_id / safra filters.
+        """
+        query = f"SELECT {', '.join(columns) if columns else '*'} FROM {schema}.{table}"
+
+        conditions, params = [], []
+        if client_ids is not None:
+            conditions.append('client_id = ANY(%s)')
+            params.append([int(client_id) for client_id in client_ids])
+        if safras is not None:
+            conditions.append('safra = ANY(%s)')
+            params.append([int(safra) for safra in safras])
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+
+        return query, params
+
+    @staticmethod
+    def __cursor_chunks(
+            connection: psycopg2.connect,
+            query: str,
+            params: list,
+            chunk_rows: int) -> Iterator[pd.DataFrame]:
+        """
+        Fetch the rows of a query from a named cursor, chunk_rows at a time.
+        """
+        with connection.cursor(name=f'read_{uuid.uuid4().hex}') as cursor:
+            cursor.itersize = chunk_rows
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                yield pd.DataFrame.from_records(
+                    rows, columns=[column.name for column in cursor.description])
+
+    @staticmethod
+    def __copy_chunks(
+            connection: psycopg2.connect,
+            query: str,
+            params: list,
+            chunk_rows: int) -> Iterator[pd.DataFrame]:
+        """
+        Export the rows of a query with COPY TO STDOUT into a temporary file
+        and parse it chunk_rows at a time.
+        """
+        with connection.cursor() as cursor, tempfile.TemporaryFile() as buffer:
+            select = cursor.mogrify(query, params).decode()
+
+            # Text columns are parsed as text, so codes keep leading zeros
+            cursor.execute(f'SELECT * FROM ({select}) AS selection LIMIT 0')
+            text_columns = {
+                column.name: str for column in cursor.description
+                if column.type_code in TEXT_TYPE_OIDS}
+
+            cursor.copy_expert(
+                f"COPY ({select}) TO STDOUT WITH (FORMAT csv, HEADER, NULL '\\N')",
+                buffer)
+            buffer.seek(0)
+            yield from pd.read_csv(
+                buffer, chunksize=chunk_rows, dtype=text_columns, na_values=['\\N'],
+                keep_default_na=False, low_memory=False)
+
+    @staticmethod
+    def __apply_schema_types(chunk: pd.DataFrame) -> pd.DataFrame:
+        """
+        Cast the columns of the BD_AGRO schema to their compact dtypes.
+        Columns outside the schema are kept as read.
+        """
+        dtypes = {}
+        for column in chunk.columns:
+            try:
+                dtypes[column] = pandas_dtype(column)
+            except KeyError:
+                continue
+
+        for column, dtype in dtypes.items():
+            if dtype == 'datetime64[ns]':
+                chunk[column] = pd.to_datetime(chunk[column], errors='coerce')
+            elif dtype.startswith('float'):
+                chunk[column] = pd.to_numeric(
+                    chunk[column], errors='coerce').astype(dtype)
+            else:
+                chunk[column] = chunk[column].astype(dtype)
+        return chunk
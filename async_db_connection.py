@@ -0,0 +1,212 @@
+import asyncio
+import io
+import sys
+from contextlib import asynccontextmanager
+
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool
+
+
+def run_async(coroutine):
+    """
+    Executa uma corrotina com asyncio.run. No Windows usa o loop seletor:
+    o psycopg 3 assíncrono não funciona com o ProactorEventLoop padrão.
+    """
+    if sys.platform == "win32":
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    return asyncio.run(coroutine)
+
+
+class AsyncDatabaseManager:
+    """
+    Versão assíncrona (psycopg 3) das operações do DatabaseManager, para
+    sobrepor a consulta de grupos com a leitura dos BD_AGRO e gravar vários
+    clientes ao mesmo tempo em conexões do pool.
+
+    Uso:
+        async with AsyncDatabaseManager(db_config) as db:
+            await db.delete_rows_by_client_ids("public", "bd_tomografia", [111])
+    """
+
+    def __init__(self, config, min_size=1, max_size=5):
+        """
+        Inicializa a classe AsyncDatabaseManager.
+
+        Parameters:
+        - config (dict): Configuração do banco de dados (dbname, user, password, host, port).
+        - min_size (int): Conexões mínimas do pool. Padrão 1.
+        - max_size (int): Conexões máximas do pool. Padrão 5.
+        """
+        self.config = config
+        self.max_size = max_size
+        # make_conninfo escapa valores com espaços ou aspas (ex.: senhas)
+        conninfo = make_conninfo(**{key: str(value) for key, value in config.items()})
+        self.pool = AsyncConnectionPool(
+            conninfo, min_size=min_size, max_size=max_size, open=False)
+
+    async def __aenter__(self):
+        await self.pool.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.pool.close()
+
+    @asynccontextmanager
+    async def transaction(self):
+        """
+        Fornece uma conexão do pool com uma transação aberta, com commit ao
+        final ou rollback em caso de erro.
+        """
+        async with self.pool.connection() as conn:
+            async with conn.transaction():
+                yield conn
+
+    async def get_group_map(self, client_ids):
+        """
+        Busca o nome do grupo de cada cliente.
+
+        Parameters:
+        - client_ids (list): IDs dos clientes.
+
+        Returns:
+        - dict: Mapeamento de client_id para o nome do grupo.
+        """
+        query_client_group = """
+        SELECT c.id AS client_id, g.nome AS grupo_nome
+        FROM clientes c
+        INNER JOIN cliente_grupo g ON c.grupo_id = g.id
+        WHERE c.id = ANY(%s)
+        """
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute(query_client_group, (list(client_ids),))
+            return {row[0]: row[1] for row in await cursor.fetchall()}
+
+    async def delete_rows_by_client_ids(self, schema, table, client_ids, conn=None):
+        """
+        Exclui linhas na tabela que correspondem aos IDs fornecidos.
+
+        Parameters:
+        - schema (str): Schema do banco de dados.
+        - table (str): Nome da tabela.
+        - client_ids (list): Lista de IDs de clientes a serem excluídos.
+        - conn (AsyncConnection, optional): Conexão de uma transação aberta.
+        """
+        query = f"DELETE FROM {schema}.{table} WHERE client_id = ANY(%s)"
+        async with self.__connection(conn) as conn:
+            cursor = await conn.execute(query, (list(client_ids),))
+            print(f"{cursor.rowcount} linhas excluídas da tabela {table}.")
+
+    async def insert_data(self, schema, table, data_frame, data_types, conn=None,
+                          chunk_rows=50000):
+        """
+        Insere dados no banco a partir de um DataFrame com COPY ... FROM STDIN.
+
+        Parameters:
+        - schema (str): Schema do banco de dados.
+        - table (str): Nome da tabela.
+        - data_frame (pd.DataFrame): Dados a serem inseridos.
+        - data_types (dict): Dicionário de tipos de dados das colunas.
+        - conn (AsyncConnection, optional): Conexão de uma transação aberta.
+        - chunk_rows (int): Linhas enviadas por bloco. Padrão 50000.
+        """
+        columns = list(data_types.keys())
+        missing = [column for column in columns if column not in data_frame.columns]
+        if missing:
+            data_frame = data_frame.assign(**{column: None for column in missing})
+        data_frame = data_frame[columns]
+
+        query = (f"COPY {schema}.{table} ({', '.join(columns)}) FROM STDIN "
+                 f"WITH (FORMAT csv, NULL '\\N')")
+
+        async with self.__connection(conn) as conn:
+            cursor = conn.cursor()
+            async with cursor.copy(query) as copy:
+                buffer = io.StringIO()
+                for start in range(0, len(data_frame), chunk_rows):
+                    buffer.seek(0)
+                    buffer.truncate()
+                    data_frame.iloc[start:start + chunk_rows].to_csv(
+                        buffer, header=False, index=False, na_rep="\\N",
+                        date_format="%Y-%m-%d %H:%M:%S")
+                    await copy.write(buffer.getvalue())
+
+        print(f"{len(data_frame)} linhas inseridas na tabela {table}.")
+
+    async def replace_clients(self, schema, table, data_frame, data_types):
+        """
+        Substitui os dados de cada cliente do DataFrame (exclusão e inserção
+        na mesma transação), com os clientes gravados em paralelo, até o
+        tamanho máximo do pool.
+
+        Parameters:
+        - schema (str): Schema do banco de dados.
+        - table (str): Nome da tabela.
+        - data_frame (pd.DataFrame): Dados dos clientes.
+        - data_types (dict): Dicionário de tipos de dados das colunas.
+        """
+        async def replace_client(client_id, client_data):
+            async with self.transaction() as conn:
+                await self.delete_rows_by_client_ids(schema, table, [client_id], conn)
+                await self.insert_data(schema, table, client_data, data_types, conn)
+
+        await asyncio.gather(*(
+            replace_client(int(client_id), client_data)
+            for client_id, client_data in data_frame.groupby("client_id", sort=False)))
+
+    @asynccontextmanager
+    async def __connection(self, conn):
+        """
+        Usa a conexão informada ou uma nova conexão do pool, com commit ao
+        final.
+        """
+        if conn is not None:
+            yield conn
+            return
+
+        async with self.pool.connection() as conn:
+            yield conn
+
+
+async def load_clients_async(merger, db_config, data_types, schema="public",
+                             table="bd_tomografia", max_size=5, quarantine=None):
+    """
+    Carrega os clientes do merger no banco sobrepondo as etapas: a consulta
+    de grupos roda enquanto os BD_AGRO são lidos, tipados e validados (em
+    uma thread, já que a leitura bloqueia), e depois cada cliente é
+    substituído (exclusão e inserção) em paralelo. Só há substituição
+    completa; a sincronização incremental fica com DatabaseManager.
+
+    Parameters:
+    - merger (CreateBdAgroMerge): Origem dos dados dos clientes.
+    - db_config (dict): Configuração do banco de dados.
+    - data_types (dict): Tipos das colunas, com nomes em minúsculas.
+    - schema (str): Schema do banco de dados.
+    - table (str): Nome da tabela.
+    - max_size (int): Conexões máximas do pool.
+    - quarantine (QuarantineFile | QuarantineTable, optional): Destino das
+      linhas rejeitadas na validação.
+
+    Returns:
+    - pd.DataFrame: Dados gravados.
+    """
+    from bdAgroTomografia import ImproveBdAgro
+
+    def read_and_type():
+        merged_data = merger.merge_clients_bd_agro_data()
+        if merged_data.empty:
+            return merged_data
+        return ImproveBdAgro(merged_data, quarantine=quarantine).bd_data()
+
+    async with AsyncDatabaseManager(db_config, max_size=max_size) as db:
+        merged_data, group_map = await asyncio.gather(
+            asyncio.to_thread(read_and_type),
+            db.get_group_map(merger.selected_client_ids))
+
+        if merged_data.empty:
+            print("Nenhum cliente para atualizar.")
+            return merged_data
+
+        merged_data["grupo"] = merged_data["client_id"].map(group_map).fillna("Sem Grupo")
+        await db.replace_clients(schema, table, merged_data, data_types)
+
+    return merged_data
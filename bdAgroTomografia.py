@@ -1,157 +1,328 @@
-import os
-import pandas as pd
-from dotenv import load_dotenv
-from createBdAgroMerge import CreateBdAgroMerge
-
-load_dotenv(os.path.join(os.getcwd(), '.env'))
-
-
-class BdAgroTomografia:
-    """
-    Class for managing BD_AGRO data related to tomography without database
-    connection. It generates a JSON file with merged data.
-
-    Parameters:
-    - clients_folder (str): Path to the folder containing clients' data.
-    - output_file (str, optional): Path to the output JSON file. Defaults to
-      'merge_bd_agro.json'.
-    - export_json_file (bool, optional): Flag indicating whether to export the
-      merged data to a JSON file. Defaults to True.
-    """
-    def __init__(
-            self,
-            clients_folder: str,
-            output_file: str = 'merge_bd_agro.json',
-            export_json_file: bool = True) -> None:
-        """
-        Initialize the BdAgroTomografia object.
-
-        Parameters:
-        - clients_folder (str): Path to the folder containing clients' data.
-        - output_file (str, optional): Path to the output JSON file. Defaults
-          to 'merge_bd_agro.json'.
-        - export_json_file (bool, optional): Flag indicating whether to export
-          the merged data to a JSON file. Defaults to True.
-        """
-        self.output_file = output_file
-        self.clients_folder = clients_folder
-        self.export_json_file = export_json_file
-
-        # Dummy data simulating client data; replace with actual loading logic if needed.
-        self.clients_data = pd.DataFrame({
-            "id": [1, 2],
-            "nome": ["Client A", "Client B"],
-            "grupo": ["Group 1", "Group 2"]
-        })
-
-        self.__create_json()
-
-    def __create_json(self) -> None:
-        """
-        Generate JSON with merged BD_AGRO data.
-        """
-        bd_agro_data = self.__get_bd_agro_merged_clients_data()
-
-        if self.export_json_file:
-            bd_agro_data.to_json(self.output_file, orient="records", indent=4)
-
-    def __get_bd_agro_merged_clients_data(self) -> pd.DataFrame:
-        """
-        Get merged BD_AGRO data for tomografia.
-
-        Returns:
-        - pd.DataFrame: Merged BD_AGRO data for tomografia.
-        """
-        data = CreateBdAgroMerge(
-            clients_folder=self.clients_folder,
-            output_file=self.output_file,
-            clients_data=self.clients_data,
-            export_json_file=self.export_json_file).merge_clients_bd_agro_data()
-
-        return ImproveBdAgro(bd_agro_data=data).bd_data()
-
-
-class ImproveBdAgro:
-    """
-    Class for improving the structure and data types of BD_AGRO data.
-
-    Parameters:
-    - bd_agro_data (pd.DataFrame): Original BD_AGRO data.
-    """
-    def __init__(self, bd_agro_data: pd.DataFrame) -> None:
-        """
-        Initialize the ImproveBdAgro object.
-
-        Parameters:
-        - bd_agro_data (pd.DataFrame): Original BD_AGRO data.
-        """
-        self.bd_agro_data = bd_agro_data
-
-        self.data_types = {
-            'client_id': 'integer', 'client_name': 'string', 'CHAVE': 'string',
-            'SAFRA': 'integer', 'OBJETIVO': 'string', 'cliente': 'string',
-            'TP_PROP': 'string', 'FAZENDA': 'string', 'SETOR': 'string',
-            'SECAO': 'string', 'BLOCO': 'string', 'PIVO': 'string',
-            'DESC_FAZ': 'string', 'TALHAO': 'string', 'VARIEDADE': 'string',
-            'MATURACAO': 'string', 'AMBIENTE': 'string', 'ESTAGIO': 'string',
-            'GRUPO_DASH': 'string', 'GRUPO_NDVI': 'string',
-            'NMRO_CORTE': 'float', 'TAH': 'float', 'TPH': 'float',
-            'DESC_CANA': 'string', 'AREA_BD': 'float', 'A_EST_MOAGEM': 'float',
-            'A_COLHIDA': 'float', 'A_EST_MUDA': 'float', 'A_MUDA': 'float',
-            'TCH_EST': 'float', 'TC_EST': 'float', 'TCH_REST': 'float',
-            'TC_REST': 'float', 'TCH_REAL': 'float', 'TC_REAL': 'float',
-            'DT_CORTE': 'date', 'DT_ULT_CORTE': 'date', 'DT_PLANTIO': 'date',
-            'IDADE_CORTE': 'float', 'ATR': 'float', 'ATR_EST': 'float',
-            'IRRIGACAO': 'string', 'grupo': 'string',
-        }
-
-    def bd_data(self) -> pd.DataFrame:
-        """
-        Improve the structure and data types of BD_AGRO data.
-
-        Returns:
-        - pd.DataFrame: Improved BD_AGRO data.
-        """
-        columns_interest = [
-            'client_id', 'client_name', 'CHAVE', 'SAFRA',
-            'OBJETIVO', 'TP_PROP', 'FAZENDA', 'SETOR', 'SECAO', 'BLOCO',
-            'PIVO', 'DESC_FAZ', 'TALHAO', 'VARIEDADE', 'MATURACAO',
-            'AMBIENTE', 'ESTAGIO', 'GRUPO_DASH', 'GRUPO_NDVI', 'NMRO_CORTE',
-            'DESC_CANA', 'AREA_BD', 'A_EST_MOAGEM', 'A_COLHIDA', 'A_EST_MUDA',
-            'A_MUDA', 'TCH_EST', 'TC_EST', 'TCH_REST', 'TC_REST', 'TCH_REAL',
-            'TC_REAL', 'DT_CORTE', 'DT_ULT_CORTE', 'DT_PLANTIO', 'IDADE_CORTE',
-            'ATR', 'ATR_EST', 'IRRIGACAO', 'TAH', 'TPH', 'grupo', 'cliente']
-
-        self.bd_agro_data = self.bd_agro_data[columns_interest]
-
-        # Convert all columns to lowercase
-        self.bd_agro_data.columns = self.bd_agro_data.columns.str.lower()
-
-        self.__apply_data_types()
-
-        return self.bd_agro_data
-
-    def __apply_data_types(self) -> None:
-        """
-        Apply specified data types to the columns in BD_AGRO data.
-        """
-        dict_formats_lower = {
-            key.lower(): value for key, value in self.data_types.items()}
-
-        for column, data_type in dict_formats_lower.items():
-            if data_type == 'string':
-                self.bd_agro_data[column] = self.bd_agro_data[
-                    column].astype('string')
-
-            elif data_type == 'integer':
-                self.bd_agro_data[column] = pd.to_numeric(
-                    self.bd_agro_data[column], errors='coerce').astype('Int64')
-
-            elif data_type == 'float':
-                self.bd_agro_data[column] = pd.to_numeric(
-                    self.bd_agro_data[column],
-                    errors='coerce').astype('float64')
-
-            elif data_type == 'date':
-                self.bd_agro_data[column] = pd.to_datetime(
-                    self.bd_agro_data[column], errors='coerce')
+from numbers import Number
+
+import numpy as np
+import pandas as pd
+
+from bd_agro_schema import (
+    COLUMNS_INTEREST, DATA_TYPES, KEY_COLUMNS, VALIDATION_RANGES, memory_per_row,
+    pandas_dtype)
+from createBdAgroMerge import CreateBdAgroMerge
+from exporters import get_exporter
+from instrumentation import frame_bytes, stage
+
+
+class BdAgroTomografia:
+    """
+    Class for managing BD_AGRO data related to tomography without database
+    connection. It generates a JSON file with merged data.
+
+    Parameters:
+    - clients_folder (str): Path to the folder containing clients' data.
+    - output_file (str, optional): Path to the output JSON file. Defaults to
+      'merge_bd_agro.json'.
+    - export_json_file (bool, optional): Flag indicating whether to export the
+      merged data to a JSON file. Defaults to True.
+    - export_format (str, optional): Format of the exported file: 'json',
+      'jsonl', 'parquet' or 'feather'. Defaults to 'json'.
+    """
+    def __init__(
+            self,
+            clients_folder: str,
+            output_file: str = 'merge_bd_agro.json',
+            export_json_file: bool = True,
+            export_format: str = 'json') -> None:
+        """
+        Initialize the BdAgroTomografia object.
+
+        Parameters:
+        - clients_folder (str): Path to the folder containing clients' data.
+        - output_file (str, optional): Path to the output JSON file. Defaults
+          to 'merge_bd_agro.json'.
+        - export_json_file (bool, optional): Flag indicating whether to export
+          the merged data to a JSON file. Defaults to True.
+        - export_format (str, optional): Format of the exported file: 'json',
+          'jsonl', 'parquet' or 'feather'. Defaults to 'json'.
+        """
+        self.output_file = output_file
+        self.clients_folder = clients_folder
+        self.export_json_file = export_json_file
+        self.export_format = export_format
+
+        # Dummy data simulating client data; replace with actual loading logic if needed.
+        self.clients_data = pd.DataFrame({
+            "id": [1, 2],
+            "nome": ["Client A", "Client B"],
+            "grupo": ["Group 1", "Group 2"]
+        })
+
+        self.__create_json()
+
+    def __create_json(self) -> None:
+        """
+        Generate JSON with merged BD_AGRO data.
+        """
+        bd_agro_data = self.__get_bd_agro_merged_clients_data()
+
+        if self.export_json_file:
+            with get_exporter(self.output_file, self.export_format) as exporter:
+                exporter.write_groups(bd_agro_data, 'client_id')
+
+    def __get_bd_agro_merged_clients_data(self) -> pd.DataFrame:
+        """
+        Get merged BD_AGRO data for tomografia.
+
+        Returns:
+        - pd.DataFrame: Merged BD_AGRO data for tomografia.
+        """
+        # The typed data is exported by __create_json, not the raw merge
+        data = CreateBdAgroMerge(
+            clients_folder=self.clients_folder,
+            output_file=self.output_file,
+            export_json_file=False,
+            selected_client_ids=[int(client_id) for client_id in self.clients_data['id']],
+            export_format=self.export_format).merge_clients_bd_agro_data()
+
+        return ImproveBdAgro(bd_agro_data=data).bd_data()
+
+
+class ImproveBdAgro:
+    """
+    Class for improving the structure and data types of BD_AGRO data.
+
+    Rows are validated in the same pass as the type coercion: values that
+    could not be converted, values outside VALIDATION_RANGES, DT_PLANTIO
+    not before DT_CORTE and repeated CHAVE/SAFRA keys reject the row.
+    Rejected rows keep their original values, get a 'motivo' column and
+    are sent to the quarantine, if one is given.
+
+    Parameters:
+    - bd_agro_data (pd.DataFrame): Original BD_AGRO data.
+    - validate (bool, optional): Reject invalid rows. Defaults to True.
+    - quarantine (QuarantineFile | QuarantineTable, optional): Destination
+      of the rejected rows. Defaults to None (kept in rejected only).
+    """
+    DATE_FORMATS = (
+        '%d/%m/%Y', '%d/%m/%Y %H:%M:%S', '%Y-%m-%d', '%Y-%m-%d %H:%M:%S',
+        '%d-%m-%Y', '%d/%m/%y')
+
+    def __init__(
+            self,
+            bd_agro_data: pd.DataFrame,
+            validate: bool = True,
+            quarantine=None) -> None:
+        """
+        Initialize the ImproveBdAgro object.
+
+        Parameters:
+        - bd_agro_data (pd.DataFrame): Original BD_AGRO data.
+        - validate (bool, optional): Reject invalid rows. Defaults to True.
+        - quarantine (QuarantineFile | QuarantineTable, optional):
+          Destination of the rejected rows. Defaults to None.
+        """
+        self.bd_agro_data = bd_agro_data
+        self.validate = validate
+        self.quarantine = quarantine
+
+        # Filled by bd_data: values that could not be converted, per column
+        self.coercion_failures: dict[str, int] = {}
+
+        # Filled by bd_data: rejected rows, original values and 'motivo'
+        self.rejected = pd.DataFrame()
+
+        self.data_types = dict(DATA_TYPES)
+
+    def bd_data(self) -> pd.DataFrame:
+        """
+        Improve the structure and data types of BD_AGRO data.
+
+        Returns:
+        - pd.DataFrame: Improved BD_AGRO data.
+        """
+        memory_before = memory_per_row(self.bd_agro_data)
+
+        with stage('coercion') as metrics:
+            # Columns missing from a client's workbook are kept as nulls
+            self.bd_agro_data = self.bd_agro_data.reindex(columns=COLUMNS_INTEREST)
+
+            # Convert all columns to lowercase
+            self.bd_agro_data.columns = self.bd_agro_data.columns.str.lower()
+
+            self.__apply_data_types()
+
+            metrics['rows'] = len(self.bd_agro_data)
+            metrics['bytes'] = frame_bytes(self.bd_agro_data)
+            metrics['rejected'] = len(self.rejected)
+
+        if len(self.rejected):
+            print(f'{len(self.rejected)} linha(s) rejeitada(s) na validação: '
+                  f'{self.rejected["motivo"].value_counts().head(5).to_dict()}')
+            if self.quarantine is not None:
+                self.quarantine.write(self.rejected)
+
+        print(f'Memória por linha: {memory_before:.0f} bytes antes, '
+              f'{memory_per_row(self.bd_agro_data):.0f} bytes depois da tipagem')
+
+        return self.bd_agro_data
+
+    def __apply_data_types(self) -> None:
+        """
+        Apply specified data types to the columns in BD_AGRO data.
+
+        Columns are grouped by target dtype (compact dtypes from
+        bd_agro_schema: categories, nullable and downcast numerics) and
+        converted together, and the typed frame is built in a single step.
+        Values that could not be converted are counted per column in
+        coercion_failures.
+        """
+        dict_formats_lower = {
+            key.lower(): value for key, value in self.data_types.items()}
+
+        columns_by_dtype = {}
+        for column, data_type in dict_formats_lower.items():
+            if column in self.bd_agro_data.columns:
+                dtype = pandas_dtype(column) if data_type != 'date' else 'date'
+                columns_by_dtype.setdefault(dtype, []).append(column)
+
+        data = self.bd_agro_data
+        converted = {}
+
+        for dtype, columns in columns_by_dtype.items():
+            if dtype in ('string', 'category'):
+                converted.update(data[columns].astype(dtype).items())
+
+            elif dtype == 'date':
+                for column in columns:
+                    converted[column] = self.__parse_dates(data[column])
+
+            else:
+                numbers = data[columns].apply(pd.to_numeric, errors='coerce')
+                if pd.api.types.is_integer_dtype(pd.api.types.pandas_dtype(dtype)):
+                    # Non-integral or out-of-range values (SAFRA 2023.5) would
+                    # make the cast raise; as nulls they count as failures
+                    limits = np.iinfo(pd.api.types.pandas_dtype(dtype).numpy_dtype)
+                    numbers = numbers.astype('float64')
+                    numbers = numbers.where(
+                        (numbers % 1 == 0) & (numbers >= limits.min)
+                        & (numbers <= limits.max))
+                converted.update(numbers.astype(dtype).items())
+
+        failed_masks = {
+            column: data[column].notna() & values.isna()
+            for column, values in converted.items()}
+        self.coercion_failures = {
+            column: int(mask.sum()) for column, mask in failed_masks.items()}
+
+        failures = {
+            column: count for column, count in self.coercion_failures.items()
+            if count}
+        if failures:
+            print(f'Valores não convertidos por coluna: {failures}')
+
+        typed = pd.DataFrame(
+            {column: converted.get(column, data[column]) for column in data.columns},
+            index=data.index)
+
+        if not self.validate:
+            self.bd_agro_data = typed
+            return
+
+        rules = {
+            f'{column} inválido': mask
+            for column, mask in failed_masks.items() if mask.any()}
+        rules.update(self.__validation_rules(typed))
+
+        if not rules:
+            self.bd_agro_data = typed
+            self.rejected = pd.DataFrame()
+            return
+
+        masks = {reason: mask.to_numpy(dtype=bool) for reason, mask in rules.items()}
+        rejected = np.logical_or.reduce(list(masks.values()))
+
+        # Reasons of the rejected rows only, joined rule by rule
+        reasons = pd.Series('', index=data.index[rejected], dtype=object)
+        for reason, mask in masks.items():
+            hit = mask[rejected]
+            reasons[hit] = reasons[hit] + reason + '; '
+
+        self.rejected = data.loc[rejected].astype('string').assign(
+            motivo=reasons.str.rstrip('; '))
+        self.bd_agro_data = typed.loc[~rejected]
+
+    @staticmethod
+    def __validation_rules(typed: pd.DataFrame) -> dict[str, pd.Series]:
+        """
+        Vectorized checks of the typed data: ranges, date order and key
+        uniqueness. Returns a boolean mask of the failing rows per reason.
+        """
+        rules = {}
+
+        for column, (minimum, maximum) in VALIDATION_RANGES.items():
+            column = column.lower()
+            if column in typed.columns:
+                values = typed[column]
+                rules[f'{column} fora de [{minimum}, {maximum}]'] = (
+                    (values < minimum) | (values > maximum)).fillna(False)
+
+        if {'dt_plantio', 'dt_corte'} <= set(typed.columns):
+            rules['dt_plantio >= dt_corte'] = (
+                typed['dt_plantio'] >= typed['dt_corte']).fillna(False)
+
+        keys = [column.lower() for column in KEY_COLUMNS]
+        if set(keys) <= set(typed.columns):
+            has_key = typed['chave'].notna()
+            rules['chave/safra repetida'] = has_key & typed[keys].duplicated(keep=False)
+
+        return {reason: mask for reason, mask in rules.items() if mask.any()}
+
+    @classmethod
+    def __parse_dates(cls, values: pd.Series) -> pd.Series:
+        """
+        Convert a column to datetime using explicit formats, so mixed
+        Brazilian (dd/mm/yyyy) and ISO strings are not inferred element by
+        element. Datetime cells and Excel serial numbers, also written as
+        text (mixed columns are read as strings), are accepted.
+
+        Parameters:
+        - values (pd.Series): Column to convert.
+
+        Returns:
+        - pd.Series: Converted column, NaT where conversion failed.
+        """
+        if pd.api.types.is_datetime64_any_dtype(values):
+            return values
+
+        value_type = values.map(type)
+        is_text = value_type == str
+        is_number = values.notna() & ~is_text & value_type.map(
+            lambda kind: issubclass(kind, Number))
+
+        # datetime/date cells read by openpyxl
+        parsed = pd.to_datetime(
+            values.where(values.notna() & ~is_text & ~is_number),
+            errors='coerce')
+
+        # Excel serial dates
+        if is_number.any():
+            parsed = parsed.fillna(pd.to_datetime(
+                pd.to_numeric(values.where(is_number), errors='coerce'),
+                unit='D', origin='1899-12-30', errors='coerce'))
+
+        # Day-first text; an all-NaN column has no .str accessor
+        if not is_text.any():
+            return parsed
+        text = values.where(is_text).astype(object).str.strip()
+        for date_format in cls.DATE_FORMATS:
+            pending = parsed.isna() & text.notna()
+            if not pending.any():
+                break
+            parsed = parsed.fillna(pd.to_datetime(
+                text.where(pending), format=date_format, errors='coerce'))
+
+        pending = parsed.isna() & text.notna()
+        if pending.any():
+            parsed = parsed.fillna(pd.to_datetime(
+                pd.to_numeric(text.where(pending), errors='coerce'),
+                unit='D', origin='1899-12-30', errors='coerce'))
+
+        return parsed
@@ -0,0 +1,251 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import pandas as pd
+
+
+def normalize_dtypes(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Give parsed workbook data the dtypes it keeps through a Parquet round
+    trip: object columns (text, or numbers and text mixed, common in client
+    workbooks) become strings. Applied to freshly parsed data and to cached
+    data alike, so a cache hit and a miss return the same dtypes.
+
+    Parameters:
+    - data (pd.DataFrame): Parsed data.
+
+    Returns:
+    - pd.DataFrame: Data with normalized dtypes.
+    """
+    object_columns = data.select_dtypes(include='object').columns
+    if not len(object_columns):
+        return data
+    return data.astype({column: 'string' for column in object_columns})
+
+
+class BdAgroCache:
+    """
+    On-disk cache of parsed BD_AGRO workbooks stored as Parquet files.
+
+    Each entry is keyed by the workbook path and is only reused while the
+    file size and modification time (and optionally the content hash) are
+    unchanged. When the cache grows beyond max_size_mb the least recently
+    used entries are evicted. Stored and returned data go through
+    normalize_dtypes.
+
+    Parameters:
+    - cache_dir (str): Folder where the Parquet files and the index are kept.
+    - max_size_mb (float, optional): Maximum size of the cache. Defaults to
+      2048.
+    - use_content_hash (bool, optional): Also compare a SHA-256 of the file
+      content. Slower, but catches files rewritten with the same mtime.
+      Defaults to False.
+    - variant (str, optional): Description of how the workbooks are parsed
+      (e.g. column projection). Entries parsed differently are not reused.
+      Defaults to ''.
+    """
+    INDEX_FILE = 'index.json'
+
+    def __init__(
+            self,
+            cache_dir: str,
+            max_size_mb: float = 2048,
+            use_content_hash: bool = False,
+            variant: str = '') -> None:
+        """
+        Initialize the BdAgroCache object.
+
+        Parameters:
+        - cache_dir (str): Folder where the Parquet files and the index are
+          kept.
+        - max_size_mb (float, optional): Maximum size of the cache. Defaults
+          to 2048.
+        - use_content_hash (bool, optional): Also compare a SHA-256 of the
+          file content. Defaults to False.
+        - variant (str, optional): Description of how the workbooks are
+          parsed. Defaults to ''.
+        """
+        self.cache_dir = cache_dir
+        self.max_size_mb = max_size_mb
+        self.use_content_hash = use_content_hash
+        self.variant = variant
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.index = self.__load_index()
+
+    def get(self, bd_agro_file: str) -> pd.DataFrame | None:
+        """
+        Get the cached data of a workbook if it is still valid.
+
+        Parameters:
+        - bd_agro_file (str): Path to the BD_AGRO workbook.
+
+        Returns:
+        - pd.DataFrame | None: Cached data, or None on a miss.
+        """
+        key = self.__key(bd_agro_file)
+        entry = self.index.get(key)
+
+        if entry is None or entry['signature'] != self.__signature(bd_agro_file):
+            return None
+
+        try:
+            data = normalize_dtypes(pd.read_parquet(self.__entry_path(key)))
+        except Exception as e:
+            print(f'Erro ao ler cache de {bd_agro_file}: {e}')
+            self.__remove(key)
+            self.__save_index()
+            return None
+
+        entry['last_access'] = time.time()
+        self.__save_index()
+        return data
+
+    def put(self, bd_agro_file: str, data: pd.DataFrame) -> None:
+        """
+        Store the parsed data of a workbook, with normalize_dtypes applied.
+
+        Parameters:
+        - bd_agro_file (str): Path to the BD_AGRO workbook.
+        - data (pd.DataFrame): Parsed data.
+        """
+        key = self.__key(bd_agro_file)
+        entry_path = self.__entry_path(key)
+
+        try:
+            normalize_dtypes(data).to_parquet(entry_path, index=False)
+        except Exception as e:
+            print(f'Erro ao gravar cache de {bd_agro_file}: {e}')
+            return
+
+        self.index[key] = {
+            'file': os.path.abspath(bd_agro_file),
+            'signature': self.__signature(bd_agro_file),
+            'bytes': os.path.getsize(entry_path),
+            'last_access': time.time(),
+        }
+        self.__evict()
+        self.__save_index()
+
+    def invalidate(self, bd_agro_file: str | None = None) -> int:
+        """
+        Remove cached entries.
+
+        Parameters:
+        - bd_agro_file (str, optional): Workbook to invalidate. When omitted,
+          the whole cache is cleared.
+
+        Returns:
+        - int: Number of removed entries.
+        """
+        if bd_agro_file is None:
+            keys = list(self.index)
+        else:
+            keys = [key for key in [self.__key(bd_agro_file)] if key in self.index]
+
+        for key in keys:
+            self.__remove(key)
+
+        self.__save_index()
+        return len(keys)
+
+    def size_mb(self) -> float:
+        """
+        Total size of the cached Parquet files in MB.
+        """
+        return sum(entry['bytes'] for entry in self.index.values()) / 1024 ** 2
+
+    def __evict(self) -> None:
+        """
+        Remove the least recently used entries until the cache fits in
+        max_size_mb.
+        """
+        by_access = sorted(self.index, key=lambda key: self.index[key]['last_access'])
+
+        while by_access and self.size_mb() > self.max_size_mb:
+            self.__remove(by_access.pop(0))
+
+    def __remove(self, key: str) -> None:
+        """
+        Remove an entry from the index and its Parquet file.
+        """
+        self.index.pop(key, None)
+        entry_path = self.__entry_path(key)
+        if os.path.exists(entry_path):
+            os.remove(entry_path)
+
+    def __signature(self, bd_agro_file: str) -> dict:
+        """
+        Build the signature used to check that a cached entry is still valid.
+        """
+        stat = os.stat(bd_agro_file)
+        signature = {'size': stat.st_size, 'mtime': stat.st_mtime, 'variant': self.variant}
+
+        if self.use_content_hash:
+            digest = hashlib.sha256()
+            with open(bd_agro_file, 'rb') as file:
+                for block in iter(lambda: file.read(1024 * 1024), b''):
+                    digest.update(block)
+            signature['sha256'] = digest.hexdigest()
+
+        return signature
+
+    @staticmethod
+    def __key(bd_agro_file: str) -> str:
+        """
+        Cache key of a workbook, derived from its absolute path.
+        """
+        return hashlib.sha1(
+            os.path.abspath(bd_agro_file).encode('utf-8')).hexdigest()
+
+    def __entry_path(self, key: str) -> str:
+        """
+        Path of the Parquet file of an entry.
+        """
+        return os.path.join(self.cache_dir, f'{key}.parquet')
+
+    def __load_index(self) -> dict:
+        """
+        Load the cache index, starting empty if it is missing or corrupted.
+        """
+        index_path = os.path.join(self.cache_dir, self.INDEX_FILE)
+        if not os.path.exists(index_path):
+            return {}
+
+        try:
+            with open(index_path, encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError) as e:
+            print(f'Índice do cache inválido, recriando: {e}')
+            return {}
+
+    def __save_index(self) -> None:
+        """
+        Write the cache index atomically.
+        """
+        index_path = os.path.join(self.cache_dir, self.INDEX_FILE)
+        tmp_path = f'{index_path}.tmp'
+
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.index, file)
+        os.replace(tmp_path, index_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Cache de BD_AGRO em Parquet')
+    parser.add_argument('cache_dir', help='Pasta do cache')
+    parser.add_argument('--invalidate', nargs='?', const='', default=None,
+                        metavar='BD_AGRO_FILE',
+                        help='Remove a entrada do arquivo informado, ou todo o cache')
+    args = parser.parse_args()
+
+    cache = BdAgroCache(args.cache_dir)
+
+    if args.invalidate is not None:
+        removed = cache.invalidate(args.invalidate or None)
+        print(f'{removed} entrada(s) removida(s) do cache.')
+    else:
+        print(f'{len(cache.index)} entrada(s), {cache.size_mb():.1f} MB')
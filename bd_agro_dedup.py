@@ -0,0 +1,94 @@
+import pandas as pd
+
+from bd_agro_schema import KEEP_POLICIES, KEY_COLUMNS
+
+
+def deduplicate_bd_agro(
+        data: pd.DataFrame,
+        keep: str = 'latest_dt_corte',
+        key_columns: tuple[str, ...] = KEY_COLUMNS) -> tuple[pd.DataFrame, int]:
+    """
+    Remove rows repeated on (client_id, CHAVE, SAFRA), keeping one row per
+    key according to a keep-policy.
+
+    The keys are hashed into a compact uint64 index and the repeated
+    hashes are found with a hash table, so the data is never sorted. Only
+    the rows whose hash repeats are grouped by their actual key values (a
+    hash collision never merges different keys) to choose the row kept.
+    Column names are matched case-insensitively and keys are compared as
+    stripped text, so 123, 123.0 and '123 ' are the same CHAVE, while
+    '001' and '1' are not.
+
+    Parameters:
+    - data (pd.DataFrame): BD_AGRO data.
+    - keep (str, optional): 'latest_dt_corte' (most recent DT_CORTE),
+      'max_area_bd' (largest AREA_BD) or 'last' (last row read). Rows
+      without a value rank lowest and ties keep the first row read.
+      Defaults to 'latest_dt_corte'.
+    - key_columns (tuple[str, ...], optional): Key columns. Defaults to
+      KEY_COLUMNS.
+
+    Returns:
+    - tuple[pd.DataFrame, int]: Deduplicated data, in the original order,
+      and the number of rows removed.
+    """
+    if keep not in KEEP_POLICIES:
+        raise ValueError(f'Unknown keep-policy: {keep}')
+
+    columns = {column.lower(): column for column in data.columns}
+    if data.empty or any(key.lower() not in columns for key in key_columns):
+        return data, 0
+
+    keys = pd.DataFrame({
+        key: _normalize_key(data[columns[key.lower()]]) for key in key_columns})
+    hashes = pd.util.hash_pandas_object(keys, index=False)
+
+    candidates = hashes.duplicated(keep=False).to_numpy()
+    if not candidates.any():
+        return data, 0
+
+    positions = candidates.nonzero()[0]
+    groups = [keys[key].to_numpy()[positions] for key in key_columns]
+
+    rank_column, kind = KEEP_POLICIES[keep]
+    if rank_column is None or rank_column.lower() not in columns:
+        ranks = pd.Series(positions, index=positions, dtype='float64')
+    else:
+        values = data[columns[rank_column.lower()]].iloc[positions].reset_index(drop=True)
+        ranks = _date_ranks(values) if kind == 'date' else pd.to_numeric(
+            values, errors='coerce').astype('float64')
+        ranks.index = positions
+
+    # idxmax returns the first row with the largest rank of each key
+    chosen = ranks.fillna(float('-inf')).groupby(
+        groups, sort=False, dropna=False).idxmax()
+
+    drop = candidates.copy()
+    drop[chosen.to_numpy()] = False
+
+    return data.loc[~drop], int(drop.sum())
+
+
+def _normalize_key(values: pd.Series) -> pd.Series:
+    """
+    Key values comparable across workbooks: stripped text, with
+    float-formatted integers (123.0, '123.0') written without decimals.
+    Other text is kept as is, so '001' and '1' stay different keys, as in
+    the table, where CHAVE is text.
+    """
+    text = values.reset_index(drop=True).astype('string').str.strip()
+    return text.str.replace(r'^(-?\d+)\.0+$', r'\1', regex=True)
+
+
+def _date_ranks(values: pd.Series) -> pd.Series:
+    """
+    Dates of a raw workbook column as seconds, to rank rows: datetime
+    cells, day-first text and Excel serial numbers. NaN where no date.
+    """
+    if not pd.api.types.is_datetime64_any_dtype(values):
+        numbers = pd.to_numeric(values, errors='coerce')
+        parsed = pd.to_datetime(
+            values.where(numbers.isna()), format='mixed', dayfirst=True, errors='coerce')
+        values = parsed.fillna(pd.to_datetime(
+            numbers, unit='D', origin='1899-12-30', errors='coerce'))
+    return (values - pd.Timestamp(0)).dt.total_seconds()
@@ -0,0 +1,188 @@
+import unicodedata
+from typing import TYPE_CHECKING
+
+# Only constants and pure-Python helpers live here, so the CLI and the
+# database modules can import the schema without loading pandas
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Column types of the bd_tomografia table, shared by every entry point
+DATA_TYPES = {
+    'client_id': 'integer', 'client_name': 'string', 'CHAVE': 'string',
+    'SAFRA': 'integer', 'OBJETIVO': 'string', 'cliente': 'string',
+    'TP_PROP': 'string', 'FAZENDA': 'string', 'SETOR': 'string',
+    'SECAO': 'string', 'BLOCO': 'string', 'PIVO': 'string',
+    'DESC_FAZ': 'string', 'TALHAO': 'string', 'VARIEDADE': 'string',
+    'MATURACAO': 'string', 'AMBIENTE': 'string', 'ESTAGIO': 'string',
+    'GRUPO_DASH': 'string', 'GRUPO_NDVI': 'string',
+    'NMRO_CORTE': 'float', 'TAH': 'float', 'TPH': 'float',
+    'DESC_CANA': 'string', 'AREA_BD': 'float', 'A_EST_MOAGEM': 'float',
+    'A_COLHIDA': 'float', 'A_EST_MUDA': 'float', 'A_MUDA': 'float',
+    'TCH_EST': 'float', 'TC_EST': 'float', 'TCH_REST': 'float',
+    'TC_REST': 'float', 'TCH_REAL': 'float', 'TC_REAL': 'float',
+    'DT_CORTE': 'date', 'DT_ULT_CORTE': 'date', 'DT_PLANTIO': 'date',
+    'IDADE_CORTE': 'float', 'ATR': 'float', 'ATR_EST': 'float',
+    'IRRIGACAO': 'string', 'grupo': 'string',
+}
+
+# Columns kept from the BD_AGRO workbooks, in output order
+COLUMNS_INTEREST = [
+    'client_id', 'client_name', 'CHAVE', 'SAFRA',
+    'OBJETIVO', 'TP_PROP', 'FAZENDA', 'SETOR', 'SECAO', 'BLOCO',
+    'PIVO', 'DESC_FAZ', 'TALHAO', 'VARIEDADE', 'MATURACAO',
+    'AMBIENTE', 'ESTAGIO', 'GRUPO_DASH', 'GRUPO_NDVI', 'NMRO_CORTE',
+    'DESC_CANA', 'AREA_BD', 'A_EST_MOAGEM', 'A_COLHIDA', 'A_EST_MUDA',
+    'A_MUDA', 'TCH_EST', 'TC_EST', 'TCH_REST', 'TC_REST', 'TCH_REAL',
+    'TC_REAL', 'DT_CORTE', 'DT_ULT_CORTE', 'DT_PLANTIO', 'IDADE_CORTE',
+    'ATR', 'ATR_EST', 'IRRIGACAO', 'TAH', 'TPH', 'grupo', 'cliente']
+
+# Low-cardinality text columns, stored as category
+CATEGORY_COLUMNS = {
+    'client_name', 'cliente', 'OBJETIVO', 'TP_PROP', 'FAZENDA',
+    'VARIEDADE', 'MATURACAO', 'AMBIENTE', 'ESTAGIO', 'GRUPO_DASH',
+    'GRUPO_NDVI', 'DESC_CANA', 'IRRIGACAO', 'grupo',
+}
+
+# Compact dtypes for integer and float columns. Float columns not listed
+# here keep float64: tonnage (TC_*, TCH_*) and area (AREA_BD, A_*) are
+# summed by the rollups, and float32 would add rounding error to totals.
+NUMERIC_DTYPES = {
+    'client_id': 'Int32', 'SAFRA': 'Int16',
+    'NMRO_CORTE': 'float32', 'TAH': 'float32', 'TPH': 'float32',
+    'IDADE_CORTE': 'float32', 'ATR': 'float32', 'ATR_EST': 'float32',
+}
+
+# PostgreSQL column types of the DATA_TYPES types
+SQL_TYPES = {
+    'integer': 'integer', 'float': 'double precision',
+    'date': 'date', 'string': 'text',
+}
+
+# Valid ranges (inclusive) checked by ImproveBdAgro; rows outside them are
+# quarantined
+VALIDATION_RANGES = {
+    'TCH_EST': (0, 300), 'TCH_REST': (0, 300), 'TCH_REAL': (0, 300),
+    'ATR': (50, 250), 'ATR_EST': (50, 250),
+    'AREA_BD': (0, 5000),
+}
+
+# Columns that identify a row of a client
+KEY_COLUMNS = ('client_id', 'CHAVE', 'SAFRA')
+
+# Keep-policies of bd_agro_dedup: name -> (column ranked, kind). The row
+# with the largest value is kept; 'last' keeps the last row read
+KEEP_POLICIES = {
+    'latest_dt_corte': ('DT_CORTE', 'date'),
+    'max_area_bd': ('AREA_BD', 'number'),
+    'last': (None, None),
+}
+
+# Alternative workbook headers, already normalized (see normalize_header),
+# mapped to the schema column
+HEADER_ALIASES = {
+    'CHAVE_TALHAO': 'CHAVE', 'ANO_SAFRA': 'SAFRA',
+    'TIPO_PROPRIEDADE': 'TP_PROP', 'FAZ': 'FAZENDA', 'COD_FAZENDA': 'FAZENDA',
+    'SECCAO': 'SECAO', 'DESCRICAO_FAZENDA': 'DESC_FAZ', 'TALHOES': 'TALHAO',
+    'VARIEDADES': 'VARIEDADE', 'AMB': 'AMBIENTE', 'AMBIENTE_PRODUCAO': 'AMBIENTE',
+    'EST': 'ESTAGIO', 'ESTADIO': 'ESTAGIO', 'NUMERO_CORTE': 'NMRO_CORTE',
+    'NRO_CORTE': 'NMRO_CORTE', 'N_CORTE': 'NMRO_CORTE', 'NO_CORTE': 'NMRO_CORTE',
+    'AREA': 'AREA_BD', 'DATA_CORTE': 'DT_CORTE', 'DATA_DE_CORTE': 'DT_CORTE', 'DATA_ULT_CORTE': 'DT_ULT_CORTE',
+    'DATA_ULTIMO_CORTE': 'DT_ULT_CORTE', 'DATA_PLANTIO': 'DT_PLANTIO',
+    'DATA_DE_PLANTIO': 'DT_PLANTIO',
+    'IDADE': 'IDADE_CORTE', 'IRRIGADO': 'IRRIGACAO',
+}
+
+# Columns added by the merge itself, never read from the workbooks
+MERGE_COLUMNS = {'client_id', 'client_name'}
+
+
+def normalize_header(header) -> str:
+    """
+    Normalize a workbook header: uppercase, no accents, no surrounding
+    spaces and words joined by '_'.
+    """
+    text = unicodedata.normalize('NFKD', str(header)).encode('ascii', 'ignore').decode()
+    return '_'.join(text.replace('-', ' ').replace('.', ' ').upper().split())
+
+
+def resolve_header(header) -> str | None:
+    """
+    Get the schema column of a workbook header, accepting different case,
+    accents, spacing and the aliases in HEADER_ALIASES.
+
+    Parameters:
+    - header: Workbook header.
+
+    Returns:
+    - str | None: Schema column, or None when the header is not used.
+    """
+    normalized = normalize_header(header)
+    return _WORKBOOK_COLUMNS.get(normalized) or HEADER_ALIASES.get(normalized)
+
+
+def project_workbook_columns(data: 'pd.DataFrame') -> 'pd.DataFrame':
+    """
+    Rename the headers read with resolve_header as usecols to their schema
+    columns. When two headers map to the same column, the exact schema
+    header wins over an alias, wherever it is; otherwise the first one
+    wins.
+    """
+    targets = [resolve_header(header) for header in data.columns]
+
+    chosen = {}
+    for position, (header, target) in enumerate(zip(data.columns, targets)):
+        exact = normalize_header(header) in _WORKBOOK_COLUMNS
+        if target not in chosen or (exact and not chosen[target][1]):
+            chosen[target] = (position, exact)
+
+    positions = sorted(position for position, _ in chosen.values())
+    data = data.iloc[:, positions]
+    data.columns = [targets[position] for position in positions]
+    return data
+
+
+def pandas_dtype(column: str) -> str:
+    """
+    Get the compact pandas dtype of a schema column. The column name is
+    matched case-insensitively.
+
+    Parameters:
+    - column (str): Column name.
+
+    Returns:
+    - str: pandas dtype.
+    """
+    column = _COLUMNS_BY_LOWER[column.lower()]
+    data_type = DATA_TYPES[column]
+
+    if data_type == 'string':
+        return 'category' if column in CATEGORY_COLUMNS else 'string'
+    if data_type == 'integer':
+        return NUMERIC_DTYPES.get(column, 'Int64')
+    if data_type == 'float':
+        return NUMERIC_DTYPES.get(column, 'float64')
+    return 'datetime64[ns]'
+
+
+def lower_keys(data_types: dict) -> dict:
+    """
+    Return a copy of a column mapping with lowercase column names.
+    """
+    return {column.lower(): value for column, value in data_types.items()}
+
+
+def memory_per_row(data: 'pd.DataFrame') -> float:
+    """
+    Memory used per row of a DataFrame, in bytes, including the contents
+    of object columns.
+    """
+    if not len(data):
+        return 0.0
+    return data.memory_usage(deep=True, index=False).sum() / len(data)
+
+
+_COLUMNS_BY_LOWER = {column.lower(): column for column in DATA_TYPES}
+
+_WORKBOOK_COLUMNS = {
+    normalize_header(column): column
+    for column in COLUMNS_INTEREST if column not in MERGE_COLUMNS}
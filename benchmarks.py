@@ -0,0 +1,712 @@
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from async_db_connection import AsyncDatabaseManager, run_async
+from bd_agro_dedup import deduplicate_bd_agro
+from bd_agro_schema import DATA_TYPES, SQL_TYPES, lower_keys
+from bdAgroTomografia import ImproveBdAgro
+from client_discovery import ClientDiscovery
+from createBdAgroMerge import CreateBdAgroMerge, concat_bd_agro, read_client_bd_agro
+from db_connection import DatabaseManager
+from exporters import get_exporter, read_export
+from instrumentation import Instrumentation
+from table_manager import TableManager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def synthetic_client_bd_agro(
+        client_id: int,
+        rows: int = 500,
+        seed: int = 0) -> pd.DataFrame:
+    """
+    Build a synthetic BD_AGRO frame for a single client.
+
+    Parameters:
+    - client_id (int): Client ID written to the frame.
+    - rows (int, optional): Number of talhões. Defaults to 500.
+    - seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+    - pd.DataFrame: Synthetic BD_AGRO data.
+    """
+    rng = np.random.default_rng(seed + client_id)
+
+    return pd.DataFrame({
+        'CHAVE': [f'{client_id}-{i}' for i in range(rows)],
+        'SAFRA': rng.integers(2018, 2025, rows),
+        'FAZENDA': rng.choice([f'FAZ {i}' for i in range(20)], rows),
+        'VARIEDADE': rng.choice(['RB867515', 'CTC4', 'SP813250'], rows),
+        'AREA_BD': rng.uniform(1, 80, rows),
+        'TCH_EST': rng.uniform(40, 140, rows),
+        'ATR': rng.uniform(110, 160, rows),
+        'DT_CORTE': pd.Timestamp('2023-04-01') + pd.to_timedelta(
+            rng.integers(0, 240, rows), unit='D'),
+        'client_id': client_id,
+        'client_name': f'CLIENTE{client_id}',
+    })
+
+
+def synthetic_workbook_bd_agro(rows: int = 500, seed: int = 0) -> pd.DataFrame:
+    """
+    Build a synthetic BD_AGRO workbook sheet with every workbook column of
+    the schema (COLUMNS_INTEREST without client_id and client_name), with
+    value ranges and text widths similar to the clients' files.
+
+    Parameters:
+    - rows (int, optional): Number of talhões. Defaults to 500.
+    - seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+    - pd.DataFrame: Synthetic workbook data, in schema column order.
+    """
+    rng = np.random.default_rng(seed)
+
+    fazendas = rng.integers(1, 60)
+    area = rng.gamma(2.0, 8.0, rows).round(2)
+    tch_est = rng.normal(85, 15, rows).clip(30, 160).round(1)
+    cut = rng.random(rows) < 0.7
+    tch_real = np.where(cut, (tch_est * rng.normal(1, 0.12, rows)).round(1), np.nan)
+    colhida = np.where(cut, area, 0.0)
+    plantio = pd.Timestamp('2016-01-01') + pd.to_timedelta(
+        rng.integers(0, 2500, rows), unit='D')
+    corte = plantio + pd.to_timedelta(rng.integers(300, 600, rows), unit='D')
+    atr_est = rng.normal(135, 8, rows).round(1)
+    fazenda = rng.integers(1, fazendas + 1, rows)
+
+    return pd.DataFrame({
+        'CHAVE': [f'{f:04d}{i:05d}' for i, f in enumerate(fazenda)],
+        'SAFRA': rng.integers(2018, 2026, rows),
+        'OBJETIVO': rng.choice(['MOAGEM', 'MUDA', 'REFORMA'], rows, p=[0.85, 0.1, 0.05]),
+        'TP_PROP': rng.choice(['PROPRIA', 'ARRENDADA', 'FORNECEDOR'], rows),
+        'FAZENDA': [f'{f:04d}' for f in fazenda],
+        'SETOR': rng.choice([f'SETOR {i}' for i in range(1, 9)], rows),
+        'SECAO': rng.integers(1, 40, rows).astype(str),
+        'BLOCO': rng.integers(1, 20, rows).astype(str),
+        'PIVO': rng.choice(['', 'PIVO 1', 'PIVO 2'], rows, p=[0.9, 0.05, 0.05]),
+        'DESC_FAZ': [f'FAZENDA SANTA RITA {f}' for f in fazenda],
+        'TALHAO': rng.integers(1, 300, rows).astype(str),
+        'VARIEDADE': rng.choice(
+            ['RB867515', 'CTC4', 'SP813250', 'RB966928', 'CTC9001', 'IACSP955000'], rows),
+        'MATURACAO': rng.choice(['PRECOCE', 'MEDIA', 'TARDIA'], rows),
+        'AMBIENTE': rng.choice(list('ABCDE'), rows),
+        'ESTAGIO': rng.choice(['1C', '2C', '3C', '4C', '5C', '6C+'], rows),
+        'GRUPO_DASH': rng.choice(['G1', 'G2', 'G3'], rows),
+        'GRUPO_NDVI': rng.choice(['ALTO', 'MEDIO', 'BAIXO'], rows),
+        'NMRO_CORTE': rng.integers(1, 8, rows).astype(float),
+        'DESC_CANA': rng.choice(['CANA PLANTA', 'CANA SOCA'], rows, p=[0.2, 0.8]),
+        'AREA_BD': area,
+        'A_EST_MOAGEM': area,
+        'A_COLHIDA': colhida,
+        'A_EST_MUDA': np.where(rng.random(rows) < 0.05, area, 0.0),
+        'A_MUDA': 0.0,
+        'TCH_EST': tch_est,
+        'TC_EST': (tch_est * area).round(1),
+        'TCH_REST': tch_est,
+        'TC_REST': (tch_est * area).round(1),
+        'TCH_REAL': tch_real,
+        'TC_REAL': (tch_real * colhida).round(1),
+        'DT_CORTE': corte.where(cut),
+        'DT_ULT_CORTE': corte - pd.to_timedelta(365, unit='D'),
+        'DT_PLANTIO': plantio,
+        'IDADE_CORTE': np.round((corte - plantio).days.to_numpy() / 30.4, 1),
+        'ATR': np.where(cut, (atr_est + rng.normal(0, 6, rows)).round(1), np.nan),
+        'ATR_EST': atr_est,
+        'IRRIGACAO': rng.choice(['SEQUEIRO', 'SALVAMENTO', 'PLENA'], rows),
+        'TAH': rng.uniform(8, 20, rows).round(2),
+        'TPH': rng.uniform(12, 18, rows).round(2),
+        'grupo': '',
+        'cliente': f'CLIENTE {seed}',
+    })
+
+
+def generate_estate(
+        folder: str,
+        clients: int = 20,
+        rows: int = 2000,
+        seed: int = 0,
+        first_client_id: int = 1000) -> list[int]:
+    """
+    Write a synthetic estate of client folders in the layout read by
+    ClientDiscovery: '<id>_<name>/2_bd_agro/BD_AGRO_<name>.xlsx'.
+
+    Row counts vary between clients (log-normal around rows), like the
+    real estate, where a few large clients dominate.
+
+    Parameters:
+    - folder (str): Destination folder.
+    - clients (int, optional): Number of clients. Defaults to 20.
+    - rows (int, optional): Median rows per client. Defaults to 2000.
+    - seed (int, optional): Random seed. Defaults to 0.
+    - first_client_id (int, optional): ID of the first client, above the
+      IDs that CreateBdAgroMerge always skips. Defaults to 1000.
+
+    Returns:
+    - list[int]: IDs of the generated clients.
+    """
+    rng = np.random.default_rng(seed)
+    client_ids = list(range(first_client_id, first_client_id + clients))
+
+    for client_id in client_ids:
+        client_rows = max(int(rng.lognormal(np.log(rows), 0.6)), 1)
+        bd_agro_folder = os.path.join(folder, f'{client_id}_CLIENTE{client_id}', '2_bd_agro')
+        os.makedirs(bd_agro_folder, exist_ok=True)
+        synthetic_workbook_bd_agro(client_rows, seed=client_id).to_excel(
+            os.path.join(bd_agro_folder, f'BD_AGRO_CLIENTE{client_id}.xlsx'),
+            index=False)
+
+    return client_ids
+
+
+def _peak_memory_mb() -> float:
+    """
+    Peak resident memory of the current process in MB, or the tracemalloc
+    peak where the resource module is not available.
+    """
+    if resource is None:
+        return tracemalloc.get_traced_memory()[1] / 1024 ** 2
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _merge_loop(frames: list[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Previous merge strategy: concat once per client.
+    """
+    merged = pd.DataFrame()
+    for frame in frames:
+        merged = pd.concat([merged, frame], ignore_index=True)
+    return merged
+
+
+MERGE_STRATEGIES = {
+    'loop': _merge_loop,
+    'single': concat_bd_agro,
+}
+
+
+def _run_merge(strategy: str, clients: int, rows: int, queue) -> None:
+    """
+    Run a merge strategy in a fresh process and report time and peak memory.
+    """
+    if resource is None:
+        tracemalloc.start()
+
+    frames = [synthetic_client_bd_agro(i, rows) for i in range(clients)]
+
+    start = time.perf_counter()
+    MERGE_STRATEGIES[strategy](frames)
+    elapsed = time.perf_counter() - start
+
+    queue.put((elapsed, _peak_memory_mb()))
+
+
+def bench_merge(sizes: list[int], rows: int) -> None:
+    """
+    Compare the merge strategies for each number of synthetic clients.
+
+    Each measurement runs in its own process so the peak memory is not
+    inherited from a previous run.
+    """
+    print(f'{"clientes":>8} {"estrategia":>10} {"tempo (s)":>10} {"pico (MB)":>10}')
+
+    for clients in sizes:
+        for strategy in MERGE_STRATEGIES:
+            queue = multiprocessing.Queue()
+            process = multiprocessing.Process(
+                target=_run_merge, args=(strategy, clients, rows, queue))
+            process.start()
+            elapsed, peak = queue.get()
+            process.join()
+
+            print(f'{clients:>8} {strategy:>10} {elapsed:>10.3f} {peak:>10.1f}')
+
+
+SYNTHETIC_DATA_TYPES = {
+    'client_id': 'integer', 'client_name': 'string', 'CHAVE': 'string',
+    'SAFRA': 'integer', 'FAZENDA': 'string', 'VARIEDADE': 'string',
+    'AREA_BD': 'float', 'TCH_EST': 'float', 'ATR': 'float',
+    'DT_CORTE': 'date',
+}
+
+def _db_config_from_env() -> dict:
+    """
+    Connection settings of the disposable PostgreSQL used by the benchmarks,
+    read from the BENCH_DB_* environment variables.
+    """
+    return {
+        'dbname': os.getenv('BENCH_DB_NAME', 'postgres'),
+        'user': os.getenv('BENCH_DB_USER', 'postgres'),
+        'password': os.getenv('BENCH_DB_PASSWORD', 'postgres'),
+        'host': os.getenv('BENCH_DB_HOST', 'localhost'),
+        'port': os.getenv('BENCH_DB_PORT', '5432'),
+    }
+
+
+def bench_insert(rows: int, table: str = 'bench_bd_tomografia') -> None:
+    """
+    Compare rows/sec of the COPY and execute_values insert paths of
+    DatabaseManager.insert_data against a local PostgreSQL.
+
+    The benchmark table is recreated before each run and dropped at the end.
+    """
+    db_manager = DatabaseManager(_db_config_from_env())
+    data = synthetic_client_bd_agro(1, rows)
+    columns_ddl = ', '.join(
+        f'{column} {SQL_TYPES[data_type]}'
+        for column, data_type in SYNTHETIC_DATA_TYPES.items())
+
+    print(f'{"metodo":>8} {"linhas":>10} {"tempo (s)":>10} {"linhas/s":>12}')
+
+    for method in ('values', 'copy'):
+        conn = db_manager.connect()
+        with conn.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS public.{table}')
+            cursor.execute(f'CREATE TABLE public.{table} ({columns_ddl})')
+        conn.commit()
+        conn.close()
+
+        start = time.perf_counter()
+        db_manager.insert_data(
+            'public', table, data, SYNTHETIC_DATA_TYPES, method=method)
+        elapsed = time.perf_counter() - start
+
+        print(f'{method:>8} {rows:>10} {elapsed:>10.3f} {rows / elapsed:>12.0f}')
+
+    conn = db_manager.connect()
+    with conn.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS public.{table}')
+    conn.commit()
+    conn.close()
+
+
+def bench_async(clients: int, rows: int, table: str = 'bench_bd_tomografia') -> None:
+    """
+    Compare the wall-clock time of replacing each client's rows one after
+    another (DatabaseManager) and concurrently on pooled connections
+    (AsyncDatabaseManager), against a local PostgreSQL.
+    """
+    config = _db_config_from_env()
+    db_manager = DatabaseManager(config)
+    data = concat_bd_agro(
+        [synthetic_client_bd_agro(i, rows) for i in range(clients)])
+    columns_ddl = ', '.join(
+        f'{column} {SQL_TYPES[data_type]}'
+        for column, data_type in SYNTHETIC_DATA_TYPES.items())
+
+    with db_manager.connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS public.{table}')
+            cursor.execute(f'CREATE TABLE public.{table} ({columns_ddl})')
+
+    def run_sequential():
+        for client_id, client_data in data.groupby('client_id', sort=False):
+            with db_manager.transaction():
+                db_manager.delete_rows_by_client_ids('public', table, [int(client_id)])
+                db_manager.insert_data('public', table, client_data, SYNTHETIC_DATA_TYPES)
+
+    async def run_concurrent():
+        async with AsyncDatabaseManager(config, max_size=8) as db:
+            await db.replace_clients('public', table, data, SYNTHETIC_DATA_TYPES)
+
+    print(f'{"modo":>12} {"clientes":>9} {"tempo (s)":>10}')
+
+    for name, run in (('sequencial', run_sequential),
+                      ('async', lambda: run_async(run_concurrent()))):
+        start = time.perf_counter()
+        run()
+        print(f'{name:>12} {clients:>9} {time.perf_counter() - start:>10.3f}')
+
+    with db_manager.connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS public.{table}')
+
+
+def _legacy_json_lines(data: pd.DataFrame, output_file: str) -> None:
+    """
+    Previous CreateBdAgroMerge export: a single to_json call.
+    """
+    data.to_json(output_file, orient='records', lines=True)
+
+
+def _legacy_json_array(data: pd.DataFrame, output_file: str) -> None:
+    """
+    Previous BdAgroTomografia export: indented JSON array.
+    """
+    data.to_json(output_file, orient='records', indent=4)
+
+
+def _exporter_writer(export_format: str):
+    """
+    Writer function that exports through the pluggable exporters.
+    """
+    def write(data: pd.DataFrame, output_file: str) -> None:
+        with get_exporter(output_file, export_format) as exporter:
+            exporter.write_groups(data, 'client_id')
+    return write
+
+
+EXPORT_SCENARIOS = {
+    'legacy-jsonl': (_legacy_json_lines, 'jsonl', '.jsonl'),
+    'legacy-json': (_legacy_json_array, 'json', '.json'),
+    'jsonl': (_exporter_writer('jsonl'), 'jsonl', '.jsonl'),
+    'parquet': (_exporter_writer('parquet'), 'parquet', '.parquet'),
+    'feather': (_exporter_writer('feather'), 'feather', '.feather'),
+}
+
+
+def bench_export(clients: int, rows: int) -> None:
+    """
+    Compare write time, read time and file size of the export formats.
+    """
+    data = concat_bd_agro(
+        [synthetic_client_bd_agro(i, rows) for i in range(clients)])
+
+    print(f'{"formato":>13} {"escrita (s)":>12} {"leitura (s)":>12} {"tamanho (MB)":>13}')
+
+    with tempfile.TemporaryDirectory() as folder:
+        for name, (writer, export_format, extension) in EXPORT_SCENARIOS.items():
+            output_file = os.path.join(folder, f'{name}{extension}')
+
+            start = time.perf_counter()
+            writer(data, output_file)
+            write_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            read_export(output_file, export_format)
+            read_time = time.perf_counter() - start
+
+            size = os.path.getsize(output_file) / 1024 ** 2
+            print(f'{name:>13} {write_time:>12.3f} {read_time:>12.3f} {size:>13.1f}')
+
+
+def _git_commit() -> str:
+    """
+    Current commit of the repository, to label the benchmark results.
+    """
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'desconhecido'
+
+
+def bench_estate(
+        clients: int,
+        rows: int,
+        max_workers: int = 1,
+        estate_folder: str | None = None,
+        with_db: bool = False,
+        baseline_file: str | None = None,
+        compare_file: str | None = None,
+        tolerance: float = 0.1) -> dict:
+    """
+    Run the pipeline stages over a synthetic estate and record time and
+    peak memory (tracemalloc) of each one: discovery, parse, merge, dedup,
+    coercion, JSON export and, with with_db, the load into a disposable
+    local PostgreSQL (BENCH_DB_* variables).
+
+    The results can be saved as a baseline (labelled with the git commit)
+    and compared against a previous baseline; stages slower or heavier
+    than the baseline by more than tolerance are flagged.
+
+    Parameters:
+    - clients (int): Number of synthetic clients.
+    - rows (int): Median rows per client.
+    - max_workers (int, optional): Processes used by the merge. Defaults to 1.
+    - estate_folder (str, optional): Existing or reusable estate folder.
+      Defaults to a temporary folder.
+    - with_db (bool, optional): Include the database load. Defaults to False.
+    - baseline_file (str, optional): Where to save the results.
+    - compare_file (str, optional): Baseline to compare against.
+    - tolerance (float, optional): Relative regression tolerance. Defaults
+      to 0.1 (10%).
+
+    Returns:
+    - dict: Results per stage.
+    """
+    with tempfile.TemporaryDirectory() as temporary_folder:
+        folder = estate_folder or temporary_folder
+        marker = os.path.join(folder, f'.estate_{clients}_{rows}')
+        if os.path.exists(marker):
+            client_ids = list(range(1000, 1000 + clients))
+        else:
+            print(f'Gerando {clients} clientes sintéticos em {folder}...')
+            client_ids = generate_estate(folder, clients, rows)
+            open(marker, 'w').close()
+
+        instrumentation = Instrumentation(trace_memory=True)
+
+        with instrumentation.stage('discovery') as record:
+            found = ClientDiscovery(folder).find_clients_bd_agro(client_ids)
+            record['rows'] = len(found)
+
+        with instrumentation.stage('parse') as record:
+            frames = [read_client_bd_agro(client)[1] for client in found]
+            record['rows'] = sum(len(frame) for frame in frames)
+        del frames
+
+        merger = CreateBdAgroMerge(
+            output_file=os.path.join(temporary_folder, 'merge.jsonl'),
+            clients_folder=folder,
+            export_json_file=False,
+            selected_client_ids=client_ids,
+            max_workers=max_workers,
+            dedup_keep=None)
+        with instrumentation.stage('merge', max_workers=max_workers) as record:
+            merged = merger.merge_clients_bd_agro_data()
+            record['rows'] = len(merged)
+
+        with instrumentation.stage('dedup') as record:
+            merged, record['removed'] = deduplicate_bd_agro(merged)
+            record['rows'] = len(merged)
+
+        with instrumentation.stage('coercion') as record:
+            typed = ImproveBdAgro(bd_agro_data=merged).bd_data()
+            record['rows'] = len(typed)
+        del merged
+
+        with instrumentation.stage('export_json') as record:
+            output_file = os.path.join(temporary_folder, 'merge.json')
+            with get_exporter(output_file, 'json') as exporter:
+                exporter.write_groups(typed, 'client_id')
+            record['rows'] = exporter.rows
+            record['bytes'] = os.path.getsize(output_file)
+
+        if with_db:
+            db_manager = DatabaseManager(_db_config_from_env())
+            table_manager = TableManager(db_manager, table='bench_bd_tomografia')
+            table_manager.create_table()
+            try:
+                with instrumentation.stage('db_load') as record:
+                    db_manager.insert_data(
+                        'public', 'bench_bd_tomografia', typed, lower_keys(DATA_TYPES))
+                    record['rows'] = len(typed)
+            finally:
+                with db_manager.connection() as conn:
+                    with conn.cursor() as cursor:
+                        cursor.execute('DROP TABLE IF EXISTS public.bench_bd_tomografia')
+
+    results = {
+        record['stage']: {
+            'seconds': round(record['seconds'], 4),
+            'peak_memory_mb': round(record['peak_memory_mb'], 1),
+            'rows': record['rows'],
+        }
+        for record in instrumentation.records}
+
+    print(f'{"etapa":>12} {"linhas":>10} {"tempo (s)":>10} {"pico (MB)":>10}')
+    for name, result in results.items():
+        print(f'{name:>12} {result["rows"] or 0:>10} {result["seconds"]:>10.3f} '
+              f'{result["peak_memory_mb"]:>10.1f}')
+
+    if compare_file:
+        _compare_baseline(results, compare_file, tolerance)
+
+    if baseline_file:
+        os.makedirs(os.path.dirname(os.path.abspath(baseline_file)), exist_ok=True)
+        with open(baseline_file, 'w', encoding='utf-8') as file:
+            json.dump({
+                'commit': _git_commit(),
+                'run_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'params': {'clients': clients, 'rows': rows, 'max_workers': max_workers},
+                'results': results,
+            }, file, indent=2)
+        print(f'Baseline salva em {baseline_file}')
+
+    return results
+
+
+def _compare_baseline(results: dict, compare_file: str, tolerance: float) -> None:
+    """
+    Print the change of each stage against a saved baseline, flagging
+    regressions above the tolerance.
+    """
+    with open(compare_file, encoding='utf-8') as file:
+        baseline = json.load(file)
+
+    print(f'\nComparação com {baseline["commit"]} ({baseline["run_at"]}, '
+          f'{baseline["params"]}):')
+    print(f'{"etapa":>12} {"tempo":>10} {"pico":>10}')
+    for name, result in results.items():
+        previous = baseline['results'].get(name)
+        if previous is None:
+            continue
+        time_change = result['seconds'] / previous['seconds'] - 1 if previous['seconds'] else 0.0
+        memory_change = (result['peak_memory_mb'] / previous['peak_memory_mb'] - 1
+                         if result['peak_memory_mb'] and previous['peak_memory_mb'] else 0.0)
+        flag = '  <- regressão' if max(time_change, memory_change) > tolerance else ''
+        print(f'{name:>12} {time_change:>+10.1%} {memory_change:>+10.1%}{flag}')
+
+
+# Modules each CLI command imports: command -> modules
+STARTUP_COMMANDS = {
+    'cli': ('main',),
+    'delete': ('main', 'db_connection', 'table_manager'),
+    'refresh_groups': ('main', 'db_connection', 'group_cache'),
+    'load': ('main', 'createBdAgroMerge', 'bdAgroTomografia', 'db_connection',
+             'group_cache', 'quarantine', 'table_manager'),
+}
+
+# Packages the CLI itself must not import eagerly
+HEAVY_PACKAGES = ('pandas', 'numpy', 'openpyxl', 'sqlalchemy', 'pyarrow', 'psycopg_pool')
+
+
+def _import_time(statement: str) -> tuple[float, set[str]]:
+    """
+    Run a statement in a fresh interpreter under -X importtime.
+
+    Returns:
+    - tuple[float, set[str]]: Cumulative import time of the top-level
+      imports, in seconds, and the names of every module imported.
+    """
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)))
+
+    total_us, modules = 0, set()
+    for line in completed.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|', 2)
+        if not cumulative.strip().isdigit():
+            continue
+        modules.add(name.strip())
+        if not name[1:].startswith(' '):
+            total_us += int(cumulative)
+    return total_us / 1e6, modules
+
+
+def bench_startup(
+        repeat: int = 5,
+        baseline_file: str | None = None,
+        compare_file: str | None = None,
+        tolerance: float = 0.1) -> dict:
+    """
+    Measure the import time of each CLI command (STARTUP_COMMANDS) with
+    python -X importtime, the best of repeat fresh interpreters minus the
+    interpreter's own startup, and list the heavy packages (HEAVY_PACKAGES)
+    each one pulls in. Importing main alone must not load any of them.
+
+    Parameters:
+    - repeat (int, optional): Interpreters per command. Defaults to 5.
+    - baseline_file (str, optional): Where to save the results.
+    - compare_file (str, optional): Baseline to compare against.
+    - tolerance (float, optional): Relative regression tolerance. Defaults
+      to 0.1 (10%).
+
+    Returns:
+    - dict: Results per command.
+    """
+    interpreter = min(_import_time('pass')[0] for _ in range(repeat))
+
+    results = {}
+    for command, modules in STARTUP_COMMANDS.items():
+        statement = f'import {", ".join(modules)}'
+        try:
+            runs = [_import_time(statement) for _ in range(repeat)]
+        except subprocess.CalledProcessError as e:
+            print(f'{command}: erro ao importar ({e.stderr.strip().splitlines()[-1]})')
+            continue
+        results[command] = {
+            'seconds': round(max(0.0, min(run[0] for run in runs) - interpreter), 4),
+            'peak_memory_mb': None,
+            'heavy': sorted(set(HEAVY_PACKAGES) & runs[0][1]),
+        }
+
+    print(f'{"comando":>14} {"tempo (s)":>10}  pacotes pesados')
+    for command, result in results.items():
+        print(f'{command:>14} {result["seconds"]:>10.3f}  {", ".join(result["heavy"]) or "-"}')
+
+    if results.get('cli', {}).get('heavy'):
+        print(f'\nRegressão: importar main carrega {", ".join(results["cli"]["heavy"])}')
+
+    if compare_file:
+        _compare_baseline(results, compare_file, tolerance)
+
+    if baseline_file:
+        os.makedirs(os.path.dirname(os.path.abspath(baseline_file)), exist_ok=True)
+        with open(baseline_file, 'w', encoding='utf-8') as file:
+            json.dump({
+                'commit': _git_commit(),
+                'run_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'params': {'repeat': repeat},
+                'results': results,
+            }, file, indent=2)
+        print(f'Baseline salva em {baseline_file}')
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmarks do bd_tomografia')
+    subparsers = parser.add_subparsers(dest='scenario', required=True)
+
+    merge_parser = subparsers.add_parser('merge', help='Merge de BD_AGRO por cliente')
+    merge_parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 500])
+    merge_parser.add_argument('--rows', type=int, default=500)
+
+    insert_parser = subparsers.add_parser(
+        'insert', help='Insert no PostgreSQL local (COPY x execute_values)')
+    insert_parser.add_argument('--rows', type=int, default=200000)
+
+    export_parser = subparsers.add_parser(
+        'export', help='Escrita e leitura de JSON, Parquet e Feather')
+    export_parser.add_argument('--clients', type=int, default=100)
+    export_parser.add_argument('--rows', type=int, default=500)
+
+    async_parser = subparsers.add_parser(
+        'async', help='Gravação por cliente sequencial x assíncrona')
+    async_parser.add_argument('--clients', type=int, default=50)
+    async_parser.add_argument('--rows', type=int, default=2000)
+
+    estate_parser = subparsers.add_parser(
+        'estate', help='Etapas do pipeline sobre clientes sintéticos em .xlsx')
+    estate_parser.add_argument('--clients', type=int, default=20)
+    estate_parser.add_argument('--rows', type=int, default=2000)
+    estate_parser.add_argument('--workers', type=int, default=1)
+    estate_parser.add_argument('--folder', help='Pasta para gerar/reaproveitar os clientes')
+    estate_parser.add_argument('--db', action='store_true', help='Inclui a carga no PostgreSQL')
+    estate_parser.add_argument('--save', help='Salva os resultados como baseline (JSON)')
+    estate_parser.add_argument('--compare', help='Compara com uma baseline salva')
+    estate_parser.add_argument('--tolerance', type=float, default=0.1)
+
+    startup_parser = subparsers.add_parser(
+        'startup', help='Tempo de importação de cada comando da CLI (-X importtime)')
+    startup_parser.add_argument('--repeat', type=int, default=5)
+    startup_parser.add_argument('--save', help='Salva os resultados como baseline (JSON)')
+    startup_parser.add_argument('--compare', help='Compara com uma baseline salva')
+    startup_parser.add_argument('--tolerance', type=float, default=0.1)
+
+    args = parser.parse_args()
+
+    if args.scenario == 'merge':
+        bench_merge(args.sizes, args.rows)
+    elif args.scenario == 'insert':
+        bench_insert(args.rows)
+    elif args.scenario == 'async':
+        bench_async(args.clients, args.rows)
+    elif args.scenario == 'export':
+        bench_export(args.clients, args.rows)
+    elif args.scenario == 'estate':
+        bench_estate(
+            args.clients, args.rows, args.workers, args.folder, args.db,
+            args.save, args.compare, args.tolerance)
+    elif args.scenario == 'startup':
+        bench_startup(args.repeat, args.save, args.compare, args.tolerance)
@@ -0,0 +1,378 @@
+import json
+import os
+import re
+import time
+
+
+class ClientDiscovery:
+    """
+    Find the clients' BD_AGRO files under the clients folder.
+
+    Client folders are named '<id>_<name>' and keep their workbook in a
+    '2_bd_agro' subfolder, or in its subfolders down to MAX_SCAN_DEPTH
+    levels; symlinked subfolders are not followed. The folder names are
+    filtered by ID before any subfolder is touched, and a manifest of
+    client folder -> BD_AGRO file is persisted so that repeat runs only list
+    the '2_bd_agro' folders whose modification time changed.
+
+    Parameters:
+    - clients_folder (str): Path to the folder containing clients' data.
+    - clients_to_remove (list[str], optional): Client IDs that are never
+      loaded.
+    - manifest_file (str, optional): Path to the discovery manifest. Defaults
+      to None (no manifest).
+    - resolution (str, optional): How to choose among several BD_AGRO
+      workbooks in the same folder: 'mtime' (most recently modified) or
+      'filename' (highest version/date in the name, mtime as tiebreaker).
+      Defaults to 'mtime'.
+    """
+    BD_AGRO_FOLDER = '2_bd_agro'
+    MAX_SCAN_DEPTH = 2
+    RESOLUTIONS = ('mtime', 'filename')
+
+    def __init__(
+            self,
+            clients_folder: str,
+            clients_to_remove: list[str] | None = None,
+            manifest_file: str | None = None,
+            resolution: str = 'mtime') -> None:
+        """
+        Initialize the ClientDiscovery object.
+
+        Parameters:
+        - clients_folder (str): Path to the folder containing clients' data.
+        - clients_to_remove (list[str], optional): Client IDs that are never
+          loaded.
+        - manifest_file (str, optional): Path to the discovery manifest.
+          Defaults to None (no manifest).
+        - resolution (str, optional): 'mtime' or 'filename'. Defaults to
+          'mtime'.
+        """
+        if resolution not in self.RESOLUTIONS:
+            raise ValueError(f'Resolução de BD_AGRO desconhecida: {resolution}')
+
+        self.clients_folder = clients_folder
+        self.resolution = resolution
+        self.clients_to_remove = set(clients_to_remove or [])
+        self.manifest_file = manifest_file
+        self.manifest = self.__load_manifest()
+
+    def find_clients_bd_agro(
+            self, selected_client_ids: list[int] | None = None) -> list[dict]:
+        """
+        Get the BD_AGRO file information of the clients.
+
+        Parameters:
+        - selected_client_ids (list[int], optional): Only these client IDs
+          are looked up. Defaults to None (every client).
+
+        Returns:
+        - list[dict]: Dictionaries with client_id, client_name and
+          bd_agro_file.
+        """
+        selected = None if selected_client_ids is None else {
+            int(client_id) for client_id in selected_client_ids}
+
+        clients_bd_agro_file = []
+        for client_folder in self.__client_folders(selected):
+            bd_agro_file = self.find_bd_agro_file(client_folder)
+            if bd_agro_file:
+                clients_bd_agro_file.append(bd_agro_file)
+
+        self.__save_manifest()
+        return clients_bd_agro_file
+
+    def find_bd_agro_file(self, client_folder: os.DirEntry) -> dict:
+        """
+        Find BD_AGRO file in the given client's folder, reusing the manifest
+        entry when the '2_bd_agro' folder did not change.
+
+        Parameters:
+        - client_folder (os.DirEntry): Client's folder.
+
+        Returns:
+        - dict: Dictionary containing information about the BD_AGRO file, or
+          an empty dictionary when it was not found.
+        """
+        client_id, client_name = self.parse_folder_name(client_folder.name)
+        bd_agro_path = os.path.join(client_folder.path, self.BD_AGRO_FOLDER)
+
+        try:
+            folder_mtime = os.stat(bd_agro_path).st_mtime
+        except OSError:
+            print(f'Pasta "{self.BD_AGRO_FOLDER}" não encontrada para o cliente: {client_name}')
+            self.manifest.pop(client_folder.name, None)
+            return {}
+
+        entry = self.manifest.get(client_folder.name)
+        if (entry is None
+                or entry['folder_mtime'] != folder_mtime
+                or entry.get('resolution') != self.resolution
+                or self.__subfolders_changed(entry)):
+            entry = self.__rescan(client_folder.name, bd_agro_path, folder_mtime)
+
+        # The chosen workbook may have been rewritten in place, which does
+        # not change the folder mtime, or removed; a removed one is looked
+        # up again only once
+        stat = self.__stat(entry['bd_agro_file'])
+        if stat is None and entry['bd_agro_file']:
+            entry = self.__rescan(client_folder.name, bd_agro_path, folder_mtime)
+            stat = self.__stat(entry['bd_agro_file'])
+
+        if stat is None:
+            print(f'Arquivo BD_AGRO do cliente não foi encontrado: {client_name}')
+            return {}
+        entry['mtime'], entry['size'] = stat.st_mtime, stat.st_size
+
+        if len(entry['candidates']) > 1:
+            print(f'{len(entry["candidates"])} arquivos BD_AGRO para o cliente '
+                  f'{client_name}; usando {os.path.basename(entry["bd_agro_file"])}')
+
+        return {
+            "client_id": client_id,
+            "client_name": client_name,
+            "bd_agro_file": entry['bd_agro_file'],
+            "bd_agro_mtime": entry['mtime'],
+            "bd_agro_size": entry['size']
+        }
+
+    @staticmethod
+    def parse_folder_name(folder_name: str) -> tuple[int, str]:
+        """
+        Extract client ID and name from a '<id>_<name>' folder name.
+        """
+        parts = folder_name.split('_')
+        return int(parts[0]), parts[1] if len(parts) > 1 else ''
+
+    def __client_folders(self, selected: set[int] | None) -> list[os.DirEntry]:
+        """
+        List the client folders, filtering by ID from the folder name alone.
+        """
+        with os.scandir(self.clients_folder) as entries:
+            folders = []
+            for entry in entries:
+                client_id = entry.name.split('_')[0]
+                if not client_id.isdigit() or client_id in self.clients_to_remove:
+                    continue
+                if selected is not None and int(client_id) not in selected:
+                    continue
+                if entry.is_dir():
+                    folders.append(entry)
+
+        return sorted(folders, key=lambda entry: entry.name)
+
+    def __rescan(self, folder_name: str, bd_agro_path: str, folder_mtime: float) -> dict:
+        """
+        Scan a '2_bd_agro' folder and store the result in the manifest.
+        """
+        entry = self.__scan_bd_agro_folder(bd_agro_path)
+        entry['folder_mtime'] = folder_mtime
+        entry['resolution'] = self.resolution
+        self.manifest[folder_name] = entry
+        return entry
+
+    @staticmethod
+    def __stat(path: str | None) -> os.stat_result | None:
+        """
+        Stat a file, or None when there is no path or it cannot be read.
+        """
+        if not path:
+            return None
+        try:
+            return os.stat(path)
+        except OSError:
+            return None
+
+    @staticmethod
+    def __subfolders_changed(entry: dict) -> bool:
+        """
+        Check whether a subfolder scanned with the '2_bd_agro' folder was
+        modified or removed; their changes do not touch its mtime.
+        """
+        for path, mtime in entry.get('subfolders', {}).items():
+            try:
+                if os.stat(path).st_mtime != mtime:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def __scan_bd_agro_folder(self, bd_agro_path: str) -> dict:
+        """
+        List a '2_bd_agro' folder, and its subfolders down to MAX_SCAN_DEPTH
+        levels, and choose its BD_AGRO workbook according to the resolution.
+        Symlinked subfolders are not followed, so a link back to a parent
+        cannot make the scan loop. Excel lock files ('~$...') and files that
+        cannot be read are ignored.
+        """
+        candidates = []
+        subfolders = {}
+        pending = [(bd_agro_path, 0)]
+        while pending:
+            folder, depth = pending.pop()
+            try:
+                entries = list(os.scandir(folder))
+            except OSError:
+                continue
+
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if depth < self.MAX_SCAN_DEPTH:
+                        pending.append((entry.path, depth + 1))
+                        subfolders[entry.path] = entry.stat(follow_symlinks=False).st_mtime
+                    continue
+                if entry.name.startswith('~$'):
+                    continue
+                if entry.name.startswith('BD_AGRO_') and entry.name.endswith('.xlsx'):
+                    try:
+                        candidates.append((entry.path, entry.stat()))
+                    except OSError:
+                        continue
+
+        if not candidates:
+            return {'bd_agro_file': None, 'mtime': None, 'size': None,
+                    'candidates': [], 'subfolders': subfolders}
+
+        if self.resolution == 'filename':
+            def sort_key(candidate):
+                return (self.filename_version(candidate[0]), candidate[1].st_mtime)
+        else:
+            def sort_key(candidate):
+                return candidate[1].st_mtime
+
+        path, stat = max(candidates, key=sort_key)
+        return {
+            'bd_agro_file': path,
+            'mtime': stat.st_mtime,
+            'size': stat.st_size,
+            'candidates': sorted(os.path.basename(candidate[0]) for candidate in candidates),
+            'subfolders': subfolders,
+        }
+
+    @staticmethod
+    def filename_version(bd_agro_file: str) -> tuple[int, ...]:
+        """
+        Version of a BD_AGRO workbook taken from the numbers in its name.
+
+        Dates written as dd_mm_yyyy or dd-mm-yyyy are reordered to
+        (yyyy, mm, dd) so they compare chronologically; any other numbers
+        (v2, 2024_05_10, ...) are compared in the order they appear.
+        """
+        name = os.path.splitext(os.path.basename(bd_agro_file))[0]
+
+        match = re.search(r'(\d{2})[-_.](\d{2})[-_.](\d{4})', name)
+        if match:
+            day, month, year = match.groups()
+            return int(year), int(month), int(day)
+
+        return tuple(int(number) for number in re.findall(r'\d+', name))
+
+    def __load_manifest(self) -> dict:
+        """
+        Load the discovery manifest, starting empty if it is missing or
+        corrupted.
+        """
+        if not self.manifest_file or not os.path.exists(self.manifest_file):
+            return {}
+
+        try:
+            with open(self.manifest_file, encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError) as e:
+            print(f'Manifesto de clientes inválido, recriando: {e}')
+            return {}
+
+    def __save_manifest(self) -> None:
+        """
+        Write the discovery manifest atomically.
+        """
+        if not self.manifest_file:
+            return
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.manifest_file)), exist_ok=True)
+        tmp_file = f'{self.manifest_file}.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as file:
+            json.dump(self.manifest, file, indent=2)
+        os.replace(tmp_file, self.manifest_file)
+
+
+class RunManifest:
+    """
+    Record of the BD_AGRO file chosen for each client in the last
+    successful run, used to detect which clients actually changed.
+
+    Parameters:
+    - manifest_file (str): Path to the run manifest.
+    """
+    def __init__(self, manifest_file: str) -> None:
+        """
+        Initialize the RunManifest object.
+
+        Parameters:
+        - manifest_file (str): Path to the run manifest.
+        """
+        self.manifest_file = manifest_file
+        self.clients = self.__load()
+
+    def changed(self, client_bd_agro: dict) -> bool:
+        """
+        Check whether the chosen BD_AGRO file of a client differs (path, size
+        or mtime) from the one recorded in the last run.
+        """
+        previous = self.clients.get(str(client_bd_agro['client_id']))
+        return previous is None or previous != self.__entry(client_bd_agro)
+
+    def record(self, clients_bd_agro_file: list[dict]) -> None:
+        """
+        Record the chosen files of the given clients and save the manifest.
+        Should be called only after the clients were loaded successfully.
+        """
+        for client_bd_agro in clients_bd_agro_file:
+            self.clients[str(client_bd_agro['client_id'])] = self.__entry(client_bd_agro)
+        self.__save()
+
+    def forget(self, client_ids: list[int]) -> None:
+        """
+        Remove clients from the manifest and save it, so their BD_AGRO is
+        loaded again by the next run even if the file did not change.
+        """
+        for client_id in client_ids:
+            self.clients.pop(str(int(client_id)), None)
+        self.__save()
+
+    def __save(self) -> None:
+        """
+        Write the manifest atomically.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.manifest_file)), exist_ok=True)
+        tmp_file = f'{self.manifest_file}.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as file:
+            json.dump({'run_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       'clients': self.clients}, file, indent=2)
+        os.replace(tmp_file, self.manifest_file)
+
+    @staticmethod
+    def __entry(client_bd_agro: dict) -> dict:
+        """
+        Fields of a client's chosen file kept in the manifest.
+        """
+        return {
+            'bd_agro_file': client_bd_agro['bd_agro_file'],
+            'mtime': client_bd_agro.get('bd_agro_mtime'),
+            'size': client_bd_agro.get('bd_agro_size'),
+        }
+
+    def __load(self) -> dict:
+        """
+        Load the clients of the last run, starting empty if the manifest is
+        missing or corrupted.
+        """
+        if not os.path.exists(self.manifest_file):
+            return {}
+
+        try:
+            with open(self.manifest_file, encoding='utf-8') as file:
+                return json.load(file)['clients']
+        except (OSError, ValueError, KeyError) as e:
+            print(f'Manifesto da execução inválido, recriando: {e}')
+            return {}
@@ -1,126 +1,423 @@
-import os
-import pandas as pd
-
-class CreateBdAgroMerge:
-    """
-    Class for merging and exporting selected clients' BD_AGRO data.
-    """
-
-    def __init__(self, output_file: str, clients_folder: str, export_json_file: bool, selected_client_ids: list[int]) -> None:
-        """
-        Initialize the CreateBdAgroMerge object.
-
-        Parameters:
-        - output_file (str): Path to the output JSON file.
-        - clients_folder (str): Path to the folder containing clients' data.
-        - export_json_file (bool): Flag indicating whether to export the merged data to a JSON file.
-        - selected_client_ids (list[int]): List of client IDs to include in the output.
-        """
-        self.output_file = output_file
-        self.clients_folder = clients_folder
-        self.export_json_file = export_json_file
-        self.selected_client_ids = selected_client_ids
-
-        self.list_clients_to_remove = [
-            '98', '99', '126', 
-            '127', '133', '134', 
-            '137', '139', '140', 
-            '141', '148', '149', 
-            '150', '151', '152', 
-            '154', '155', '999']
-
-    def merge_clients_bd_agro_data(self) -> pd.DataFrame:
-        """
-        Merge clients' BD_AGRO data for selected client IDs.
-
-        Returns:
-        - pd.DataFrame: Merged BD_AGRO data for selected clients.
-        """
-        merged_bd_agro = pd.DataFrame()
-
-        clients_bd_agro_file = self.__get_all_clients_bd_agro()
-
-        for client_bd_agro in clients_bd_agro_file:
-            client_id = int(client_bd_agro['client_id'])
-
-            # Only process selected client IDs
-            if client_id not in self.selected_client_ids:
-                continue
-
-            client_name = str(client_bd_agro['client_name'])
-            print(f'Abrindo BD_AGRO do cliente: {client_name}')
-            bd_agro = pd.read_excel(client_bd_agro['bd_agro_file'])
-
-            bd_agro['client_id'] = client_id
-            bd_agro['client_name'] = client_name
-
-            merged_bd_agro = pd.concat(
-                [merged_bd_agro, bd_agro], ignore_index=True)
-
-        if self.export_json_file:
-            print("\nGerando arquivo JSON...")
-            merged_bd_agro.to_json(self.output_file, orient='records', lines=True)
-            print(f"\n----- JSON exportado para: {self.output_file} -----")
-
-        return merged_bd_agro
-
-    def __get_all_clients_bd_agro(self) -> list[dict[str, str]]:
-        """
-        Get information about all clients' BD_AGRO files.
-
-        Returns:
-        - list[dict[str, str]]: List of dictionaries containing information about BD_AGRO files.
-        """
-        clients_bd_agro_file = []
-
-        clients_bd_agro_folder = self.__get_all_clients_bd_agro_folder()
-
-        for client_bd_agro_folder in clients_bd_agro_folder:
-            bd_agro_file = self.__find_bd_agro_file(client_bd_agro_folder)
-
-            if bd_agro_file:
-                clients_bd_agro_file.append(bd_agro_file)
-
-        return clients_bd_agro_file
-
-    def __find_bd_agro_file(self, client_bd_agro_folder: str) -> dict[str, str]:
-        """
-        Find BD_AGRO file in the given client's folder.
-
-        Parameters:
-        - client_bd_agro_folder (str): Path to the client's BD_AGRO folder.
-
-        Returns:
-        - dict[str, str]: Dictionary containing information about the BD_AGRO file.
-        """
-        folder_name = os.path.basename(client_bd_agro_folder)
-        client_id = int(folder_name.split('_')[0])  # Extract ID from folder name
-        client_name = folder_name.split('_')[1]  # Extract name from folder name
-
-        bd_agro_path = os.path.join(client_bd_agro_folder, "2_bd_agro")
-        if not os.path.exists(bd_agro_path):
-            print(f'Pasta "2_bd_agro" não encontrada para o cliente: {client_name}')
-            return {}
-
-        for file in os.listdir(bd_agro_path):
-            if file.startswith('BD_AGRO_') and file.endswith('.xlsx'):
-                return {
-                    "client_id": client_id,
-                    "client_name": client_name,
-                    "bd_agro_file": os.path.join(bd_agro_path, file)
-                }
-
-        print(f'Arquivo BD_AGRO do cliente não foi encontrado: {client_name}')
-        return {}
-
-    def __get_all_clients_bd_agro_folder(self) -> list[str]:
-        """
-        Get a list of paths to all clients' BD_AGRO folders.
-
-        Returns:
-        - list[str]: List of paths to BD_AGRO folders.
-        """
-        return [os.path.join(self.clients_folder, client_folder)
-                for client_folder in os.listdir(self.clients_folder)
-                if client_folder.split('_')[0].isdigit()  # Ensure the folder starts with a number (ID)
-                and client_folder.split('_')[0] not in self.list_clients_to_remove]
+import os
+import time
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from bd_agro_cache import BdAgroCache, normalize_dtypes
+from bd_agro_dedup import deduplicate_bd_agro
+from bd_agro_schema import project_workbook_columns, resolve_header
+from client_discovery import ClientDiscovery, RunManifest
+from exporters import get_exporter
+from instrumentation import frame_bytes, record, stage
+
+
+def read_client_bd_agro(
+        client_bd_agro: dict,
+        project_columns: bool = True,
+        sheet_name: str | int = 0) -> tuple[dict, pd.DataFrame, float]:
+    """
+    Read a single client's BD_AGRO workbook.
+
+    Defined at module level so it can be pickled and sent to worker
+    processes. The dtypes are normalized as in the cache (normalize_dtypes),
+    so the data does not depend on whether it was cached.
+
+    Parameters:
+    - client_bd_agro (dict): Client information returned by the file lookup.
+    - project_columns (bool, optional): Keep only the schema columns, with
+      headers matched through the schema aliases. openpyxl still reads
+      every cell, so this shrinks the DataFrame, not the parse time.
+      Defaults to True.
+    - sheet_name (str | int, optional): Sheet to read. Defaults to the first.
+
+    Returns:
+    - tuple[dict, pd.DataFrame, float]: Client information, parsed data and
+      elapsed time in seconds.
+    """
+    start = time.perf_counter()
+
+    if project_columns:
+        bd_agro = project_workbook_columns(pd.read_excel(
+            client_bd_agro['bd_agro_file'],
+            sheet_name=sheet_name,
+            usecols=lambda header: resolve_header(header) is not None))
+    else:
+        bd_agro = pd.read_excel(
+            client_bd_agro['bd_agro_file'], sheet_name=sheet_name)
+
+    bd_agro['client_id'] = int(client_bd_agro['client_id'])
+    bd_agro['client_name'] = str(client_bd_agro['client_name'])
+
+    return client_bd_agro, normalize_dtypes(bd_agro), time.perf_counter() - start
+
+
+def concat_bd_agro(frames: list[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Concatenate clients' BD_AGRO frames in a single pass.
+
+    Categorical columns get the union of their categories applied to every
+    frame beforehand, so the result keeps the category dtype instead of
+    falling back to object.
+
+    Parameters:
+    - frames (list[pd.DataFrame]): BD_AGRO data, one frame per client.
+
+    Returns:
+    - pd.DataFrame: Concatenated BD_AGRO data.
+    """
+    if not frames:
+        return pd.DataFrame()
+
+    categorical_columns = {
+        column
+        for frame in frames
+        for column, dtype in frame.dtypes.items()
+        if isinstance(dtype, pd.CategoricalDtype)}
+
+    for column in categorical_columns:
+        union = union_categoricals(
+            [frame[column].astype('category') for frame in frames
+             if column in frame.columns],
+            ignore_order=True)
+        dtype = pd.CategoricalDtype(union.categories)
+
+        frames = [
+            frame.assign(**{column: frame[column].astype(dtype)})
+            if column in frame.columns else frame
+            for frame in frames]
+
+    return pd.concat(frames, ignore_index=True, copy=False)
+
+
+class CreateBdAgroMerge:
+    """
+    Class for merging and exporting selected clients' BD_AGRO data.
+    """
+
+    def __init__(
+            self,
+            output_file: str,
+            clients_folder: str,
+            export_json_file: bool,
+            selected_client_ids: list[int],
+            max_workers: int = 1,
+            cache_dir: str | None = None,
+            export_format: str = 'jsonl',
+            manifest_file: str | None = None,
+            resolution: str = 'mtime',
+            run_manifest_file: str | None = None,
+            only_changed: bool = False,
+            project_columns: bool = True,
+            dedup_keep: str | None = 'latest_dt_corte') -> None:
+        """
+        Initialize the CreateBdAgroMerge object.
+
+        Parameters:
+        - output_file (str): Path to the output JSON file.
+        - clients_folder (str): Path to the folder containing clients' data.
+        - export_json_file (bool): Flag indicating whether to export the merged data to a JSON file.
+        - selected_client_ids (list[int]): List of client IDs to include in the output.
+        - max_workers (int, optional): Number of processes used to parse the
+          workbooks. 1 keeps the sequential loading. Defaults to 1.
+        - cache_dir (str, optional): Folder of the parsed-workbook cache.
+          Unchanged workbooks are read from the cache instead of being parsed
+          again. Defaults to None (no cache).
+        - export_format (str, optional): Format of the exported file:
+          'jsonl', 'json', 'parquet' or 'feather'. Defaults to 'jsonl'.
+        - manifest_file (str, optional): Path to the client folder discovery
+          manifest, which lets repeat runs skip unchanged folders. Defaults
+          to None (no manifest).
+        - resolution (str, optional): How to choose among several BD_AGRO
+          workbooks of a client: 'mtime' or 'filename'. Defaults to 'mtime'.
+        - run_manifest_file (str, optional): Path to the manifest recording
+          the BD_AGRO file chosen for each client in the last run. Defaults
+          to None (no run manifest).
+        - only_changed (bool, optional): Skip clients whose chosen BD_AGRO
+          file is the same as in the run manifest. Defaults to False.
+        - project_columns (bool, optional): Keep only the schema columns of
+          the workbooks, mapping renamed headers through the schema aliases.
+          Defaults to True.
+        - dedup_keep (str, optional): Keep-policy for rows repeated on
+          (client_id, CHAVE, SAFRA): 'latest_dt_corte', 'max_area_bd' or
+          'last'. None keeps every row. Defaults to 'latest_dt_corte'.
+        """
+        self.output_file = output_file
+        self.clients_folder = clients_folder
+        self.export_json_file = export_json_file
+        self.selected_client_ids = selected_client_ids
+        self.max_workers = max_workers
+        self.project_columns = project_columns
+        self.cache = BdAgroCache(
+            cache_dir, variant=f'projected={project_columns}') if cache_dir else None
+        self.export_format = export_format
+        self.run_manifest = RunManifest(run_manifest_file) if run_manifest_file else None
+        self.only_changed = only_changed
+        self.dedup_keep = dedup_keep
+
+        # Per-client loading report, filled by merge_clients_bd_agro_data
+        self.client_timings: dict[int, float] = {}
+        self.failed_clients: dict[int, str] = {}
+        self.loaded_clients: list[dict] = []
+        self.duplicates_removed: dict[int, int] = {}
+
+        self.list_clients_to_remove = [
+            '98', '99', '126', 
+            '127', '133', '134', 
+            '137', '139', '140', 
+            '141', '148', '149', 
+            '150', '151', '152', 
+            '154', '155', '999']
+
+        self.discovery = ClientDiscovery(
+            clients_folder=clients_folder,
+            clients_to_remove=self.list_clients_to_remove,
+            manifest_file=manifest_file,
+            resolution=resolution)
+
+    def merge_clients_bd_agro_data(self) -> pd.DataFrame:
+        """
+        Merge clients' BD_AGRO data for selected client IDs.
+
+        Returns:
+        - pd.DataFrame: Merged BD_AGRO data for selected clients.
+        """
+        clients_bd_agro_file = self.__get_selected_clients_bd_agro()
+
+        self.client_timings = {}
+        self.failed_clients = {}
+        self.loaded_clients = []
+        self.duplicates_removed = {}
+
+        # Collect every client first and concatenate once, instead of
+        # re-copying the growing frame for each client
+        frames = self.__load_clients_bd_agro(clients_bd_agro_file)
+        with stage('concat') as metrics:
+            merged_bd_agro = concat_bd_agro(frames)
+            metrics['rows'] = len(merged_bd_agro)
+            metrics['bytes'] = frame_bytes(merged_bd_agro)
+
+        merged_bd_agro = self.__deduplicate(merged_bd_agro)
+
+        if self.failed_clients:
+            print(f'\n{len(self.failed_clients)} cliente(s) com erro: '
+                  f'{sorted(self.failed_clients)}')
+
+        if self.export_json_file:
+            print(f"\nGerando arquivo {self.export_format}...")
+            with stage('export', format=self.export_format) as metrics:
+                with get_exporter(self.output_file, self.export_format) as exporter:
+                    # One chunk (Parquet row group) per client
+                    exporter.write_groups(merged_bd_agro, 'client_id')
+                metrics['rows'] = exporter.rows
+                metrics['bytes'] = os.path.getsize(self.output_file)
+            print(f"\n----- Arquivo exportado para: {self.output_file} -----")
+
+        return merged_bd_agro
+
+    def iter_clients_bd_agro_data(self) -> Iterator[tuple[dict, pd.DataFrame]]:
+        """
+        Yield the BD_AGRO data of the selected clients one client at a time,
+        so only one client's workbook is kept in memory. Nothing is exported.
+
+        Clients whose workbook cannot be read are recorded in failed_clients
+        and skipped.
+
+        Yields:
+        - tuple[dict, pd.DataFrame]: Client's BD_AGRO file information and
+          data.
+        """
+        self.client_timings = {}
+        self.failed_clients = {}
+        self.loaded_clients = []
+        self.duplicates_removed = {}
+
+        for client_bd_agro in self.__get_selected_clients_bd_agro():
+            bd_agro = self.__read_from_cache(client_bd_agro)
+
+            if bd_agro is None:
+                print(f'Abrindo BD_AGRO do cliente: {client_bd_agro["client_name"]}')
+                try:
+                    _, bd_agro, elapsed = read_client_bd_agro(
+                        client_bd_agro, self.project_columns)
+                except Exception as e:
+                    self.__register_failure(client_bd_agro, e)
+                    continue
+                self.__register_timing(client_bd_agro, bd_agro, elapsed)
+                self.__write_to_cache(client_bd_agro, bd_agro)
+
+            self.loaded_clients.append(client_bd_agro)
+            yield client_bd_agro, self.__deduplicate(
+                bd_agro, int(client_bd_agro['client_id']))
+
+    def record_run(self, clients_bd_agro_file: list[dict] | None = None) -> None:
+        """
+        Record the BD_AGRO files of the loaded clients in the run manifest.
+        Call it once their data was written, so a failed run is retried.
+
+        Parameters:
+        - clients_bd_agro_file (list[dict], optional): Clients to record.
+          Defaults to every client loaded by the last merge.
+        """
+        if self.run_manifest is not None:
+            self.run_manifest.record(
+                self.loaded_clients if clients_bd_agro_file is None
+                else clients_bd_agro_file)
+
+    def __get_selected_clients_bd_agro(self) -> list[dict]:
+        """
+        Get the BD_AGRO file information of the selected client IDs. Other
+        clients' folders are not listed. With only_changed, clients whose
+        chosen file did not change since the last recorded run are skipped.
+        """
+        with stage('discovery') as metrics:
+            clients_bd_agro_file = self.discovery.find_clients_bd_agro(
+                self.selected_client_ids)
+            metrics['rows'] = len(clients_bd_agro_file)
+
+        if self.only_changed and self.run_manifest is not None:
+            changed = [
+                client_bd_agro for client_bd_agro in clients_bd_agro_file
+                if self.run_manifest.changed(client_bd_agro)]
+            skipped = len(clients_bd_agro_file) - len(changed)
+            if skipped:
+                print(f'{skipped} cliente(s) sem alteração no BD_AGRO ignorado(s).')
+            clients_bd_agro_file = changed
+
+        return clients_bd_agro_file
+
+    def __load_clients_bd_agro(
+            self, clients_bd_agro_file: list[dict]) -> list[pd.DataFrame]:
+        """
+        Read the BD_AGRO workbooks of the given clients, sequentially or in a
+        process pool depending on max_workers.
+
+        Workbooks found in the cache are not parsed again. Clients whose
+        workbook cannot be read are recorded in failed_clients and skipped.
+        The result keeps the order of clients_bd_agro_file.
+
+        Parameters:
+        - clients_bd_agro_file (list[dict]): Clients' BD_AGRO file information.
+
+        Returns:
+        - list[pd.DataFrame]: Parsed BD_AGRO data, one frame per client.
+        """
+        loaded = {}
+        to_parse = []
+
+        for position, client_bd_agro in enumerate(clients_bd_agro_file):
+            cached = self.__read_from_cache(client_bd_agro)
+            if cached is None:
+                to_parse.append((position, client_bd_agro))
+            else:
+                loaded[position] = cached
+
+        if self.max_workers > 1 and len(to_parse) > 1:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {}
+                for position, client_bd_agro in to_parse:
+                    print(f'Abrindo BD_AGRO do cliente: {client_bd_agro["client_name"]}')
+                    future = executor.submit(
+                        read_client_bd_agro, client_bd_agro,
+                        self.project_columns)
+                    futures[future] = (position, client_bd_agro)
+
+                for future in as_completed(futures):
+                    position, client_bd_agro = futures[future]
+                    try:
+                        _, bd_agro, elapsed = future.result()
+                    except Exception as e:
+                        self.__register_failure(client_bd_agro, e)
+                        continue
+                    self.__register_timing(client_bd_agro, bd_agro, elapsed)
+                    self.__write_to_cache(client_bd_agro, bd_agro)
+                    loaded[position] = bd_agro
+        else:
+            for position, client_bd_agro in to_parse:
+                print(f'Abrindo BD_AGRO do cliente: {client_bd_agro["client_name"]}')
+                try:
+                    _, bd_agro, elapsed = read_client_bd_agro(
+                        client_bd_agro, self.project_columns)
+                except Exception as e:
+                    self.__register_failure(client_bd_agro, e)
+                    continue
+                self.__register_timing(client_bd_agro, bd_agro, elapsed)
+                self.__write_to_cache(client_bd_agro, bd_agro)
+                loaded[position] = bd_agro
+
+        self.loaded_clients = [
+            clients_bd_agro_file[position] for position in sorted(loaded)]
+        return [loaded[position] for position in sorted(loaded)]
+
+    def __deduplicate(
+            self, bd_agro: pd.DataFrame, client_id: int | None = None) -> pd.DataFrame:
+        """
+        Drop the rows repeated on (client_id, CHAVE, SAFRA) with the
+        dedup_keep policy, counting the removed rows per client.
+        """
+        if self.dedup_keep is None:
+            return bd_agro
+
+        with stage('dedup', client_id, policy=self.dedup_keep) as metrics:
+            deduplicated, removed = deduplicate_bd_agro(bd_agro, self.dedup_keep)
+            metrics['rows'] = len(deduplicated)
+            metrics['removed'] = removed
+
+        if removed:
+            counts = bd_agro['client_id'].value_counts().sub(
+                deduplicated['client_id'].value_counts(), fill_value=0)
+            for removed_client_id, count in counts[counts > 0].items():
+                self.duplicates_removed[int(removed_client_id)] = int(count)
+            print(f'{removed} linha(s) repetida(s) em (client_id, CHAVE, SAFRA) '
+                  f'removida(s) ({self.dedup_keep}).')
+
+        return deduplicated
+
+    def __read_from_cache(self, client_bd_agro: dict) -> pd.DataFrame | None:
+        """
+        Get a client's BD_AGRO data from the cache, if enabled and valid.
+        """
+        if self.cache is None:
+            return None
+
+        start = time.perf_counter()
+        bd_agro = self.cache.get(client_bd_agro['bd_agro_file'])
+
+        if bd_agro is not None:
+            elapsed = time.perf_counter() - start
+            self.client_timings[int(client_bd_agro['client_id'])] = elapsed
+            record('cache_read', elapsed, int(client_bd_agro['client_id']),
+                   rows=len(bd_agro), bytes=frame_bytes(bd_agro))
+            print(f'BD_AGRO do cliente {client_bd_agro["client_name"]} lido do '
+                  f'cache em {elapsed:.2f}s ({len(bd_agro)} linhas)')
+
+        return bd_agro
+
+    def __write_to_cache(self, client_bd_agro: dict, bd_agro: pd.DataFrame) -> None:
+        """
+        Store a client's freshly parsed BD_AGRO data in the cache, if enabled.
+        """
+        if self.cache is not None:
+            self.cache.put(client_bd_agro['bd_agro_file'], bd_agro)
+
+    def __register_timing(
+            self, client_bd_agro: dict, bd_agro: pd.DataFrame, elapsed: float) -> None:
+        """
+        Record and print the loading time of a client.
+        """
+        self.client_timings[int(client_bd_agro['client_id'])] = elapsed
+        record('read', elapsed, int(client_bd_agro['client_id']),
+               rows=len(bd_agro), bytes=frame_bytes(bd_agro),
+               file_bytes=client_bd_agro.get('bd_agro_size'))
+        print(f'BD_AGRO do cliente {client_bd_agro["client_name"]} lido em '
+              f'{elapsed:.2f}s ({len(bd_agro)} linhas)')
+
+    def __register_failure(self, client_bd_agro: dict, error: Exception) -> None:
+        """
+        Record and print a client whose BD_AGRO could not be read.
+        """
+        self.failed_clients[int(client_bd_agro['client_id'])] = str(error)
+        print(f'Erro ao abrir BD_AGRO do cliente '
+              f'{client_bd_agro["client_name"]}: {error}')
@@ -1,86 +1,540 @@
-import psycopg2
-from psycopg2.extras import execute_values
-
-class DatabaseManager:
-    """
-    Classe para gerenciar a conexão e operações no banco de dados PostgreSQL.
-    """
-
-    def __init__(self, config):
-        """
-        Inicializa a classe DatabaseManager.
-
-        Parameters:
-        - config (dict): Configuração do banco de dados (dbname, user, password, host, port).
-        """
-        self.config = config
-
-    def connect(self):
-        """
-        Conecta ao banco de dados PostgreSQL.
-        """
-        try:
-            conn = psycopg2.connect(**self.config)
-            return conn
-        except Exception as e:
-            print(f"Erro ao conectar ao banco de dados: {e}")
-            raise
-
-    def delete_rows_by_client_ids(self, schema, table, client_ids):
-        """
-        Exclui linhas na tabela que correspondem aos IDs fornecidos.
-
-        Parameters:
-        - schema (str): Schema do banco de dados.
-        - table (str): Nome da tabela.
-        - client_ids (list): Lista de IDs de clientes a serem excluídos.
-        """
-        query = f"DELETE FROM {schema}.{table} WHERE client_id = ANY(%s)"
-        try:
-            conn = self.connect()
-            with conn.cursor() as cursor:
-                cursor.execute(query, (client_ids,))
-                print(f"{cursor.rowcount} linhas excluídas da tabela {table}.")
-            conn.commit()
-        except Exception as e:
-            print(f"Erro ao excluir linhas: {e}")
-        finally:
-            conn.close()
-    
-    def insert_data(self, schema, table, data_frame, data_types):
-        """
-        Insere dados no banco a partir de um DataFrame.
-
-        Parameters:
-            - schema (str): Schema do banco de dados.
-            - table (str): Nome da tabela.
-            - data_frame (pd.DataFrame): Dados a serem inseridos.
-            - data_types (dict): Dicionário de tipos de dados para validação.
-        """
-        try:
-            # Certifique-se de que o DataFrame contém todas as colunas necessárias
-            required_columns = list(data_types.keys())
-            for column in required_columns:
-                if column not in data_frame.columns:
-                    data_frame[column] = None  # Adicione a coluna ausente com valores padrão
-
-            conn = self.connect()
-            with conn.cursor() as cursor:
-                columns = required_columns
-                values = data_frame[columns].fillna(None).to_dict(orient="records")
-                
-                # Gera a query dinâmica para inserção
-                columns_str = ", ".join(columns)
-                placeholders = ", ".join(["%s"] * len(columns))
-                query = f"INSERT INTO {schema}.{table} ({columns_str}) VALUES ({placeholders})"
-                
-                # Insere os valores
-                execute_values(cursor, query, [tuple(row.values()) for row in values])
-                print(f"{cursor.rowcount} linhas inseridas na tabela {table}.")
-            
-            conn.commit()
-        except Exception as e:
-            print(f"Erro ao inserir dados: {e}")
-        finally:
-            conn.close()
-
+import io
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
+
+from bd_agro_schema import NUMERIC_DTYPES, SQL_TYPES
+from instrumentation import stage
+
+# Colunas compactas (float32), comparadas em float32 no sync_data
+_FLOAT32_COLUMNS = {
+    column.lower() for column, dtype in NUMERIC_DTYPES.items() if dtype == "float32"}
+
+_pools = {}
+_engines = {}
+_registry_lock = threading.Lock()
+
+
+def _config_key(config):
+    """
+    Chave usada para compartilhar pools entre objetos com a mesma configuração.
+    """
+    return tuple(sorted((key, str(value)) for key, value in config.items()))
+
+
+def get_pool(config, min_size=1, max_size=5):
+    """
+    Retorna o pool de conexões psycopg2 da configuração, criando-o na
+    primeira chamada. DatabaseManager, add_group_to_json e DataBase
+    compartilham o mesmo pool quando usam a mesma configuração.
+
+    Parameters:
+    - config (dict): Configuração do banco de dados (dbname, user, password, host, port).
+    - min_size (int): Conexões mantidas abertas. Usado só na criação do pool.
+    - max_size (int): Máximo de conexões simultâneas. Usado só na criação do pool.
+
+    Returns:
+    - ThreadedConnectionPool: Pool de conexões.
+    """
+    key = _config_key(config)
+    with _registry_lock:
+        if key not in _pools:
+            _pools[key] = ThreadedConnectionPool(min_size, max_size, **config)
+        return _pools[key]
+
+
+def get_engine(config, pool_size=5):
+    """
+    Retorna a engine SQLAlchemy da configuração, criando-a na primeira
+    chamada, para não abrir uma engine nova a cada operação.
+
+    Parameters:
+    - config (dict): Configuração do banco de dados (dbname, user, password, host, port).
+    - pool_size (int): Tamanho do pool da engine. Usado só na criação.
+
+    Returns:
+    - sqlalchemy.engine.base.Engine: Engine SQLAlchemy.
+    """
+    from sqlalchemy import create_engine
+
+    key = _config_key(config)
+    with _registry_lock:
+        if key not in _engines:
+            _engines[key] = create_engine(
+                f"postgresql://{config['user']}:{config['password']}@"
+                f"{config['host']}:{config['port']}/{config['dbname']}",
+                pool_size=pool_size)
+        return _engines[key]
+
+
+def close_pools():
+    """
+    Fecha todos os pools e engines abertos.
+    """
+    with _registry_lock:
+        for pool in _pools.values():
+            pool.closeall()
+        for engine in _engines.values():
+            engine.dispose()
+        _pools.clear()
+        _engines.clear()
+
+
+class DatabaseManager:
+    """
+    Classe para gerenciar a conexão e operações no banco de dados PostgreSQL.
+    """
+
+    def __init__(self, config, min_size=1, max_size=5):
+        """
+        Inicializa a classe DatabaseManager.
+
+        Parameters:
+        - config (dict): Configuração do banco de dados (dbname, user, password, host, port).
+        - min_size (int): Conexões mínimas do pool. Padrão 1.
+        - max_size (int): Conexões máximas do pool. Padrão 5.
+        """
+        self.config = config
+        self.min_size = min_size
+        self.max_size = max_size
+        self._transaction_conn = None
+        self._transaction_failed = False
+
+    @property
+    def pool(self):
+        """
+        Pool de conexões compartilhado desta configuração.
+        """
+        return get_pool(self.config, self.min_size, self.max_size)
+
+    def connect(self):
+        """
+        Conecta ao banco de dados PostgreSQL.
+
+        Abre uma conexão avulsa, fora do pool; quem chama deve fechá-la.
+        Prefira connection() ou transaction().
+        """
+        try:
+            conn = psycopg2.connect(**self.config)
+            return conn
+        except Exception as e:
+            print(f"Erro ao conectar ao banco de dados: {e}")
+            raise
+
+    @contextmanager
+    def connection(self):
+        """
+        Fornece uma conexão do pool e faz commit ao final (ou rollback em
+        caso de erro), devolvendo-a ao pool.
+
+        Dentro de transaction(), fornece a conexão da transação e deixa o
+        commit para ela.
+        """
+        if self._transaction_conn is not None:
+            try:
+                yield self._transaction_conn
+            except Exception:
+                self._transaction_failed = True
+                raise
+            return
+
+        with self.own_connection() as conn:
+            yield conn
+
+    @contextmanager
+    def own_connection(self):
+        """
+        Fornece uma conexão do pool com commit próprio, mesmo dentro de
+        transaction(). O que é feito nela não participa da transação
+        aberta: um erro não a marca como falha e um rollback dela não
+        desfaz o que foi gravado aqui.
+        """
+        try:
+            conn = self.pool.getconn()
+        except Exception as e:
+            print(f"Erro ao conectar ao banco de dados: {e}")
+            raise
+
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.pool.putconn(conn)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Executa as operações do bloco em uma única conexão e transação.
+        Se alguma operação falhar, mesmo que o erro seja tratado por ela,
+        nada é gravado.
+
+        Exemplo:
+            with db_manager.transaction():
+                db_manager.delete_rows_by_client_ids(...)
+                db_manager.insert_data(...)
+        """
+        if self._transaction_conn is not None:
+            raise RuntimeError("Já existe uma transação aberta neste DatabaseManager.")
+
+        conn = self.pool.getconn()
+        self._transaction_conn = conn
+        self._transaction_failed = False
+        try:
+            yield conn
+            if self._transaction_failed:
+                raise RuntimeError("Uma operação da transação falhou; alterações desfeitas.")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._transaction_conn = None
+            self.pool.putconn(conn)
+
+    def delete_rows_by_client_ids(self, schema, table, client_ids):
+        """
+        Exclui linhas na tabela que correspondem aos IDs fornecidos.
+
+        Parameters:
+        - schema (str): Schema do banco de dados.
+        - table (str): Nome da tabela.
+        - client_ids (list): Lista de IDs de clientes a serem excluídos.
+        """
+        query = f"DELETE FROM {schema}.{table} WHERE client_id = ANY(%s)"
+        try:
+            with stage("db_delete", table=table) as metrics, self.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(query, (client_ids,))
+                    metrics["rows"] = cursor.rowcount
+                    print(f"{cursor.rowcount} linhas excluídas da tabela {table}.")
+        except Exception as e:
+            print(f"Erro ao excluir linhas: {e}")
+            raise
+
+    def get_group_map(self, client_ids):
+        """
+        Busca o nome do grupo de cada cliente.
+
+        Parameters:
+        - client_ids (list): IDs dos clientes.
+
+        Returns:
+        - dict: Mapeamento de client_id para o nome do grupo.
+        """
+        query_client_group = """
+        SELECT c.id AS client_id, g.nome AS grupo_nome
+        FROM clientes c
+        INNER JOIN cliente_grupo g ON c.grupo_id = g.id
+        WHERE c.id = ANY(%s)
+        """
+        with self.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(query_client_group, (list(client_ids),))
+                return {row[0]: row[1] for row in cursor.fetchall()}
+
+    def insert_data(self, schema, table, data_frame, data_types, method="copy"):
+        """
+        Insere dados no banco a partir de um DataFrame.
+
+        Parameters:
+            - schema (str): Schema do banco de dados.
+            - table (str): Nome da tabela.
+            - data_frame (pd.DataFrame): Dados a serem inseridos.
+            - data_types (dict): Dicionário de tipos de dados para validação.
+            - method (str): "copy" envia os dados com COPY ... FROM STDIN;
+              "values" usa o INSERT com execute_values. Padrão "copy".
+
+        Erros são propagados: valide os dados antes (ImproveBdAgro), para
+        que uma linha inválida não derrube a carga.
+        """
+        try:
+            # Certifique-se de que o DataFrame contém todas as colunas necessárias
+            data_frame = self.__with_required_columns(data_frame, data_types)
+
+            with stage("db_insert", table=table, method=method) as metrics, \
+                    self.connection() as conn:
+                with conn.cursor() as cursor:
+                    rowcount = self.__insert_rows(
+                        cursor, schema, table, data_frame, data_types, method)
+                    metrics["rows"] = rowcount
+                    print(f"{rowcount} linhas inseridas na tabela {table}.")
+        except Exception as e:
+            print(f"Erro ao inserir dados: {e}")
+            raise
+
+    def sync_data(self, schema, table, data_frame, data_types,
+                  key_columns=("client_id", "CHAVE", "SAFRA"), method="copy",
+                  client_ids=None, protected_keys=None):
+        """
+        Sincroniza incrementalmente a tabela com o DataFrame, em vez de
+        excluir e reinserir todas as linhas dos clientes.
+
+        As linhas são comparadas pela chave (client_id, CHAVE, SAFRA) e por
+        um hash do conteúdo normalizado. Somente as chaves novas, alteradas
+        ou removidas são tocadas: as removidas e alteradas são excluídas e as
+        novas e alteradas são inseridas, tudo em uma única transação. Chaves
+        ausentes do DataFrame só são removidas para os client_ids
+        sincronizados, e nunca as de protected_keys (por exemplo, linhas
+        rejeitadas na validação, cuja cópia anterior no banco é mantida).
+
+        Parameters:
+            - schema (str): Schema do banco de dados.
+            - table (str): Nome da tabela.
+            - data_frame (pd.DataFrame): Dados atualizados dos clientes.
+            - data_types (dict): Dicionário de tipos de dados das colunas.
+            - key_columns (tuple): Colunas que identificam uma linha.
+            - method (str): Forma de inserção, "copy" ou "values".
+            - client_ids (list, optional): Clientes sincronizados. Padrão: os
+              client_ids presentes no DataFrame. Informe-os para que um
+              cliente sem nenhuma linha válida também seja sincronizado.
+            - protected_keys (pd.DataFrame, optional): Chaves (colunas de
+              key_columns) que não são excluídas mesmo ausentes do DataFrame.
+
+        Returns:
+            - dict: Quantidade de chaves inseridas, atualizadas e excluídas.
+        """
+        # pandas só é carregado por quem sincroniza, não por comandos que
+        # apenas excluem clientes ou consultam grupos
+        import pandas as pd
+
+        key_columns = list(key_columns)
+        columns = list(data_types.keys())
+        data_frame = self.__with_required_columns(data_frame, data_types)
+        if client_ids is None:
+            client_ids = pd.to_numeric(data_frame["client_id"]).dropna().unique()
+        client_ids = [int(client_id) for client_id in client_ids]
+        key_types = {column: data_types[column] for column in key_columns}
+
+        try:
+            with stage("db_sync", table=table, method=method) as metrics, \
+                    self.connection() as conn:
+                metrics["rows"] = len(data_frame)
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        f"SELECT {', '.join(columns)} FROM {schema}.{table} "
+                        f"WHERE client_id = ANY(%s)", (client_ids,))
+                    existing = pd.DataFrame(cursor.fetchall(), columns=columns)
+
+                    incoming_norm = self.__normalize(data_frame[columns], data_types)
+                    existing_norm = self.__normalize(existing, data_types)
+
+                    incoming_keys = self.__key_fingerprints(incoming_norm, key_columns)
+                    existing_keys = self.__key_fingerprints(existing_norm, key_columns)
+
+                    joined = incoming_keys.join(
+                        existing_keys, how="outer", lsuffix="_new", rsuffix="_old")
+                    new = joined["count_old"].isna()
+                    removed = joined["count_new"].isna()
+                    if protected_keys is not None and len(protected_keys):
+                        protected = pd.MultiIndex.from_frame(self.__normalize(
+                            protected_keys[key_columns], key_types))
+                        removed &= ~joined.index.isin(protected)
+                    changed = ~new & ~removed & (
+                        (joined["hash_new"] != joined["hash_old"])
+                        | (joined["count_new"] != joined["count_old"]))
+
+                    keys_to_delete = joined.index[changed | removed]
+                    keys_to_insert = joined.index[new | changed]
+
+                    if len(keys_to_delete):
+                        key_names = [column.lower() for column in key_columns]
+                        # Igualdade simples, para que o índice (client_id,
+                        # chave, safra) e a poda de partições sejam usados:
+                        # IS NOT DISTINCT FROM impede ambos. client_id nunca é
+                        # nulo; chave e safra podem ser
+                        conditions = " AND ".join(
+                            f"t.{name} = k.{name}" if name == "client_id" else
+                            f"(t.{name} = k.{name} OR (t.{name} IS NULL AND k.{name} IS NULL))"
+                            for name in key_names)
+                        clients_filter = cursor.mogrify(
+                            "t.client_id = ANY(%s)", (client_ids,)).decode()
+                        # Cada coluna do VALUES recebe o tipo da tabela: uma
+                        # coluna só com NULL ficaria sem tipo na comparação
+                        template = "(" + ", ".join(
+                            f"%s::{SQL_TYPES[key_types[column]]}"
+                            for column in key_columns) + ")"
+                        execute_values(
+                            cursor,
+                            f"DELETE FROM {schema}.{table} AS t "
+                            f"USING (VALUES %s) AS k({', '.join(key_names)}) "
+                            f"WHERE {clients_filter} AND {conditions}",
+                            [tuple(self.__to_python(value) for value in key)
+                             for key in keys_to_delete],
+                            template=template)
+
+                    if len(keys_to_insert):
+                        rows_to_insert = pd.MultiIndex.from_frame(
+                            incoming_norm[key_columns]).isin(keys_to_insert)
+                        self.__insert_rows(
+                            cursor, schema, table,
+                            data_frame[rows_to_insert], data_types, method)
+        except Exception as e:
+            print(f"Erro ao sincronizar dados: {e}")
+            raise
+
+        summary = {
+            "inseridas": int(new.sum()),
+            "atualizadas": int(changed.sum()),
+            "excluidas": int(removed.sum()),
+        }
+        print(f"Sincronização da tabela {table}: {summary['inseridas']} chaves "
+              f"novas, {summary['atualizadas']} alteradas, "
+              f"{summary['excluidas']} excluídas.")
+        return summary
+
+    @staticmethod
+    def __with_required_columns(data_frame, data_types):
+        """
+        Retorna o DataFrame com todas as colunas de data_types, adicionando
+        as ausentes com valores nulos.
+        """
+        missing = [column for column in data_types if column not in data_frame.columns]
+        if missing:
+            data_frame = data_frame.assign(**{column: None for column in missing})
+        return data_frame
+
+    @classmethod
+    def __insert_rows(cls, cursor, schema, table, data_frame, data_types, method="copy"):
+        """
+        Insere as linhas do DataFrame usando o cursor informado.
+
+        Returns:
+            - int: Quantidade de linhas inseridas.
+        """
+        columns = list(data_types.keys())
+        if method == "copy":
+            data_frame = cls.__integers_for_copy(data_frame[columns], data_types)
+            return cls.__copy_rows(cursor, schema, table, data_frame, columns)
+        if method == "values":
+            return cls.__values_rows(cursor, schema, table, data_frame, columns)
+        raise ValueError(f"Método de inserção desconhecido: {method}")
+
+    @staticmethod
+    def __integers_for_copy(data_frame, data_types):
+        """
+        Converte para Int64 as colunas inteiras de um DataFrame não tipado,
+        em que os números inteiros chegam como float ("111.0"), formato que
+        o COPY recusa em colunas integer. Valores não inteiros ficam como
+        estão, para que o banco os rejeite como no INSERT.
+        """
+        import pandas as pd
+
+        converted = {}
+        for column, data_type in data_types.items():
+            values = data_frame[column]
+            if data_type != "integer" or pd.api.types.is_integer_dtype(values):
+                continue
+            numbers = pd.to_numeric(values, errors="coerce")
+            if ((numbers % 1 == 0) | values.isna()).all():
+                converted[column] = numbers.astype("Int64")
+        return data_frame.assign(**converted) if converted else data_frame
+
+    @staticmethod
+    def __copy_rows(cursor, schema, table, data_frame, columns, chunk_rows=50000):
+        """
+        Envia as linhas com COPY ... FROM STDIN em formato CSV.
+
+        O DataFrame é escrito direto em um buffer de texto, reaproveitado a
+        cada bloco de chunk_rows linhas, sem criar objetos Python por linha.
+        Nulos são enviados como \\N.
+
+        Returns:
+            - int: Quantidade de linhas inseridas.
+        """
+        columns_str = ", ".join(columns)
+        query = (f"COPY {schema}.{table} ({columns_str}) FROM STDIN "
+                 f"WITH (FORMAT csv, NULL '\\N')")
+
+        data_frame = data_frame[columns]
+        buffer = io.StringIO()
+        for start in range(0, len(data_frame), chunk_rows):
+            buffer.seek(0)
+            buffer.truncate()
+            data_frame.iloc[start:start + chunk_rows].to_csv(
+                buffer, header=False, index=False, na_rep="\\N",
+                date_format="%Y-%m-%d %H:%M:%S")
+            buffer.seek(0)
+            cursor.copy_expert(query, buffer)
+
+        return len(data_frame)
+
+    @staticmethod
+    def __values_rows(cursor, schema, table, data_frame, columns):
+        """
+        Insere as linhas com INSERT ... VALUES via execute_values.
+
+        Returns:
+            - int: Quantidade de linhas inseridas.
+        """
+        values = data_frame[columns].astype(object)
+        values = values.where(values.notna(), None)
+
+        # Gera a query dinâmica para inserção
+        columns_str = ", ".join(columns)
+        query = f"INSERT INTO {schema}.{table} ({columns_str}) VALUES %s"
+
+        # Insere os valores
+        execute_values(cursor, query, list(values.itertuples(index=False, name=None)))
+        return len(values)
+
+    @staticmethod
+    def __to_python(value):
+        """
+        Converte escalares do pandas/NumPy para tipos que o psycopg2 aceita.
+        """
+        import pandas as pd
+
+        if pd.isna(value):
+            return None
+        return value.item() if hasattr(value, "item") else value
+
+    @staticmethod
+    def __normalize(data_frame, data_types):
+        """
+        Normaliza os valores para que linhas vindas do Excel e do banco
+        possam ser comparadas (datas como AAAA-MM-DD, números arredondados,
+        textos sem espaços nas pontas).
+        """
+        import pandas as pd
+
+        normalized = {}
+        for column, data_type in data_types.items():
+            values = data_frame[column]
+            if data_type == "integer":
+                # Valores não inteiros (2023.5) viram nulos em vez de falhar
+                numbers = pd.to_numeric(values, errors="coerce")
+                normalized[column] = numbers.where(numbers % 1 == 0).astype("Int64")
+            elif data_type == "float":
+                # Colunas compactas passam por float32, para que o valor lido
+                # e o double precision do banco se normalizem iguais; as
+                # demais (toneladas, áreas) são arredondadas em float64, sem
+                # perder precisão em totais grandes
+                numbers = pd.to_numeric(values, errors="coerce").astype("float64")
+                if column.lower() in _FLOAT32_COLUMNS:
+                    numbers = numbers.astype("float32")
+                normalized[column] = numbers.round(4)
+            elif data_type == "date":
+                normalized[column] = pd.to_datetime(values, errors="coerce").dt.strftime("%Y-%m-%d")
+            else:
+                normalized[column] = values.astype("string").str.strip()
+        return pd.DataFrame(normalized, index=data_frame.index)
+
+    @staticmethod
+    def __key_fingerprints(normalized, key_columns):
+        """
+        Calcula, por chave, a quantidade de linhas e a soma dos hashes das
+        linhas. A soma não depende da ordem, então duas chaves com as mesmas
+        linhas têm a mesma impressão digital.
+        """
+        import pandas as pd
+
+        row_hash = pd.util.hash_pandas_object(normalized, index=False)
+        fingerprints = normalized[key_columns].assign(hash=row_hash.values)
+        return fingerprints.groupby(key_columns, dropna=False)["hash"].agg(
+            hash="sum", count="size")
@@ -0,0 +1,300 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+
+class BdAgroExporter:
+    """
+    Base class of the BD_AGRO exporters. Data is written incrementally with
+    write(), one chunk (usually one client) at a time, so the whole document
+    is never buffered in memory.
+
+    Usage:
+        with get_exporter('merge_bd_agro.parquet') as exporter:
+            for bd_agro in clients_data:
+                exporter.write(bd_agro)
+
+    Parameters:
+    - output_file (str): Path to the output file.
+    """
+    def __init__(self, output_file: str) -> None:
+        """
+        Initialize the exporter.
+
+        Parameters:
+        - output_file (str): Path to the output file.
+        """
+        self.output_file = output_file
+        self.rows = 0
+
+    def write(self, data: pd.DataFrame) -> None:
+        """
+        Append a chunk of data to the output file.
+
+        Parameters:
+        - data (pd.DataFrame): Data to be written.
+        """
+        raise NotImplementedError
+
+    def write_groups(self, data: pd.DataFrame, group_column: str = 'client_id') -> None:
+        """
+        Write a frame as one chunk per contiguous run of group_column values
+        (one chunk per client for the merged BD_AGRO data).
+
+        Parameters:
+        - data (pd.DataFrame): Data to be written.
+        - group_column (str, optional): Column that delimits the chunks.
+          Defaults to 'client_id'.
+        """
+        for start, stop in _group_bounds(data, group_column):
+            self.write(data.iloc[start:stop])
+
+    def close(self) -> None:
+        """
+        Finish the output file.
+        """
+
+    def __enter__(self) -> 'BdAgroExporter':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+class JsonLinesExporter(BdAgroExporter):
+    """
+    Export to JSON Lines, one record per line.
+    """
+    def __init__(self, output_file: str) -> None:
+        super().__init__(output_file)
+        self.file = open(output_file, 'w', encoding='utf-8')
+
+    def write(self, data: pd.DataFrame) -> None:
+        if data.empty:
+            return
+        # Dates as epoch milliseconds, the format of the original export
+        lines = data.to_json(orient='records', lines=True, date_format='epoch')
+        self.file.write(lines if lines.endswith('\n') else lines + '\n')
+        self.rows += len(data)
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class JsonArrayExporter(BdAgroExporter):
+    """
+    Export to an indented JSON array of records, written chunk by chunk.
+    """
+    def __init__(self, output_file: str, indent: int = 4) -> None:
+        super().__init__(output_file)
+        self.indent = indent
+        self.file = open(output_file, 'w', encoding='utf-8')
+        self.file.write('[')
+
+    def write(self, data: pd.DataFrame) -> None:
+        if data.empty:
+            return
+        # Strip the brackets of the chunk's array and join it to the document
+        records = data.to_json(
+            orient='records', indent=self.indent, date_format='epoch').strip()[1:-1]
+        self.file.write((',' if self.rows else '') + records.rstrip())
+        self.rows += len(data)
+
+    def close(self) -> None:
+        self.file.write('\n]' if self.rows else ']')
+        self.file.close()
+
+
+class ArrowExporter(BdAgroExporter):
+    """
+    Base class of the exporters backed by Arrow tables. The schema is fixed
+    by the first chunk; later chunks are cast to it.
+    """
+    def __init__(self, output_file: str) -> None:
+        super().__init__(output_file)
+        self.writer = None
+
+    def write(self, data: pd.DataFrame) -> None:
+        if data.empty:
+            return
+        self.write_table(
+            _to_arrow_table(data, self.writer.schema if self.writer else None))
+
+    def write_groups(self, data: pd.DataFrame, group_column: str = 'client_id') -> None:
+        # Convert once so every chunk shares the same Arrow schema
+        table = _to_arrow_table(data)
+        for start, stop in _group_bounds(data, group_column):
+            self.write_table(table.slice(start, stop - start))
+
+    def write_table(self, table) -> None:
+        """
+        Append an Arrow table to the output file.
+
+        Parameters:
+        - table (pyarrow.Table): Data to be written.
+        """
+        if self.writer is None:
+            self.writer = self._open_writer(table.schema)
+        self._write(table)
+        self.rows += table.num_rows
+
+    def _open_writer(self, schema):
+        raise NotImplementedError
+
+    def _write(self, table) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+
+
+class ParquetExporter(ArrowExporter):
+    """
+    Export to a compressed Parquet file with one row group per chunk, so
+    each client becomes its own row group and readers can skip clients by
+    the row group statistics of client_id.
+
+    Parameters:
+    - output_file (str): Path to the output file.
+    - compression (str, optional): Parquet codec. Defaults to 'zstd'.
+    """
+    def __init__(self, output_file: str, compression: str = 'zstd') -> None:
+        super().__init__(output_file)
+        self.compression = compression
+
+    def _open_writer(self, schema):
+        import pyarrow.parquet as pq
+
+        return pq.ParquetWriter(self.output_file, schema, compression=self.compression)
+
+    def _write(self, table) -> None:
+        self.writer.write_table(table, row_group_size=max(table.num_rows, 1))
+
+
+class FeatherExporter(ArrowExporter):
+    """
+    Export to a Feather (Arrow IPC) file, one record batch per chunk.
+
+    Parameters:
+    - output_file (str): Path to the output file.
+    - compression (str, optional): IPC buffer codec. Defaults to 'lz4'.
+    """
+    def __init__(self, output_file: str, compression: str = 'lz4') -> None:
+        super().__init__(output_file)
+        self.compression = compression
+
+    def _open_writer(self, schema):
+        import pyarrow as pa
+
+        return pa.ipc.new_file(
+            self.output_file, schema,
+            options=pa.ipc.IpcWriteOptions(compression=self.compression))
+
+    def _write(self, table) -> None:
+        self.writer.write_table(table)
+
+
+EXPORTERS = {
+    'jsonl': JsonLinesExporter,
+    'json': JsonArrayExporter,
+    'parquet': ParquetExporter,
+    'feather': FeatherExporter,
+}
+
+EXTENSIONS = {
+    '.jsonl': 'jsonl',
+    '.json': 'json',
+    '.parquet': 'parquet',
+    '.feather': 'feather',
+    '.arrow': 'feather',
+}
+
+
+def get_exporter(output_file: str, export_format: str | None = None) -> BdAgroExporter:
+    """
+    Create the exporter of a format.
+
+    Parameters:
+    - output_file (str): Path to the output file.
+    - export_format (str, optional): 'jsonl', 'json', 'parquet' or
+      'feather'. Defaults to the format matching the file extension.
+
+    Returns:
+    - BdAgroExporter: Exporter ready to receive data.
+    """
+    if export_format is None:
+        extension = os.path.splitext(output_file)[1].lower()
+        if extension not in EXTENSIONS:
+            raise ValueError(f'Formato de exportação desconhecido: {output_file}')
+        export_format = EXTENSIONS[extension]
+
+    if export_format not in EXPORTERS:
+        raise ValueError(f'Formato de exportação desconhecido: {export_format}')
+
+    return EXPORTERS[export_format](output_file)
+
+
+def read_export(output_file: str, export_format: str | None = None) -> pd.DataFrame:
+    """
+    Read back a file written by one of the exporters.
+
+    Parameters:
+    - output_file (str): Path to the exported file.
+    - export_format (str, optional): Format of the file. Defaults to the
+      format matching the file extension.
+
+    Returns:
+    - pd.DataFrame: Exported data.
+    """
+    export_format = export_format or EXTENSIONS.get(
+        os.path.splitext(output_file)[1].lower())
+
+    if export_format == 'jsonl':
+        return pd.read_json(output_file, orient='records', lines=True)
+    if export_format == 'json':
+        return pd.read_json(output_file, orient='records')
+    if export_format == 'parquet':
+        return pd.read_parquet(output_file)
+    if export_format == 'feather':
+        return pd.read_feather(output_file)
+    raise ValueError(f'Formato de exportação desconhecido: {export_format}')
+
+
+def _group_bounds(data: pd.DataFrame, group_column: str) -> list[tuple[int, int]]:
+    """
+    Start and stop positions of each contiguous run of group_column values.
+    Without the column, the whole frame is a single run.
+    """
+    if data.empty:
+        return []
+    if group_column not in data.columns:
+        return [(0, len(data))]
+
+    values = data[group_column]
+    # Nullable columns (Int32 client_id) compare to NA after the shift
+    starts = np.flatnonzero(
+        values.ne(values.shift()).fillna(True).to_numpy(dtype=bool)).tolist()
+    return list(zip(starts, starts[1:] + [len(data)]))
+
+
+def _to_arrow_table(data: pd.DataFrame, schema=None):
+    """
+    Convert a chunk to an Arrow table. Object columns that Arrow cannot
+    represent (mixed numbers and text, common in client workbooks) are
+    converted to strings. When a schema is given (chunks after the first
+    one), the chunk is cast to it.
+    """
+    import pyarrow as pa
+
+    try:
+        table = pa.Table.from_pandas(data, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        object_columns = data.select_dtypes(include='object').columns
+        data = data.astype({column: 'string' for column in object_columns})
+        table = pa.Table.from_pandas(data, preserve_index=False)
+
+    if schema is not None:
+        table = table.select(schema.names).cast(schema)
+    return table
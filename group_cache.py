@@ -0,0 +1,217 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from db_connection import _config_key
+from instrumentation import stage
+
+
+class GroupMappingCache:
+    """
+    Cache em memória do mapeamento client_id -> nome do grupo.
+
+    A tabela inteira é carregada com uma única consulta. Depois que o TTL
+    expira, uma consulta barata (probe_query, por padrão a contagem e um
+    md5 dos pares client_id/grupo calculados no banco, que muda quando um
+    cliente troca de grupo ou um grupo é renomeado) decide se é preciso
+    recarregar: se o resultado não mudou, o mapeamento atual continua
+    valendo por mais um TTL. Com probe_query=False o mapeamento é sempre
+    recarregado ao fim do TTL. Opcionalmente o mapeamento é salvo em disco
+    para ser reaproveitado entre execuções.
+
+    O mapeamento é um dict; pandas só é importado por enrich, para que
+    recarregar os grupos não carregue pandas.
+
+    As consultas usam uma conexão própria do pool (own_connection), fora
+    de uma transação aberta no db_manager, para que um erro aqui não
+    desfaça a carga dos clientes.
+
+    Parameters:
+    - db_manager (DatabaseManager): Gerenciador de banco de dados.
+    - ttl (float): Segundos até o mapeamento ser revalidado. Padrão 3600.
+    - persist_file (str, optional): Arquivo JSON onde o mapeamento é salvo.
+    - probe_query (str | bool, optional): Consulta usada para detectar
+      mudanças. False desliga a verificação.
+    """
+    MAPPING_QUERY = """
+    SELECT c.id AS client_id, g.nome AS grupo_nome
+    FROM clientes c
+    INNER JOIN cliente_grupo g ON c.grupo_id = g.id
+    """
+    PROBE_QUERY = """
+    SELECT count(*), md5(string_agg(c.id || ':' || coalesce(g.nome, ''), ',' ORDER BY c.id))
+    FROM clientes c
+    INNER JOIN cliente_grupo g ON c.grupo_id = g.id
+    """
+
+    def __init__(self, db_manager, ttl=3600, persist_file=None, probe_query=None):
+        """
+        Inicializa a classe GroupMappingCache.
+
+        Parameters:
+        - db_manager (DatabaseManager): Gerenciador de banco de dados.
+        - ttl (float): Segundos até o mapeamento ser revalidado. Padrão 3600.
+        - persist_file (str, optional): Arquivo JSON onde o mapeamento é salvo.
+        - probe_query (str | bool, optional): Consulta usada para detectar
+          mudanças. False desliga a verificação.
+        """
+        self.db_manager = db_manager
+        self.ttl = ttl
+        self.persist_file = persist_file
+        self.probe_query = self.PROBE_QUERY if probe_query is None else probe_query
+
+        self.mapping = None
+        self.probe = None
+        self.loaded_at = 0.0
+        self._lock = threading.Lock()
+
+        self.__load_from_disk()
+
+    def get_mapping(self):
+        """
+        Retorna o mapeamento, revalidando-o se o TTL expirou.
+
+        Returns:
+        - dict: Nome do grupo por client_id.
+        """
+        with self._lock:
+            if self.mapping is None:
+                self.__reload()
+            elif time.time() - self.loaded_at > self.ttl:
+                probe = self.__run_probe()
+                if probe is None or probe != self.probe:
+                    self.__reload(probe)
+                else:
+                    self.loaded_at = time.time()
+                    self.__save_to_disk()
+            return self.mapping
+
+    def enrich(self, data_frame, column="client_id", default="Sem Grupo"):
+        """
+        Adiciona a coluna 'grupo' ao DataFrame com um map vetorizado contra
+        o mapeamento em cache.
+
+        Parameters:
+        - data_frame (pd.DataFrame): Dados com a coluna de client_id.
+        - column (str): Coluna com o ID do cliente. Padrão "client_id".
+        - default (str): Grupo dos clientes sem mapeamento. Padrão "Sem Grupo".
+
+        Returns:
+        - pd.DataFrame: Dados com a coluna 'grupo'.
+        """
+        import pandas as pd
+
+        with stage("enrichment", rows=len(data_frame)):
+            client_ids = pd.to_numeric(data_frame[column], errors="coerce").astype("Int64")
+            data_frame["grupo"] = client_ids.map(self.get_mapping()).fillna(default)
+        return data_frame
+
+    def invalidate(self):
+        """
+        Descarta o mapeamento; a próxima consulta recarrega a tabela.
+        """
+        with self._lock:
+            self.mapping = None
+            self.probe = None
+            if self.persist_file and os.path.exists(self.persist_file):
+                os.remove(self.persist_file)
+
+    def __reload(self, probe=None):
+        """
+        Carrega a tabela inteira de client_id -> grupo.
+        """
+        with self.db_manager.own_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(self.MAPPING_QUERY)
+                rows = cursor.fetchall()
+
+        self.mapping = {int(row[0]): row[1] for row in rows}
+        self.probe = probe if probe is not None else self.__run_probe()
+        self.loaded_at = time.time()
+        self.__save_to_disk()
+
+    def __run_probe(self):
+        """
+        Executa a consulta de mudança. Retorna None se ela estiver
+        desligada ou falhar, o que força a recarga.
+        """
+        if not self.probe_query:
+            return None
+
+        try:
+            with self.db_manager.own_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(self.probe_query)
+                    return [str(value) for value in cursor.fetchone()]
+        except Exception as e:
+            print(f"Erro ao verificar mudanças nos grupos dos clientes: {e}")
+            return None
+
+    def __load_from_disk(self):
+        """
+        Carrega o mapeamento salvo por uma execução anterior, se houver.
+        """
+        if not self.persist_file or not os.path.exists(self.persist_file):
+            return
+
+        try:
+            with open(self.persist_file, encoding="utf-8") as file:
+                stored = json.load(file)
+        except (OSError, ValueError) as e:
+            print(f"Cache de grupos inválido, ignorando: {e}")
+            return
+
+        self.mapping = {
+            int(client_id): group for client_id, group in stored["mapping"].items()}
+        self.probe = stored["probe"]
+        self.loaded_at = stored["loaded_at"]
+
+    def __save_to_disk(self):
+        """
+        Salva o mapeamento em disco, se persist_file foi informado.
+        """
+        if not self.persist_file:
+            return
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.persist_file)), exist_ok=True)
+        tmp_file = f"{self.persist_file}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as file:
+            json.dump({
+                "loaded_at": self.loaded_at,
+                "probe": self.probe,
+                "mapping": {
+                    str(client_id): group for client_id, group in self.mapping.items()},
+            }, file)
+        os.replace(tmp_file, self.persist_file)
+
+
+_caches = OrderedDict()
+_caches_lock = threading.Lock()
+MAX_CACHES = 8
+
+
+def get_group_cache(db_manager, ttl=3600, persist_file=None):
+    """
+    Retorna o cache de grupos do banco do db_manager, criando-o na primeira
+    chamada. São mantidos até MAX_CACHES bancos; o usado há mais tempo é
+    descartado (LRU).
+
+    Parameters:
+    - db_manager (DatabaseManager): Gerenciador de banco de dados.
+    - ttl (float): Segundos até o mapeamento ser revalidado. Padrão 3600.
+    - persist_file (str, optional): Arquivo JSON onde o mapeamento é salvo.
+
+    Returns:
+    - GroupMappingCache: Cache de grupos.
+    """
+    key = _config_key(db_manager.config)
+    with _caches_lock:
+        if key in _caches:
+            _caches.move_to_end(key)
+        else:
+            _caches[key] = GroupMappingCache(db_manager, ttl, persist_file)
+            while len(_caches) > MAX_CACHES:
+                _caches.popitem(last=False)
+        return _caches[key]
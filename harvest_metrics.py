@@ -0,0 +1,229 @@
+from collections.abc import Callable
+
+import numpy as np
+import pandas as pd
+
+# Registered derived metrics: name -> (required columns, function)
+METRICS: dict[str, tuple[tuple[str, ...], Callable]] = {}
+
+# Age-at-cut buckets, in months
+AGE_BINS = [0, 12, 14, 16, 18, np.inf]
+AGE_LABELS = ['<12', '12-14', '14-16', '16-18', '>=18']
+
+# Rollup levels materialized as tables: suffix -> groupby columns
+ROLLUP_LEVELS = {
+    'cliente_safra': ('client_id', 'safra'),
+    'fazenda_safra': ('client_id', 'fazenda', 'safra'),
+    'talhao_safra': ('client_id', 'fazenda', 'talhao', 'safra'),
+}
+
+# Columns summed by the rollups
+ROLLUP_SUMS = (
+    'area_bd', 'a_colhida', 'a_est_moagem', 'tc_est', 'tc_rest', 'tc_real',
+    'tc_est_colheita')
+
+# Area-weighted averages of the rollups: column -> weight column
+ROLLUP_WEIGHTED = {
+    'tah': 'area_bd', 'tph': 'area_bd', 'atr': 'tc_real', 'atr_est': 'tc_est',
+    'idade_corte': 'a_colhida',
+}
+
+
+def register_metric(name: str, requires: tuple[str, ...]) -> Callable:
+    """
+    Register a derived metric. The function receives the DataFrame and
+    returns the metric as an array or Series aligned with it; it must be
+    vectorized (no per-row Python).
+
+    Usage:
+        @register_metric('tch_desvio', requires=('tch_real', 'tch_est'))
+        def tch_desvio(data):
+            return data['tch_real'] - data['tch_est']
+
+    Parameters:
+    - name (str): Name of the derived column.
+    - requires (tuple[str, ...]): Columns the metric reads.
+    """
+    def decorator(function: Callable) -> Callable:
+        METRICS[name] = (tuple(requires), function)
+        return function
+    return decorator
+
+
+def compute_metrics(data: pd.DataFrame, metrics: list[str] | None = None) -> pd.DataFrame:
+    """
+    Add the derived metrics to a DataFrame with lowercase columns, all of
+    them in a single assign.
+
+    Parameters:
+    - data (pd.DataFrame): BD_AGRO data.
+    - metrics (list[str], optional): Metrics to compute. Defaults to every
+      registered metric whose required columns are present.
+
+    Returns:
+    - pd.DataFrame: Copy of the data with the metric columns.
+    """
+    if metrics is None:
+        metrics = [
+            name for name, (requires, _) in METRICS.items()
+            if all(column in data.columns for column in requires)]
+
+    values = {}
+    for name in metrics:
+        if name not in METRICS:
+            raise ValueError(f'Unknown metric: {name}')
+        requires, function = METRICS[name]
+        missing = [column for column in requires if column not in data.columns]
+        if missing:
+            raise ValueError(f'Metric {name} requires the columns {missing}')
+        values[name] = function(data)
+
+    return data.assign(**values)
+
+
+def rollup(data: pd.DataFrame, by: tuple[str, ...]) -> pd.DataFrame:
+    """
+    Aggregate the data by the given columns in a single groupby: sums of
+    areas and tonnages, weighted averages (ROLLUP_WEIGHTED) and the
+    realized and estimated TCH of the group.
+
+    Parameters:
+    - data (pd.DataFrame): BD_AGRO data with lowercase columns.
+    - by (tuple[str, ...]): Grouping columns.
+
+    Returns:
+    - pd.DataFrame: One row per group.
+    """
+    if 'tc_est_colheita' not in data.columns and {'tc_real', 'tc_est'} <= set(data.columns):
+        data = compute_metrics(data, ['tc_est_colheita'])
+
+    sums = [column for column in ROLLUP_SUMS if column in data.columns]
+    weighted = {
+        column: weight for column, weight in ROLLUP_WEIGHTED.items()
+        if column in data.columns and weight in data.columns}
+
+    # Weighted averages as sum(value * weight) / sum(weight over non-null values)
+    frame = {column: data[column] for column in by}
+    frame.update({column: data[column].astype('float64') for column in sums})
+    for column, weight in weighted.items():
+        value = data[column].astype('float64').to_numpy()
+        weights = data[weight].astype('float64').to_numpy()
+        valid = ~np.isnan(value) & ~np.isnan(weights)
+        frame[f'__{column}_product'] = np.where(valid, value * weights, 0.0)
+        frame[f'__{column}_weight'] = np.where(valid, weights, 0.0)
+    frame['linhas'] = 1
+
+    totals = pd.DataFrame(frame).groupby(
+        list(by), observed=True, dropna=False, sort=True).sum(min_count=1)
+
+    result = totals[sums + ['linhas']].copy()
+    for column in weighted:
+        weight_total = totals[f'__{column}_weight'].to_numpy()
+        result[column] = np.divide(
+            totals[f'__{column}_product'].to_numpy(), weight_total,
+            out=np.full(len(totals), np.nan), where=weight_total > 0)
+
+    if {'tc_real', 'a_colhida'} <= set(result.columns):
+        result['tch_real'] = _safe_ratio(result['tc_real'], result['a_colhida'])
+    if {'tc_est_colheita', 'a_colhida'} <= set(result.columns):
+        result['tch_est_colheita'] = _safe_ratio(
+            result['tc_est_colheita'], result['a_colhida'])
+
+    result['linhas'] = result['linhas'].astype('int64')
+    return result.reset_index()
+
+
+def materialize_rollups(
+        database,
+        data: pd.DataFrame,
+        schema: str = 'public',
+        table_prefix: str = 'bd_tomografia',
+        levels: dict[str, tuple[str, ...]] | None = None) -> dict[str, int]:
+    """
+    Compute the rollups and store each one as its own table
+    ('<table_prefix>_<level>'), replaced atomically by the staged load of
+    DataBase.create_table_and_insert.
+
+    Parameters:
+    - database (DataBase): Destination database.
+    - data (pd.DataFrame): BD_AGRO data with lowercase columns.
+    - schema (str, optional): Database schema. Defaults to 'public'.
+    - table_prefix (str, optional): Prefix of the table names. Defaults to
+      'bd_tomografia'.
+    - levels (dict, optional): Rollup levels. Defaults to ROLLUP_LEVELS.
+
+    Returns:
+    - dict[str, int]: Rows written per table.
+    """
+    data = compute_metrics(data)
+
+    written = {}
+    for level, by in (levels or ROLLUP_LEVELS).items():
+        table_name = f'{table_prefix}_{level}'
+        result = rollup(data, by)
+        database.create_table_and_insert(
+            result, table_name, schema=schema, index_columns=[by],
+            derive_metrics=False)
+        written[table_name] = len(result)
+    return written
+
+
+def _safe_ratio(numerator, denominator) -> np.ndarray:
+    """
+    numerator / denominator, NaN where the denominator is not positive.
+    """
+    numerator = np.asarray(numerator, dtype='float64')
+    denominator = np.asarray(denominator, dtype='float64')
+    return np.divide(
+        numerator, denominator, out=np.full(len(numerator), np.nan),
+        where=denominator > 0)
+
+
+@register_metric('tc_est_colheita', requires=('tc_real', 'tc_est'))
+def tc_est_colheita(data: pd.DataFrame) -> np.ndarray:
+    """
+    Estimated tonnage of the harvested plots (0 where nothing was cut).
+    """
+    return np.where(data['tc_real'].to_numpy(dtype='float64', na_value=np.nan) > 0,
+                    data['tc_est'].to_numpy(dtype='float64', na_value=np.nan), 0.0)
+
+
+@register_metric('tch_real_vs_est', requires=('tch_real', 'tch_est'))
+def tch_real_vs_est(data: pd.DataFrame) -> np.ndarray:
+    """
+    Realized TCH as a fraction of the estimated TCH.
+    """
+    return _safe_ratio(data['tch_real'], data['tch_est'])
+
+
+@register_metric('tch_desvio', requires=('tch_real', 'tch_est'))
+def tch_desvio(data: pd.DataFrame) -> pd.Series:
+    """
+    Realized minus estimated TCH.
+    """
+    return data['tch_real'].astype('float64') - data['tch_est'].astype('float64')
+
+
+@register_metric('atr_desvio', requires=('atr', 'atr_est'))
+def atr_desvio(data: pd.DataFrame) -> pd.Series:
+    """
+    Realized minus estimated ATR.
+    """
+    return data['atr'].astype('float64') - data['atr_est'].astype('float64')
+
+
+@register_metric('atr_desvio_pct', requires=('atr', 'atr_est'))
+def atr_desvio_pct(data: pd.DataFrame) -> np.ndarray:
+    """
+    ATR deviation relative to the estimate, in percent.
+    """
+    return 100 * (_safe_ratio(data['atr'], data['atr_est']) - 1)
+
+
+@register_metric('faixa_idade_corte', requires=('idade_corte',))
+def faixa_idade_corte(data: pd.DataFrame) -> pd.Categorical:
+    """
+    Age-at-cut bucket (AGE_LABELS), in months.
+    """
+    return pd.cut(
+        data['idade_corte'].astype('float64'), AGE_BINS, labels=AGE_LABELS, right=False)
@@ -0,0 +1,239 @@
+import cProfile
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+logger = logging.getLogger('bd_agro.metrics')
+
+
+class Instrumentation:
+    """
+    Per-stage metrics of the merge pipeline: wall time, rows, bytes and
+    peak memory, per stage and per client.
+
+    Each finished stage becomes a record that is kept in memory and,
+    depending on the settings, appended as a JSON line to metrics_file
+    and/or logged as JSON on the 'bd_agro.metrics' logger. Peak memory is
+    measured with tracemalloc only when trace_memory is on, since tracing
+    slows allocation-heavy code down.
+
+    Usage:
+        with stage('concat') as record:
+            merged = concat_bd_agro(frames)
+            record['rows'] = len(merged)
+
+    Parameters:
+    - metrics_file (str, optional): JSON Lines file the records are
+      appended to. Defaults to None.
+    - json_logs (bool, optional): Log each record as JSON. Defaults to
+      False.
+    - trace_memory (bool, optional): Measure the peak memory of each stage
+      with tracemalloc. Defaults to False.
+    - profile_file (str, optional): Where profile() saves the cProfile
+      statistics. Defaults to None (profiling off).
+    """
+    def __init__(
+            self,
+            metrics_file: str | None = None,
+            json_logs: bool = False,
+            trace_memory: bool = False,
+            profile_file: str | None = None) -> None:
+        """
+        Initialize the Instrumentation object.
+
+        Parameters:
+        - metrics_file (str, optional): JSON Lines file for the records.
+        - json_logs (bool, optional): Log each record as JSON.
+        - trace_memory (bool, optional): Measure peak memory per stage.
+        - profile_file (str, optional): Output of the cProfile statistics.
+        """
+        self.metrics_file = metrics_file
+        self.json_logs = json_logs
+        self.trace_memory = trace_memory
+        self.profile_file = profile_file
+        self.records: list[dict] = []
+        self._lock = threading.Lock()
+
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name: str, client_id: int | None = None, **fields) -> Iterator[dict]:
+        """
+        Measure a stage. The yielded record can be filled with rows, bytes
+        or any other field while the stage runs.
+
+        Parameters:
+        - name (str): Stage name.
+        - client_id (int, optional): Client the stage refers to.
+        - **fields: Extra fields of the record.
+
+        Yields:
+        - dict: Record of the stage.
+        """
+        record = {'stage': name, 'client_id': client_id, 'rows': None, 'bytes': None}
+        record.update(fields)
+
+        # A nested stage resets the peak, so the outer stage reports the
+        # peak reached after its last nested stage started
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield record
+        except Exception as e:
+            record['error'] = str(e)
+            raise
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            if self.trace_memory:
+                record['peak_memory_mb'] = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+            self.emit(record)
+
+    def record(
+            self,
+            name: str,
+            seconds: float,
+            client_id: int | None = None,
+            **fields) -> dict:
+        """
+        Add a stage measured elsewhere, e.g. a workbook parsed in a worker
+        process.
+
+        Parameters:
+        - name (str): Stage name.
+        - seconds (float): Wall time of the stage.
+        - client_id (int, optional): Client the stage refers to.
+        - **fields: Extra fields (rows, bytes, ...).
+
+        Returns:
+        - dict: The record.
+        """
+        record = {'stage': name, 'client_id': client_id, 'rows': None, 'bytes': None}
+        record.update(fields)
+        record['seconds'] = seconds
+        self.emit(record)
+        return record
+
+    def emit(self, record: dict) -> None:
+        """
+        Keep a finished record and write it to the configured outputs.
+        """
+        record['timestamp'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        line = json.dumps(record, default=str, ensure_ascii=False)
+
+        with self._lock:
+            self.records.append(record)
+            if self.metrics_file:
+                os.makedirs(
+                    os.path.dirname(os.path.abspath(self.metrics_file)), exist_ok=True)
+                with open(self.metrics_file, 'a', encoding='utf-8') as file:
+                    file.write(line + '\n')
+
+        if self.json_logs:
+            logger.info(line)
+
+    def summary(self) -> dict[str, dict]:
+        """
+        Totals per stage: seconds, rows, bytes, number of records and the
+        largest peak memory.
+
+        Returns:
+        - dict[str, dict]: Totals keyed by stage name.
+        """
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(record['stage'], {
+                'seconds': 0.0, 'rows': 0, 'bytes': 0, 'count': 0,
+                'peak_memory_mb': None})
+            total['seconds'] += record['seconds']
+            total['rows'] += record.get('rows') or 0
+            total['bytes'] += record.get('bytes') or 0
+            total['count'] += 1
+            if record.get('peak_memory_mb') is not None:
+                total['peak_memory_mb'] = max(
+                    total['peak_memory_mb'] or 0.0, record['peak_memory_mb'])
+        return totals
+
+    def print_summary(self) -> None:
+        """
+        Print the totals per stage, slowest first.
+        """
+        totals = sorted(self.summary().items(), key=lambda item: -item[1]['seconds'])
+        print(f'{"etapa":>12} {"tempo (s)":>10} {"linhas":>10} {"MB":>10} {"pico (MB)":>10}')
+        for name, total in totals:
+            peak = total['peak_memory_mb']
+            print(f'{name:>12} {total["seconds"]:>10.2f} {total["rows"]:>10} '
+                  f'{total["bytes"] / 1024 ** 2:>10.1f} '
+                  f'{"-" if peak is None else f"{peak:.1f}":>10}')
+
+    @contextmanager
+    def profile(self) -> Iterator[None]:
+        """
+        Run the block under cProfile when profile_file is set, saving the
+        statistics there and printing the 20 most expensive calls.
+        """
+        if not self.profile_file:
+            yield
+            return
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(self.profile_file)
+            pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
+
+
+_instrumentation = Instrumentation()
+
+
+def configure(**settings) -> Instrumentation:
+    """
+    Replace the process-wide instrumentation. Accepts the parameters of
+    Instrumentation.
+
+    Returns:
+    - Instrumentation: The new instrumentation.
+    """
+    global _instrumentation
+    _instrumentation = Instrumentation(**settings)
+    return _instrumentation
+
+
+def get_instrumentation() -> Instrumentation:
+    """
+    Get the process-wide instrumentation.
+    """
+    return _instrumentation
+
+
+def stage(name: str, client_id: int | None = None, **fields):
+    """
+    Measure a stage with the process-wide instrumentation. See
+    Instrumentation.stage.
+    """
+    return _instrumentation.stage(name, client_id, **fields)
+
+
+def record(name: str, seconds: float, client_id: int | None = None, **fields) -> dict:
+    """
+    Add a stage measured elsewhere to the process-wide instrumentation. See
+    Instrumentation.record.
+    """
+    return _instrumentation.record(name, seconds, client_id, **fields)
+
+
+def frame_bytes(data) -> int:
+    """
+    Memory used by a DataFrame, including the contents of object columns.
+    """
+    return int(data.memory_usage(deep=True, index=False).sum())
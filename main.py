@@ -1,100 +1,499 @@
-from createBdAgroMerge import CreateBdAgroMerge
-from db_connection import DatabaseManager
-import pandas as pd
-
-def add_group_to_json(db_manager, json_data, client_ids):
-    """
-    Adiciona o nome do grupo ao JSON com base nos client_ids.
-    
-    Parameters:
-    - db_manager (DatabaseManager): Gerenciador de banco de dados.
-    - json_data (pd.DataFrame): Dados do JSON como DataFrame.
-    - client_ids (list): IDs dos clientes selecionados.
-    
-    Returns:
-    - pd.DataFrame: JSON atualizado com a coluna 'grupo'.
-    """
-    conn = db_manager.connect()
-    try:
-        with conn.cursor() as cursor:
-            # Obtem o grupo_id para os client_ids selecionados
-            query_client_group = """
-            SELECT c.id AS client_id, g.nome AS grupo_nome
-            FROM clientes c
-            INNER JOIN cliente_grupo g ON c.grupo_id = g.id
-            WHERE c.id = ANY(%s)
-            """
-            cursor.execute(query_client_group, (client_ids,))
-            group_data = cursor.fetchall()
-
-            # Mapeia client_id para grupo_nome
-            group_map = {row[0]: row[1] for row in group_data}
-
-            # Adiciona a coluna 'grupo' ao JSON
-            json_data['grupo'] = json_data['client_id'].map(group_map)
-
-            # Preenche com "Sem Grupo" onde não há mapeamento
-            json_data['grupo'] = json_data['grupo'].fillna("Sem Grupo")
-            
-    except Exception as e:
-        print(f"Erro ao adicionar grupo ao JSON: {e}")
-    finally:
-        conn.close()
-    
-    return json_data
-
-if __name__ == "__main__":
-    clients_folder = "C:/TOMOGRAFIA"
-    output_file = "C:/Users/luan.faria/Desktop/cod_luan/cod/SIGMA/cod/codigo_banco_tomo/output.json"
-    
-    selected_client_ids = [111]  # IDs dos clientes que você quer selecionar
-
-    # Configuração e acesso ao banco de dados
-    db_config = {
-        "dbname": "postgis_34_sample",
-        "user": "postgres",
-        "password": "postgres",
-        "host": "localhost",
-        "port": "5432"
-    }
-
-    db_manager = DatabaseManager(db_config)
-
-    # Excluir linhas com os IDs fornecidos na tabela bd_tomografia
-    db_manager.delete_rows_by_client_ids("public", "bd_tomografia", selected_client_ids)
-
-    # Gerar o JSON e carregar os dados
-    merger = CreateBdAgroMerge(
-        output_file=output_file,
-        clients_folder=clients_folder,
-        export_json_file=True,
-        selected_client_ids=selected_client_ids
-    )
-    merged_data = merger.merge_clients_bd_agro_data()
-    print(merged_data)  
-    # Adicionar a coluna 'grupo' ao JSON
-    merged_data = add_group_to_json(db_manager, merged_data, selected_client_ids)
-    # print(db_manager)
-    #print(merged_data)
-    # print(selected_client_ids)
-
-    # Reinsere os dados no banco
-    data_types = {
-        'client_id': 'integer', 'client_name': 'string', 'CHAVE': 'string',
-        'SAFRA': 'integer', 'OBJETIVO': 'string', 'cliente': 'string',
-        'TP_PROP': 'string', 'FAZENDA': 'string', 'SETOR': 'string',
-        'SECAO': 'string', 'BLOCO': 'string', 'PIVO': 'string',
-        'DESC_FAZ': 'string', 'TALHAO': 'string', 'VARIEDADE': 'string',
-        'MATURACAO': 'string', 'AMBIENTE': 'string', 'ESTAGIO': 'string',
-        'GRUPO_DASH': 'string', 'GRUPO_NDVI': 'string',
-        'NMRO_CORTE': 'float', 'TAH': 'float', 'TPH': 'float',
-        'DESC_CANA': 'string', 'AREA_BD': 'float', 'A_EST_MOAGEM': 'float',
-        'A_COLHIDA': 'float', 'A_EST_MUDA': 'float', 'A_MUDA': 'float',
-        'TCH_EST': 'float', 'TC_EST': 'float', 'TCH_REST': 'float',
-        'TC_REST': 'float', 'TCH_REAL': 'float', 'TC_REAL': 'float',
-        'DT_CORTE': 'date', 'DT_ULT_CORTE': 'date', 'DT_PLANTIO': 'date',
-        'IDADE_CORTE': 'float', 'ATR': 'float', 'ATR_EST': 'float',
-        'IRRIGACAO': 'string', 'grupo': 'string'
-    }
-
-    db_manager.insert_data("public", "bd_tomografia", merged_data, data_types)
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import Manager
+
+# Só módulos leves no topo: pandas, openpyxl, SQLAlchemy e psycopg são
+# importados pelas funções de cada comando, para que comandos curtos
+# (excluir clientes, recarregar grupos) não paguem pela carga completa
+from bd_agro_schema import DATA_TYPES, KEEP_POLICIES, KEY_COLUMNS, lower_keys
+from client_discovery import RunManifest
+from instrumentation import configure
+from run_checkpoint import RunCheckpoint
+
+# Configuração e acesso ao banco de dados
+DB_CONFIG = {
+    "dbname": "postgis_34_sample",
+    "user": "postgres",
+    "password": "postgres",
+    "host": "localhost",
+    "port": "5432"
+}
+
+def add_group_to_json(db_manager, json_data, client_ids):
+    """
+    Adiciona o nome do grupo ao JSON com base nos client_ids.
+    
+    Parameters:
+    - db_manager (DatabaseManager): Gerenciador de banco de dados.
+    - json_data (pd.DataFrame): Dados do JSON como DataFrame.
+    - client_ids (list): IDs dos clientes selecionados.
+    
+    Returns:
+    - pd.DataFrame: JSON atualizado com a coluna 'grupo'.
+    """
+    from group_cache import get_group_cache
+
+    try:
+        # Mapeia client_id para grupo_nome com o mapeamento em cache e
+        # preenche com "Sem Grupo" onde não há mapeamento
+        json_data = get_group_cache(db_manager).enrich(json_data, default="Sem Grupo")
+    except Exception as e:
+        print(f"Erro ao adicionar grupo ao JSON: {e}")
+    
+    return json_data
+
+def parse_client_ids(values):
+    """
+    Converte a lista de IDs da linha de comando em IDs de clientes.
+    Aceita IDs ("111"), intervalos ("100-150") e listas separadas por
+    vírgula ("1,2,5-9").
+
+    Parameters:
+    - values (list[str]): Valores informados.
+
+    Returns:
+    - list[int]: IDs dos clientes, sem repetição e na ordem informada.
+    """
+    client_ids = []
+    for value in values:
+        for part in value.split(","):
+            part = part.strip()
+            if not part:
+                continue
+            if "-" in part:
+                first, last = (int(bound) for bound in part.split("-", 1))
+                if first > last:
+                    raise ValueError(f"Intervalo de clientes inválido: {part}")
+                client_ids.extend(range(first, last + 1))
+            else:
+                client_ids.append(int(part))
+    return list(dict.fromkeys(client_ids))
+
+
+def split_shards(client_ids, shards):
+    """
+    Divide os clientes em até shards partes contíguas de tamanhos parecidos.
+    """
+    shards = max(1, min(shards, len(client_ids)))
+    size, remainder = divmod(len(client_ids), shards)
+    result, start = [], 0
+    for shard in range(shards):
+        stop = start + size + (1 if shard < remainder else 0)
+        result.append(client_ids[start:stop])
+        start = stop
+    return [shard for shard in result if shard]
+
+
+def load_clients(settings, client_ids):
+    """
+    Lê os BD_AGRO dos clientes e grava no banco, no modo escolhido
+    ("merge", "streaming" ou "async").
+
+    Parameters:
+    - settings (dict): Opções da execução (ver main).
+    - client_ids (list[int]): Clientes a carregar.
+
+    Returns:
+    - CreateBdAgroMerge: Merger usado, com loaded_clients e failed_clients.
+    """
+    from bdAgroTomografia import ImproveBdAgro
+    from createBdAgroMerge import CreateBdAgroMerge
+    from db_connection import DatabaseManager
+    from group_cache import get_group_cache
+    from quarantine import QuarantineFile, QuarantineTable
+    from table_manager import TableManager
+
+    db_manager = DatabaseManager(settings["db_config"], min_size=1, max_size=4)
+    get_group_cache(db_manager, ttl=3600, persist_file=settings["group_cache_file"])
+
+    table_manager = TableManager(
+        db_manager, "public", "bd_tomografia",
+        partition_by="client_id" if settings["partitioned"] else None)
+
+    export_dir = settings["export_dir"]
+    if export_dir and settings["mode"] != "streaming":
+        batch_name = (str(client_ids[0]) if len(client_ids) == 1
+                      else f"{client_ids[0]}-{client_ids[-1]}")
+        output_file = os.path.join(export_dir, f"bd_agro_{batch_name}.jsonl")
+    else:
+        output_file = None
+
+    # Gerar o JSON e carregar os dados
+    merger = CreateBdAgroMerge(
+        output_file=output_file,
+        clients_folder=settings["clients_folder"],
+        export_json_file=output_file is not None,
+        selected_client_ids=client_ids,
+        max_workers=settings["max_workers"],
+        cache_dir=settings["cache_dir"],
+        manifest_file=settings["manifest_file"],
+        resolution="mtime",
+        run_manifest_file=settings["run_manifest_file"],
+        only_changed=settings["only_changed"],
+        dedup_keep=settings["dedup_keep"]
+    )
+
+    # Tipos das colunas da tabela bd_tomografia
+    data_types = DATA_TYPES
+    incremental_sync = settings["incremental_sync"]
+    partitioned = settings["partitioned"]
+
+    # Linhas rejeitadas na validação vão para a quarentena, não para o banco
+    if settings["quarantine_table"]:
+        quarantine = QuarantineTable(db_manager, "public", settings["quarantine_table"])
+    else:
+        quarantine = QuarantineFile(settings["quarantine_file"])
+
+    if settings["mode"] == "async":
+        from async_db_connection import load_clients_async, run_async
+
+        # Tipagem, validação e quarentena como no modo merge; a gravação
+        # substitui os clientes (só com --full-reload, ver main)
+        run_async(load_clients_async(
+            merger, settings["db_config"], lower_keys(data_types), max_size=4,
+            quarantine=quarantine))
+    elif settings["mode"] == "streaming":
+        from streaming_pipeline import StreamingBdAgroPipeline
+
+        StreamingBdAgroPipeline(
+            merger=merger,
+            db_manager=db_manager,
+            data_types=data_types,
+            incremental_sync=incremental_sync,
+            table_manager=table_manager if partitioned else None,
+            quarantine=quarantine
+        ).run()
+    else:
+        merged_data = merger.merge_clients_bd_agro_data()
+
+        if merged_data.empty:
+            print("Nenhum cliente para atualizar.")
+            return merger
+
+        # Tipagem e validação na mesma passada; colunas em minúsculas
+        improver = ImproveBdAgro(merged_data, quarantine=quarantine)
+        merged_data = improver.bd_data()
+        data_types = lower_keys(DATA_TYPES)
+        key_columns = [column.lower() for column in KEY_COLUMNS]
+
+        # Exclusão, grupos e inserção na mesma transação: a tabela nunca fica
+        # sem os dados dos clientes para quem está lendo
+        loaded_ids = [int(client["client_id"]) for client in merger.loaded_clients]
+        with db_manager.transaction():
+            # Excluir linhas com os IDs fornecidos na tabela bd_tomografia
+            # (com a tabela particionada, esvazia as partições dos clientes)
+            if not incremental_sync and partitioned:
+                table_manager.truncate_clients(loaded_ids)
+            elif not incremental_sync:
+                db_manager.delete_rows_by_client_ids("public", "bd_tomografia", loaded_ids)
+            elif partitioned:
+                # Sem as partições, as linhas novas iriam para a default
+                table_manager.ensure_partitions(loaded_ids)
+
+            # Adicionar a coluna 'grupo' ao JSON
+            merged_data = add_group_to_json(db_manager, merged_data, loaded_ids)
+
+            # Reinsere os dados no banco
+            if incremental_sync:
+                # As chaves rejeitadas mantêm a cópia que já está no banco
+                db_manager.sync_data(
+                    "public", "bd_tomografia", merged_data, data_types, key_columns,
+                    client_ids=loaded_ids,
+                    protected_keys=improver.rejected if len(improver.rejected) else None)
+            else:
+                db_manager.insert_data("public", "bd_tomografia", merged_data, data_types)
+
+    return merger
+
+
+def run_shard(settings, client_ids, lock=None):
+    """
+    Carrega um shard de clientes em lotes de settings["batch_size"],
+    registrando no checkpoint cada lote concluído ou com erro. Roda no
+    processo principal ou em um processo do pool.
+
+    Parameters:
+    - settings (dict): Opções da execução (ver main).
+    - client_ids (list[int]): Clientes do shard.
+    - lock (optional): Lock compartilhado do checkpoint.
+
+    Returns:
+    - list[dict]: Arquivos BD_AGRO dos clientes carregados, para o
+      manifesto da execução.
+    """
+    configure(metrics_file=settings["metrics_file"])
+    checkpoint = RunCheckpoint(settings["checkpoint_file"], lock)
+
+    loaded_clients = []
+    batch_size = settings["batch_size"]
+    for start in range(0, len(client_ids), batch_size):
+        batch = client_ids[start:start + batch_size]
+        try:
+            merger = load_clients(settings, batch)
+        except Exception as e:
+            print(f"Erro ao carregar os clientes {batch}: {e}")
+            for client_id in batch:
+                checkpoint.mark_failed(client_id, e)
+            continue
+
+        loaded_ids = {int(client["client_id"]) for client in merger.loaded_clients}
+        for client_id in batch:
+            if client_id in merger.failed_clients:
+                checkpoint.mark_failed(client_id, merger.failed_clients[client_id])
+            else:
+                # Clientes sem BD_AGRO ou sem alteração também são concluídos
+                checkpoint.mark_done(client_id, client_id in loaded_ids)
+        loaded_clients.extend(merger.loaded_clients)
+
+    return loaded_clients
+
+
+def delete_clients(settings, client_ids):
+    """
+    Exclui os clientes da tabela bd_tomografia (TRUNCATE das partições,
+    com a tabela particionada) e os retira do manifesto da execução, para
+    que a próxima carga os leia de novo. Não carrega pandas.
+
+    Parameters:
+    - settings (dict): Opções da execução (ver main).
+    - client_ids (list[int]): Clientes a excluir.
+    """
+    from db_connection import DatabaseManager
+    from table_manager import TableManager
+
+    db_manager = DatabaseManager(settings["db_config"])
+    table_manager = TableManager(
+        db_manager, "public", "bd_tomografia", partition_by="client_id")
+    partitioned = settings["partitioned"] and table_manager.is_partitioned()
+    with db_manager.transaction():
+        if partitioned:
+            table_manager.truncate_clients(client_ids)
+        else:
+            db_manager.delete_rows_by_client_ids("public", "bd_tomografia", client_ids)
+
+    RunManifest(settings["run_manifest_file"]).forget(client_ids)
+
+
+def refresh_groups(settings):
+    """
+    Descarta o mapeamento client_id -> grupo em cache e o recarrega do
+    banco, sem ler nenhum BD_AGRO.
+
+    Parameters:
+    - settings (dict): Opções da execução (ver main).
+    """
+    from db_connection import DatabaseManager
+    from group_cache import get_group_cache
+
+    cache = get_group_cache(
+        DatabaseManager(settings["db_config"]), persist_file=settings["group_cache_file"])
+    cache.invalidate()
+    print(f"Mapeamento de grupos recarregado: {len(cache.get_mapping())} clientes.")
+
+
+def main(argv=None):
+    """
+    Ponto de entrada da linha de comando. Carrega os clientes informados
+    (ou todos os encontrados na pasta), divididos em shards que rodam em
+    processos separados, com checkpoint para retomar uma execução
+    interrompida a partir dos clientes não concluídos.
+
+    Exemplos:
+        python main.py --clients 111
+        python main.py --clients 100-150 160,161 --processes 4
+        python main.py --processes 4 --restart
+        python main.py --delete --clients 111
+        python main.py --refresh-groups
+        python main.py --migrate-partitions
+    """
+    parser = argparse.ArgumentParser(
+        description="Carrega os BD_AGRO dos clientes na tabela bd_tomografia")
+    parser.add_argument(
+        "--clients", nargs="*", default=[],
+        help="IDs, intervalos (100-150) ou listas (1,2,5-9). Padrão: todos os clientes")
+    parser.add_argument("--clients-folder", default="C:/TOMOGRAFIA")
+    parser.add_argument(
+        "--export-dir", help="Exporta um JSON Lines por lote de clientes nesta pasta")
+    parser.add_argument(
+        "--mode", choices=("merge", "streaming", "async"), default="merge",
+        help="merge: um lote por transação; streaming: um cliente por vez com memória "
+             "limitada; async: grupos e gravação sobrepostos, só com --full-reload")
+    parser.add_argument(
+        "--full-reload", action="store_true",
+        help="Exclui e reinsere os clientes em vez de aplicar só as diferenças")
+    parser.add_argument(
+        "--all-files", action="store_true",
+        help="Processa também clientes cujo BD_AGRO não mudou desde a última execução")
+    parser.add_argument(
+        "--no-partitions", action="store_true",
+        help="Não particiona bd_tomografia por client_id")
+    parser.add_argument(
+        "--workers", type=int, default=4,
+        help="Processos usados para ler os BD_AGRO de um lote (com --processes 1)")
+    parser.add_argument("--processes", type=int, default=1, help="Processos dos shards")
+    parser.add_argument("--shards", type=int, help="Número de shards. Padrão: --processes")
+    parser.add_argument(
+        "--batch-size", type=int, default=1,
+        help="Clientes carregados por transação e por registro de checkpoint")
+    parser.add_argument("--checkpoint", help="Arquivo de checkpoint")
+    parser.add_argument(
+        "--dedup", choices=(*KEEP_POLICIES, "none"), default="latest_dt_corte",
+        help="Linha mantida quando (client_id, CHAVE, SAFRA) se repete: DT_CORTE mais "
+             "recente, maior AREA_BD ou a última lida; none mantém todas")
+    parser.add_argument(
+        "--quarantine-table",
+        help="Tabela das linhas rejeitadas na validação. Padrão: quarentena.jsonl no cache")
+    parser.add_argument(
+        "--restart", action="store_true", help="Ignora o checkpoint e começa do zero")
+    parser.add_argument(
+        "--profile", action="store_true",
+        help="Mede o pico de memória por etapa e roda com cProfile")
+    command = parser.add_mutually_exclusive_group()
+    command.add_argument(
+        "--delete", action="store_true",
+        help="Só exclui os clientes de --clients da tabela, sem carregar")
+    command.add_argument(
+        "--refresh-groups", action="store_true",
+        help="Só recarrega o mapeamento client_id -> grupo do banco")
+    command.add_argument(
+        "--migrate-partitions", action="store_true",
+        help="Só recria particionada por client_id uma tabela bd_tomografia existente "
+             "sem particionamento (a antiga fica como bd_tomografia__old)")
+    args = parser.parse_args(argv)
+    if args.mode == "async" and not args.full_reload:
+        parser.error("--mode async só substitui os clientes; use-o com --full-reload")
+
+    # Variáveis do .env, carregadas na execução e não na importação
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(os.getcwd(), ".env"))
+
+    clients_folder = args.clients_folder
+    cache_dir = os.path.join(clients_folder, ".cache_bd_agro")  # Cache dos BD_AGRO já lidos
+    parallel = args.processes > 1
+
+    settings = {
+        "clients_folder": clients_folder,
+        "db_config": DB_CONFIG,
+        "mode": args.mode,
+        "export_dir": args.export_dir,
+        "incremental_sync": not args.full_reload,  # Aplica só as diferenças
+        "only_changed": not args.full_reload and not args.all_files,  # Só BD_AGRO alterados
+        "partitioned": not args.no_partitions,  # TRUNCATE por cliente
+        # Um pool de leitura dentro de cada processo de shard multiplicaria
+        # os processos; com shards em paralelo, cada um lê sequencialmente
+        "max_workers": 1 if parallel else args.workers,
+        "batch_size": max(1, args.batch_size),
+        "dedup_keep": None if args.dedup == "none" else args.dedup,
+        # O índice do cache de BD_AGRO, os manifestos e o cache de grupos são
+        # regravados por inteiro; com shards em paralelo, nenhum shard os
+        # grava (o manifesto da execução é gravado pelo processo principal)
+        "cache_dir": None if parallel else cache_dir,
+        "manifest_file": None if parallel else os.path.join(cache_dir, "clientes.json"),
+        "group_cache_file": None if parallel else os.path.join(cache_dir, "grupos.json"),
+        "run_manifest_file": os.path.join(cache_dir, "ultima_execucao.json"),
+        "metrics_file": os.path.join(cache_dir, "metricas.jsonl"),
+        "checkpoint_file": args.checkpoint or os.path.join(cache_dir, "checkpoint.jsonl"),
+        "quarantine_file": os.path.join(cache_dir, "quarentena.jsonl"),
+        "quarantine_table": args.quarantine_table,
+    }
+
+    if args.refresh_groups:
+        refresh_groups(settings)
+        return
+    if args.migrate_partitions:
+        from db_connection import DatabaseManager
+        from table_manager import TableManager
+
+        TableManager(DatabaseManager(DB_CONFIG), "public", "bd_tomografia").migrate_to_partitions()
+        return
+    if args.delete:
+        if not args.clients:
+            parser.error("--delete exige --clients")
+        delete_clients(settings, parse_client_ids(args.clients))
+        return
+
+    instrumentation = configure(
+        metrics_file=settings["metrics_file"],
+        trace_memory=args.profile,
+        profile_file=os.path.join(cache_dir, "perfil.prof") if args.profile else None)
+
+    checkpoint = RunCheckpoint(settings["checkpoint_file"])
+    if args.restart:
+        checkpoint.reset()
+
+    from createBdAgroMerge import CreateBdAgroMerge
+    from db_connection import DatabaseManager, close_pools
+    from table_manager import TableManager
+
+    if args.clients:
+        client_ids = parse_client_ids(args.clients)
+    else:
+        discovery = CreateBdAgroMerge(
+            output_file=None, clients_folder=clients_folder, export_json_file=False,
+            selected_client_ids=None,
+            manifest_file=os.path.join(cache_dir, "clientes.json")).discovery
+        client_ids = [int(client["client_id"]) for client in discovery.find_clients_bd_agro()]
+
+    done = checkpoint.done_client_ids()
+    pending = [client_id for client_id in client_ids if client_id not in done]
+    if len(pending) < len(client_ids):
+        print(f"Retomando: {len(client_ids) - len(pending)} cliente(s) já concluído(s) "
+              f"no checkpoint {settings['checkpoint_file']}.")
+    if not pending:
+        print("Nenhum cliente pendente.")
+        checkpoint.reset()
+        return
+
+    # Cria a tabela, as partições e os índices que faltarem. Uma tabela
+    # existente sem particionamento só é migrada com --migrate-partitions
+    table_manager = TableManager(
+        DatabaseManager(DB_CONFIG), "public", "bd_tomografia",
+        partition_by="client_id" if settings["partitioned"] else None)
+    table_manager.create_table()
+    if settings["partitioned"] and not table_manager.is_partitioned():
+        settings["partitioned"] = False
+    if settings["partitioned"]:
+        # As partições são criadas aqui, uma vez: o ATTACH PARTITION bloqueia
+        # a partição default e, feito em cada shard, serializaria os shards
+        table_manager.ensure_partitions(pending)
+    # Os processos dos shards abrem as próprias conexões
+    close_pools()
+
+    shards = split_shards(pending, args.shards or args.processes)
+    run_manifest = RunManifest(settings["run_manifest_file"])
+    failed_shards = []
+
+    with instrumentation.profile():
+        if not parallel:
+            for shard in shards:
+                run_manifest.record(run_shard(settings, shard))
+        else:
+            with Manager() as manager, ProcessPoolExecutor(args.processes) as executor:
+                lock = manager.Lock()
+                futures = {
+                    executor.submit(run_shard, settings, shard, lock): shard
+                    for shard in shards}
+                for future in as_completed(futures):
+                    shard = futures[future]
+                    try:
+                        run_manifest.record(future.result())
+                    except Exception as e:
+                        failed_shards.append(shard)
+                        print(f"Erro no shard {shard[0]}-{shard[-1]}: {e}")
+
+    failed = [
+        client_id for client_id, entry in checkpoint.entries().items()
+        if entry["status"] == "failed" and client_id in pending]
+    if failed or failed_shards:
+        print(f"{len(failed)} cliente(s) com erro, tentados de novo na próxima "
+              f"execução: {failed}")
+    else:
+        # Execução completa: a próxima começa do zero
+        checkpoint.reset()
+
+    instrumentation.print_summary()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import json
+import os
+import time
+
+import pandas as pd
+from psycopg2.extras import execute_values
+
+
+class QuarantineFile:
+    """
+    Quarantine of rejected BD_AGRO rows in a JSON Lines file. Each line
+    has the reason ('motivo'), the time it was rejected and the row's
+    original values, so the bad cells can be fixed in the client's
+    workbook.
+
+    Parameters:
+    - quarantine_file (str): Path to the JSON Lines file. Rows are appended.
+    """
+    def __init__(self, quarantine_file: str) -> None:
+        """
+        Initialize the QuarantineFile object.
+
+        Parameters:
+        - quarantine_file (str): Path to the JSON Lines file.
+        """
+        self.quarantine_file = quarantine_file
+
+    def write(self, rejected: pd.DataFrame) -> None:
+        """
+        Append rejected rows (with a 'motivo' column) to the file.
+
+        Parameters:
+        - rejected (pd.DataFrame): Rejected rows.
+        """
+        if rejected.empty:
+            return
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.quarantine_file)), exist_ok=True)
+        lines = rejected.assign(
+            registrado_em=time.strftime('%Y-%m-%dT%H:%M:%S')
+        ).to_json(orient='records', lines=True, date_format='iso', force_ascii=False)
+        with open(self.quarantine_file, 'a', encoding='utf-8') as file:
+            file.write(lines if lines.endswith('\n') else lines + '\n')
+
+
+class QuarantineTable:
+    """
+    Quarantine of rejected BD_AGRO rows in a database table with the
+    client, the reason and the row's original values as jsonb. The table
+    is created on first use. Writes use their own pooled connection
+    (db_manager.own_connection()), so the quarantined rows are kept even
+    when the load transaction they came from is rolled back.
+
+    Parameters:
+    - db_manager (DatabaseManager): Database manager.
+    - schema (str, optional): Database schema. Defaults to 'public'.
+    - table (str, optional): Quarantine table. Defaults to
+      'bd_tomografia_quarentena'.
+    """
+    def __init__(
+            self,
+            db_manager,
+            schema: str = 'public',
+            table: str = 'bd_tomografia_quarentena') -> None:
+        """
+        Initialize the QuarantineTable object.
+
+        Parameters:
+        - db_manager (DatabaseManager): Database manager.
+        - schema (str, optional): Database schema. Defaults to 'public'.
+        - table (str, optional): Quarantine table.
+        """
+        self.db_manager = db_manager
+        self.schema = schema
+        self.table = table
+        self._created = False
+
+    def write(self, rejected: pd.DataFrame) -> None:
+        """
+        Insert rejected rows (with a 'motivo' column) into the table.
+
+        Parameters:
+        - rejected (pd.DataFrame): Rejected rows.
+        """
+        if rejected.empty:
+            return
+
+        records = json.loads(rejected.drop(columns='motivo').to_json(
+            orient='records', date_format='iso'))
+        client_ids = pd.to_numeric(
+            rejected.get('client_id', pd.Series(index=rejected.index, dtype='float64')),
+            errors='coerce')
+        rows = [
+            (None if pd.isna(client_id) else int(client_id), reason, json.dumps(record))
+            for client_id, reason, record in zip(client_ids, rejected['motivo'], records)]
+
+        with self.db_manager.own_connection() as conn:
+            with conn.cursor() as cursor:
+                if not self._created:
+                    cursor.execute(
+                        f'CREATE TABLE IF NOT EXISTS {self.schema}.{self.table} ('
+                        f'client_id integer, motivo text, dados jsonb, '
+                        f'registrado_em timestamp DEFAULT now())')
+                execute_values(
+                    cursor,
+                    f'INSERT INTO {self.schema}.{self.table} (client_id, motivo, dados) '
+                    f'VALUES %s', rows)
+        self._created = True
+        print(f'{len(rows)} linhas em quarentena na tabela {self.table}.')
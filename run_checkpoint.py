@@ -0,0 +1,94 @@
+import json
+import os
+import time
+from contextlib import nullcontext
+
+
+class RunCheckpoint:
+    """
+    Checkpoint de uma execução em lotes: cada cliente concluído (ou com
+    erro) é acrescentado como uma linha JSON ao arquivo assim que termina,
+    para que uma execução interrompida seja retomada a partir dos clientes
+    que ainda não foram concluídos.
+
+    Vários processos podem gravar no mesmo arquivo; passe um lock
+    compartilhado (multiprocessing.Manager().Lock()) para serializar as
+    gravações.
+
+    Parameters:
+    - checkpoint_file (str): Caminho do arquivo de checkpoint (JSON Lines).
+    - lock (optional): Lock compartilhado entre os processos.
+    """
+    def __init__(self, checkpoint_file, lock=None):
+        """
+        Inicializa a classe RunCheckpoint.
+
+        Parameters:
+        - checkpoint_file (str): Caminho do arquivo de checkpoint.
+        - lock (optional): Lock compartilhado entre os processos.
+        """
+        self.checkpoint_file = checkpoint_file
+        self.lock = lock
+
+    def entries(self):
+        """
+        Última situação registrada de cada cliente.
+
+        Returns:
+        - dict: client_id -> registro ({"status": "done" | "failed", ...}).
+        """
+        if not os.path.exists(self.checkpoint_file):
+            return {}
+
+        entries = {}
+        with open(self.checkpoint_file, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Linha incompleta de uma execução interrompida
+                    continue
+                entries[int(entry["client_id"])] = entry
+        return entries
+
+    def done_client_ids(self):
+        """
+        Clientes já concluídos, que uma retomada deve pular.
+
+        Returns:
+        - set: IDs dos clientes concluídos.
+        """
+        return {
+            client_id for client_id, entry in self.entries().items()
+            if entry["status"] == "done"}
+
+    def mark_done(self, client_id, loaded=True):
+        """
+        Registra um cliente concluído. loaded=False indica que não havia o
+        que carregar (BD_AGRO ausente ou sem alteração).
+        """
+        self.__append({"client_id": int(client_id), "status": "done", "loaded": loaded})
+
+    def mark_failed(self, client_id, error):
+        """
+        Registra um cliente com erro; ele é tentado de novo na retomada.
+        """
+        self.__append({"client_id": int(client_id), "status": "failed", "error": str(error)})
+
+    def reset(self):
+        """
+        Apaga o checkpoint, para começar uma execução do zero.
+        """
+        if os.path.exists(self.checkpoint_file):
+            os.remove(self.checkpoint_file)
+
+    def __append(self, entry):
+        entry["at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+
+        with self.lock if self.lock is not None else nullcontext():
+            os.makedirs(os.path.dirname(os.path.abspath(self.checkpoint_file)), exist_ok=True)
+            with open(self.checkpoint_file, "a", encoding="utf-8") as file:
+                file.write(line)
+                file.flush()
+                os.fsync(file.fileno())
@@ -0,0 +1,151 @@
+import time
+
+import pandas as pd
+
+from bdAgroTomografia import ImproveBdAgro
+from createBdAgroMerge import CreateBdAgroMerge
+from db_connection import DatabaseManager
+from group_cache import get_group_cache
+from table_manager import TableManager
+
+
+class StreamingBdAgroPipeline:
+    """
+    Load the selected clients' BD_AGRO data into PostgreSQL one client at a
+    time: read -> type coercion -> group enrichment -> DB write.
+
+    Only one client's data is in memory at once, so peak memory depends on
+    the largest client instead of the whole estate. Throughput of each stage
+    is accumulated in stage_metrics.
+
+    Parameters:
+    - merger (CreateBdAgroMerge): Source of the clients' BD_AGRO data.
+    - db_manager (DatabaseManager): Database where the data is written.
+    - data_types (dict): Column types of the destination table.
+    - schema (str, optional): Database schema. Defaults to 'public'.
+    - table (str, optional): Destination table. Defaults to 'bd_tomografia'.
+    - incremental_sync (bool, optional): Write with sync_data instead of
+      delete-then-insert. Defaults to True.
+    - table_manager (TableManager, optional): Manager of the partitioned
+      table; when given, the client's partition is created before its rows
+      are written and delete-then-insert truncates it instead of deleting
+      its rows. Defaults to None.
+    - quarantine (QuarantineFile | QuarantineTable, optional): Destination
+      of the rows rejected by the validation. Defaults to None.
+    """
+    STAGES = ('read', 'coercion', 'enrichment', 'write')
+
+    def __init__(
+            self,
+            merger: CreateBdAgroMerge,
+            db_manager: DatabaseManager,
+            data_types: dict,
+            schema: str = 'public',
+            table: str = 'bd_tomografia',
+            incremental_sync: bool = True,
+            table_manager: TableManager | None = None,
+            quarantine=None) -> None:
+        """
+        Initialize the StreamingBdAgroPipeline object.
+
+        Parameters:
+        - merger (CreateBdAgroMerge): Source of the clients' BD_AGRO data.
+        - db_manager (DatabaseManager): Database where the data is written.
+        - data_types (dict): Column types of the destination table.
+        - schema (str, optional): Database schema. Defaults to 'public'.
+        - table (str, optional): Destination table. Defaults to
+          'bd_tomografia'.
+        - incremental_sync (bool, optional): Write with sync_data instead of
+          delete-then-insert. Defaults to True.
+        - table_manager (TableManager, optional): Manager of the partitioned
+          table. Defaults to None.
+        - quarantine (QuarantineFile | QuarantineTable, optional):
+          Destination of the rejected rows. Defaults to None.
+        """
+        self.merger = merger
+        self.db_manager = db_manager
+        self.schema = schema
+        self.table = table
+        self.incremental_sync = incremental_sync
+        self.table_manager = table_manager
+        self.quarantine = quarantine
+
+        # ImproveBdAgro lowercases the column names
+        self.data_types = {
+            column.lower(): data_type for column, data_type in data_types.items()}
+
+        self.stage_metrics = {
+            stage: {'seconds': 0.0, 'rows': 0} for stage in self.STAGES}
+
+    def run(self) -> dict:
+        """
+        Process every selected client.
+
+        Returns:
+        - dict: Seconds, rows and rows/sec of each stage.
+        """
+        self.stage_metrics = {
+            stage: {'seconds': 0.0, 'rows': 0} for stage in self.STAGES}
+
+        # Cached client -> group table, loaded with a single query
+        group_cache = get_group_cache(self.db_manager)
+
+        clients = self.merger.iter_clients_bd_agro_data()
+        while True:
+            start = time.perf_counter()
+            client_bd_agro, bd_agro = next(clients, (None, None))
+            if client_bd_agro is None:
+                break
+            self.__record('read', start, len(bd_agro))
+
+            start = time.perf_counter()
+            improver = ImproveBdAgro(bd_agro_data=bd_agro, quarantine=self.quarantine)
+            bd_agro = improver.bd_data()
+            self.__record('coercion', start, len(bd_agro))
+
+            start = time.perf_counter()
+            bd_agro = group_cache.enrich(bd_agro, 'client_id', 'Sem Grupo')
+            self.__record('enrichment', start, len(bd_agro))
+
+            start = time.perf_counter()
+            self.__write(int(client_bd_agro['client_id']), bd_agro, improver.rejected)
+            self.__record('write', start, len(bd_agro))
+
+        for stage, metrics in self.stage_metrics.items():
+            metrics['rows_per_sec'] = (
+                metrics['rows'] / metrics['seconds'] if metrics['seconds'] else 0.0)
+            print(f'{stage:>10}: {metrics["rows"]} linhas em '
+                  f'{metrics["seconds"]:.2f}s ({metrics["rows_per_sec"]:.0f} linhas/s)')
+
+        return self.stage_metrics
+
+    def __write(
+            self, client_id: int, bd_agro: pd.DataFrame, rejected: pd.DataFrame) -> None:
+        """
+        Write a client's data in its own transaction. The stored copies of
+        rejected keys are kept by the incremental sync.
+        """
+        with self.db_manager.transaction():
+            if self.incremental_sync:
+                if self.table_manager is not None:
+                    # Without its partition the client's rows go to the default
+                    self.table_manager.ensure_partitions([client_id])
+                self.db_manager.sync_data(
+                    self.schema, self.table, bd_agro, self.data_types,
+                    key_columns=('client_id', 'chave', 'safra'),
+                    client_ids=[client_id], protected_keys=rejected if len(rejected) else None)
+            else:
+                if self.table_manager is not None:
+                    self.table_manager.truncate_clients([client_id])
+                else:
+                    self.db_manager.delete_rows_by_client_ids(
+                        self.schema, self.table, [client_id])
+                self.db_manager.insert_data(
+                    self.schema, self.table, bd_agro, self.data_types)
+
+    def __record(self, stage: str, start: float, rows: int) -> None:
+        """
+        Add the elapsed time and rows of a stage.
+        """
+        self.stage_metrics[stage]['seconds'] += time.perf_counter() - start
+        self.stage_metrics[stage]['rows'] += rows
@@ -0,0 +1,292 @@
+from bd_agro_schema import DATA_TYPES, SQL_TYPES
+
+
+class TableManager:
+    """
+    Cria e mantém a tabela bd_tomografia a partir do schema compartilhado
+    (bd_agro_schema.DATA_TYPES), com particionamento e índices.
+
+    Com partition_by="client_id" a tabela é particionada por lista, com uma
+    partição por cliente; com partition_by="safra", por intervalo, com uma
+    partição por safra. Linhas sem partição própria vão para a partição
+    default. No particionamento por cliente, a carga de um cliente pode
+    esvaziar a partição dele com TRUNCATE em vez de um DELETE grande.
+
+    Os métodos usam db_manager.connection(), então participam de uma
+    transação aberta com db_manager.transaction().
+
+    Exemplo:
+        manager = TableManager(db_manager)
+        manager.create_table()
+        with db_manager.transaction():
+            manager.truncate_clients([111])
+            db_manager.insert_data("public", "bd_tomografia", dados, DATA_TYPES)
+
+    Parameters:
+    - db_manager (DatabaseManager): Gerenciador de banco de dados.
+    - schema (str): Schema do banco de dados. Padrão "public".
+    - table (str): Nome da tabela. Padrão "bd_tomografia".
+    - data_types (dict): Tipos das colunas. Padrão DATA_TYPES.
+    - partition_by (str, optional): "client_id", "safra" ou None (sem
+      particionamento). Padrão "client_id".
+    """
+    PARTITION_COLUMNS = ("client_id", "safra")
+
+    # Índices criados na tabela (e, por herança, em todas as partições)
+    INDEXES = (
+        ("client_id",),
+        ("safra",),
+        ("fazenda",),
+        ("client_id", "chave", "safra"),
+    )
+
+    def __init__(self, db_manager, schema="public", table="bd_tomografia",
+                 data_types=None, partition_by="client_id"):
+        """
+        Inicializa a classe TableManager.
+
+        Parameters:
+        - db_manager (DatabaseManager): Gerenciador de banco de dados.
+        - schema (str): Schema do banco de dados. Padrão "public".
+        - table (str): Nome da tabela. Padrão "bd_tomografia".
+        - data_types (dict): Tipos das colunas. Padrão DATA_TYPES.
+        - partition_by (str, optional): "client_id", "safra" ou None.
+          Padrão "client_id".
+        """
+        if partition_by is not None and partition_by not in self.PARTITION_COLUMNS:
+            raise ValueError(f"Particionamento desconhecido: {partition_by}")
+
+        self.db_manager = db_manager
+        self.schema = schema
+        self.table = table
+        self.data_types = data_types or DATA_TYPES
+        self.partition_by = partition_by
+
+    def create_table(self):
+        """
+        Cria a tabela (particionada, se for o caso), a partição default e os
+        índices, caso ainda não existam. Uma tabela existente não é
+        alterada; para particionar uma tabela que já existe sem
+        particionamento, use migrate_to_partitions.
+        """
+        with self.db_manager.connection() as conn:
+            with conn.cursor() as cursor:
+                exists = self.__table_exists(cursor)
+                self.__create(cursor)
+                if exists and self.partition_by is not None \
+                        and not self.__is_partitioned(cursor):
+                    print(f"A tabela {self.table} existe sem particionamento; "
+                          f"use migrate_to_partitions para particioná-la.")
+
+    def is_partitioned(self):
+        """
+        Indica se a tabela existe e é particionada.
+        """
+        with self.db_manager.connection() as conn:
+            with conn.cursor() as cursor:
+                return self.__is_partitioned(cursor)
+
+    def migrate_to_partitions(self):
+        """
+        Recria particionada uma tabela existente sem particionamento, em
+        uma única transação: a tabela atual é renomeada para
+        <tabela>__old, a nova é criada com as partições dos valores
+        existentes e os dados são copiados pelo nome das colunas. A tabela
+        antiga é mantida, para ser conferida e excluída manualmente.
+        """
+        self.__require_partitioning()
+        old_table = f"{self.table}__old"
+
+        with self.db_manager.connection() as conn:
+            with conn.cursor() as cursor:
+                if not self.__table_exists(cursor) or self.__is_partitioned(cursor):
+                    print(f"A tabela {self.table} não existe ou já é particionada.")
+                    return
+                cursor.execute(
+                    "SELECT to_regclass(%s) IS NOT NULL", (f"{self.schema}.{old_table}",))
+                if cursor.fetchone()[0]:
+                    raise RuntimeError(
+                        f"A tabela {old_table} já existe; exclua-a antes de migrar.")
+
+                cursor.execute(
+                    "SELECT column_name FROM information_schema.columns "
+                    "WHERE table_schema = %s AND table_name = %s",
+                    (self.schema, self.table))
+                old_columns = {row[0] for row in cursor.fetchall()}
+                columns = ", ".join(
+                    column for column in self.__columns() if column in old_columns)
+
+                cursor.execute(f"ALTER TABLE {self.qualified_name} RENAME TO {old_table}")
+                self.__drop_index_names(cursor)
+                self.__create(cursor)
+
+                cursor.execute(
+                    f"SELECT DISTINCT {self.partition_by} FROM {self.schema}.{old_table} "
+                    f"WHERE {self.partition_by} IS NOT NULL")
+                self.__ensure_partitions(cursor, [row[0] for row in cursor.fetchall()])
+                cursor.execute(
+                    f"INSERT INTO {self.qualified_name} ({columns}) "
+                    f"SELECT {columns} FROM {self.schema}.{old_table}")
+                print(f"Tabela {self.table} recriada com particionamento por "
+                      f"{self.partition_by} ({cursor.rowcount} linhas copiadas). "
+                      f"A tabela {old_table} pode ser excluída após conferência.")
+
+    def ensure_partitions(self, values):
+        """
+        Cria as partições que faltam para os valores (client_ids ou safras).
+        Linhas desses valores que estejam na partição default são movidas
+        para a nova partição.
+
+        Parameters:
+        - values (list): Valores da coluna de particionamento.
+        """
+        self.__require_partitioning()
+
+        with self.db_manager.connection() as conn:
+            with conn.cursor() as cursor:
+                self.__ensure_partitions(cursor, values)
+
+    def truncate_clients(self, client_ids):
+        """
+        Esvazia as partições dos clientes com TRUNCATE, em vez de um DELETE
+        linha a linha. As partições que faltam são criadas antes.
+
+        Parameters:
+        - client_ids (list): IDs dos clientes.
+        """
+        if self.partition_by != "client_id":
+            raise RuntimeError(
+                "truncate_clients exige a tabela particionada por client_id.")
+
+        client_ids = sorted({int(client_id) for client_id in client_ids})
+        partitions = ", ".join(
+            f"{self.schema}.{self.partition_name(client_id)}" for client_id in client_ids)
+
+        with self.db_manager.connection() as conn:
+            with conn.cursor() as cursor:
+                self.__ensure_partitions(cursor, client_ids)
+                cursor.execute(f"TRUNCATE {partitions}")
+        print(f"Partições de {len(client_ids)} clientes esvaziadas na tabela {self.table}.")
+
+    def partition_name(self, value):
+        """
+        Nome da partição de um client_id ou de uma safra.
+        """
+        prefix = "c" if self.partition_by == "client_id" else "s"
+        return f"{self.table}_{prefix}{int(value)}"
+
+    @property
+    def qualified_name(self):
+        """
+        Nome da tabela com o schema.
+        """
+        return f"{self.schema}.{self.table}"
+
+    def __columns(self):
+        """
+        Colunas da tabela, na ordem de data_types.
+        """
+        return [column.lower() for column in self.data_types]
+
+    def __create(self, cursor):
+        """
+        Cria a tabela, a partição default e os índices que não existem.
+        """
+        columns_ddl = ", ".join(
+            f"{column.lower()} {SQL_TYPES[data_type]}"
+            for column, data_type in self.data_types.items())
+        partition_clause = ""
+        if self.partition_by == "client_id":
+            partition_clause = " PARTITION BY LIST (client_id)"
+        elif self.partition_by == "safra":
+            partition_clause = " PARTITION BY RANGE (safra)"
+
+        exists = self.__table_exists(cursor)
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.qualified_name} "
+            f"({columns_ddl}){partition_clause}")
+        if self.partition_by is not None and not exists:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.schema}.{self.table}_default "
+                f"PARTITION OF {self.qualified_name} DEFAULT")
+        self.__create_indexes(cursor)
+
+    def __partition_bounds(self, value):
+        """
+        Cláusula FOR VALUES da partição de um valor.
+        """
+        if self.partition_by == "client_id":
+            return f"FOR VALUES IN ({int(value)})"
+        return f"FOR VALUES FROM ({int(value)}) TO ({int(value) + 1})"
+
+    def __create_indexes(self, cursor):
+        """
+        Cria os índices de INDEXES que ainda não existem.
+        """
+        for columns in self.INDEXES:
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.__index_name(columns)} "
+                f"ON {self.qualified_name} ({', '.join(columns)})")
+
+    def __drop_index_names(self, cursor):
+        """
+        Remove da tabela renomeada os índices de INDEXES, liberando os nomes
+        para a tabela nova.
+        """
+        for columns in self.INDEXES:
+            cursor.execute(
+                f"DROP INDEX IF EXISTS {self.schema}.{self.__index_name(columns)}")
+
+    def __index_name(self, columns):
+        return f"{self.table}_{'_'.join(columns)}_idx"
+
+    def __ensure_partitions(self, cursor, values):
+        """
+        Cria, com o cursor informado, as partições que faltam para os valores.
+        """
+        cursor.execute(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            JOIN pg_namespace ns ON ns.oid = parent.relnamespace
+            WHERE ns.nspname = %s AND parent.relname = %s
+            """, (self.schema, self.table))
+        existing = {row[0] for row in cursor.fetchall()}
+
+        for value in sorted({int(value) for value in values}):
+            partition = self.partition_name(value)
+            if partition in existing:
+                continue
+
+            # Criar a partição com linhas do valor na default falharia: a
+            # tabela é criada solta, recebe as linhas e só então é anexada
+            qualified_partition = f"{self.schema}.{partition}"
+            cursor.execute(
+                f"CREATE TABLE {qualified_partition} "
+                f"(LIKE {self.qualified_name} INCLUDING DEFAULTS)")
+            columns = ", ".join(self.__columns())
+            cursor.execute(
+                f"WITH moved AS (DELETE FROM {self.schema}.{self.table}_default "
+                f"WHERE {self.partition_by} = %s RETURNING {columns}) "
+                f"INSERT INTO {qualified_partition} ({columns}) SELECT {columns} FROM moved",
+                (value,))
+            cursor.execute(
+                f"ALTER TABLE {self.qualified_name} ATTACH PARTITION "
+                f"{qualified_partition} {self.__partition_bounds(value)}")
+            print(f"Partição {partition} criada.")
+
+    def __table_exists(self, cursor):
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (self.qualified_name,))
+        return cursor.fetchone()[0]
+
+    def __is_partitioned(self, cursor):
+        cursor.execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+            "WHERE partrelid = to_regclass(%s))", (self.qualified_name,))
+        return cursor.fetchone()[0]
+
+    def __require_partitioning(self):
+        if self.partition_by is None:
+            raise RuntimeError(f"A tabela {self.table} não é particionada.")